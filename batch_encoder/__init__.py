@@ -0,0 +1,21 @@
+from ._encoding_config import EncodingConfig
+from ._job import Job
+from ._job_type import JobType
+from ._plan import Plan
+from ._plan_generator import PlanGenerator
+from ._scheduler import Scheduler
+from ._seek_locator import SeekLocator
+from ._source_file import SourceFile
+from ._source_metadata import SourceMetadata
+
+__all__ = [
+    "EncodingConfig",
+    "Job",
+    "JobType",
+    "Plan",
+    "PlanGenerator",
+    "Scheduler",
+    "SeekLocator",
+    "SourceFile",
+    "SourceMetadata",
+]
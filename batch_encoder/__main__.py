@@ -1,21 +1,39 @@
+from ._build_file import BuildFile
+from ._calibration import Calibration
 from ._encode_webm import EncodeWebM
 from ._encoding_config import EncodingConfig
+from ._daemon import Daemon
+from ._executor import Executor
 from ._cli import CLI
+from ._memory_estimator import MemoryEstimator
+from ._plan import Plan
+from ._plan_writer import PlanWriter
+from ._process_runner import process_runner
+from ._resource_governor import ResourceGovernor
+from ._scheduler import Scheduler
 from ._seek_collector import SeekCollector
+from ._seek_locator import SeekLocator
+from ._source_cache import SourceCache
 from ._source_file import SourceFile
+from ._tracer import tracer
 from ._typing import Args, EncodingConfigType
 from ._utils import commandfile_arg_type
 from ._utils import configfile_arg_type
+from ._watcher import Watcher
+from ._workspace import Workspace
 from appdirs import AppDirs
 
 import argparse
+import atexit
 import configparser
 import copy
+import json
 import logging
 import os
 import shutil
 import subprocess
 import sys
+import threading
 
 
 def main():
@@ -62,6 +80,59 @@ def main():
     parser.add_argument(
         "--inputfile", nargs="?", help="Set the input files separated by two commas"
     )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Run the encode daemon with its control API on localhost",
+    )
+    parser.add_argument(
+        "--submit",
+        action="store_true",
+        help="Submit commands to the daemon instead of executing them",
+    )
+    parser.add_argument(
+        "--status", action="store_true", help="Print the job queue of the daemon"
+    )
+    parser.add_argument(
+        "--watch",
+        nargs="+",
+        metavar="DIRECTORY",
+        help="Watch directories for source files with a manifest and enqueue their jobs",
+    )
+    parser.add_argument(
+        "--priority",
+        nargs=2,
+        metavar=("KEY", "PRIORITY"),
+        help="Set the priority of a batch or job of the daemon",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Set the number of workers of the daemon"
+    )
+    parser.add_argument(
+        "--locate",
+        action="store_true",
+        help="Propose the seeks of the other source files from the seeks of the first source file",
+    )
+    parser.add_argument(
+        "--export",
+        choices=["make", "ninja"],
+        help="Write the plan as a Makefile or Ninja build file instead of executing it",
+    )
+    parser.add_argument(
+        "--job",
+        metavar="ID",
+        help="Execute a single job of the command file, used by exported build files",
+    )
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        help="Measure the fastest encoder threading settings of this host and write its host profile",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Write spans of generation stages and jobs to a Chrome trace event file",
+    )
     parser.add_argument(
         "--loglevel",
         nargs="?",
@@ -78,6 +149,11 @@ def main():
         format="%(levelname)s: %(message)s",
     )
 
+    # Trace is written on exit, including exits after errors and interrupts
+    if args.trace:
+        tracer.enable(args.trace)
+        atexit.register(tracer.write)
+
     # Env Check: Check that dependencies are installed
     if shutil.which("ffmpeg") is None:
         logging.error("FFmpeg is required")
@@ -87,26 +163,16 @@ def main():
         logging.error("FFprobe is required")
         sys.exit()
 
+    if args.locate and not SeekLocator.is_available():
+        logging.error("NumPy is required to locate seeks")
+        sys.exit()
+
     # Write default config file if it doesn't exist
     config = configparser.ConfigParser()
     dirs = AppDirs("batch_encoder", "AnimeThemes")
     config_file = os.path.join(dirs.user_config_dir, args.configfile)
     if not os.path.exists(config_file):
-        config["Encoding"] = {
-            EncodingConfig.config_allowed_filetypes: EncodingConfig.default_allowed_filetypes,
-            EncodingConfig.config_encoding_modes: EncodingConfig.default_encoding_modes,
-            EncodingConfig.config_crfs: EncodingConfig.default_crfs,
-            EncodingConfig.config_cbr_bitrates: EncodingConfig.default_cbr_bitrates,
-            EncodingConfig.config_cbr_max_bitrates: EncodingConfig.default_cbr_max_bitrates,
-            EncodingConfig.config_threads: EncodingConfig.default_threads,
-            EncodingConfig.config_limit_size_enable: EncodingConfig.default_limit_size_enable,
-            EncodingConfig.config_alternate_source_files: EncodingConfig.default_alternate_source_files,
-            EncodingConfig.config_create_preview: EncodingConfig.default_create_preview,
-            EncodingConfig.config_include_unfiltered: EncodingConfig.default_include_unfiltered,
-            EncodingConfig.config_default_video_stream: "",
-            EncodingConfig.config_default_audio_stream: "",
-        }
-        config["VideoFilters"] = EncodingConfig.default_video_filters
+        config = EncodingConfig.get_default_config()
 
         os.makedirs(os.path.dirname(config_file), exist_ok=True)
         with open(config_file, "w", encoding="utf8") as f:
@@ -115,8 +181,91 @@ def main():
     # Load config file
     config.read(config_file)
     encoding_config: EncodingConfigType = EncodingConfig.from_config(config)
+    process_runner.configure(encoding_config)
+
+    # Calibrate with the first input file as the clip, or with a synthetic clip
+    if args.calibrate:
+        Calibration(
+            clip=args.inputfile.split(",,")[0] if args.inputfile else None
+        ).run()
+        return
+
+    # Run a single job of the plan in the current directory
+    if args.job is not None:
+        job = next(
+            (job for job in Plan.read(args.file) if str(job.id) == args.job), None
+        )
+        if job is None:
+            logging.error(f"Job '{args.job}' does not exist in file '{args.file}'")
+            sys.exit(1)
+
+        job.key = str(job.id)
+        sys.exit(0 if Executor.run_job(job) else 1)
+
+    # Run the daemon or send control requests to it
+    if args.daemon:
+        os.makedirs(dirs.user_data_dir, exist_ok=True)
+        state_file = os.path.join(dirs.user_data_dir, "daemon_state.json")
+        Daemon(
+            encoding_config.daemon_port,
+            get_scheduler(encoding_config, dirs, state_file=state_file),
+            get_token_file(dirs),
+        ).serve()
+        return
+
+    # Ingest source files from drop directories, with a local scheduler or the daemon
+    if args.watch:
+        if args.submit:
+            watcher = Watcher(
+                args.watch,
+                encoding_config,
+                port=encoding_config.daemon_port,
+                token_file=get_token_file(dirs),
+            )
+            watcher.run()
+            return
+
+        os.makedirs(dirs.user_data_dir, exist_ok=True)
+        state_file = os.path.join(dirs.user_data_dir, "watch_state.json")
+        scheduler = get_scheduler(encoding_config, dirs, state_file=state_file)
+        scheduler.load()
+        threading.Thread(
+            target=scheduler.run, kwargs={"serve": True}, daemon=True
+        ).start()
+        try:
+            Watcher(args.watch, encoding_config, scheduler=scheduler).run()
+        finally:
+            scheduler.stop()
+        return
+
+    if args.status or args.priority or args.workers:
+        try:
+            if args.priority:
+                response = Daemon.request(
+                    encoding_config.daemon_port,
+                    get_token_file(dirs),
+                    "/priority",
+                    {"key": args.priority[0], "priority": args.priority[1]},
+                )
+            elif args.workers:
+                response = Daemon.request(
+                    encoding_config.daemon_port,
+                    get_token_file(dirs),
+                    "/workers",
+                    {"workers": args.workers},
+                )
+            else:
+                response = Daemon.request(
+                    encoding_config.daemon_port, get_token_file(dirs), "/status"
+                )
+        except OSError:
+            logging.error(
+                f"Daemon is not running on port '{encoding_config.daemon_port}'"
+            )
+            sys.exit()
 
-    commands = []
+        print(json.dumps(response, indent=2))
+        return
 
     # Set the mode to integer or prompt to the user
     mode = CLI.choose_mode(args)
@@ -139,80 +288,176 @@ def main():
             source_files = args.inputfile.split(",,")
 
         source_file_info = {}
+        all_output_names = set()
+        proposed_seeks = {}
+
+        # Source files are probed as their seeks are prompted, the locator needs every source file up front
+        is_locating = args.locate and len(source_files) > 1
+        if is_locating:
+            for source_file in source_files:
+                source_file_info[source_file] = get_source_file(
+                    source_file, encoding_config
+                )
 
-        for source_file in source_files:
-            source_file_info[source_file] = SourceFile.from_file(
-                source_file, encoding_config
-            )
-
-        for file, file_value in source_file_info.items():
-            try:
-                is_collector_valid = False
-                seek_collector = None
-                while not is_collector_valid:
-                    print(f"\033[92mSource File: {file}\033[0m")
-                    seek_collector = SeekCollector(file_value)
-                    is_collector_valid = seek_collector.is_valid()
-
-                for seek in seek_collector.get_seek_list():
-                    new_encoding_config = copy.copy(encoding_config)
-
-                    print(f"\033[92mOutput Name: {seek.output_name}\033[0m")
-                    new_encoding_config = CLI.video_filters(new_encoding_config)
-
-                    if args.custom:
-                        print(f"\033[92mOutput Name: {seek.output_name}\033[0m")
-                        new_encoding_config = CLI.custom_options(new_encoding_config)
-
+        # Jobs are written to file as each seek is generated
+        # Alternated source files are ranked by the index of their seek, the scheduler runs the first seeks of every source first
+        with PlanWriter(args.file) as plan_writer:
+            for file in source_files:
+                try:
+                    file_value = source_file_info.pop(file, None) or get_source_file(
+                        file, encoding_config
+                    )
+                    is_collector_valid = False
+                    seek_collector = None
+                    while not is_collector_valid:
+                        print(f"\033[92mSource File: {file}\033[0m")
+                        with tracer.span("prompt", source=file):
+                            seek_collector = SeekCollector.from_prompts(
+                                file_value, all_output_names, proposed_seeks.get(file)
+                            )
+                        is_collector_valid = seek_collector.is_valid()
+
+                    seek_list = seek_collector.get_seek_list()
+
+                    # The seeks of the first source file are the reference for the other source files
+                    if is_locating and not proposed_seeks:
+                        locator = SeekLocator.from_config(
+                            encoding_config,
+                            cache_directory=os.path.join(
+                                dirs.user_cache_dir, "fingerprints"
+                            ),
+                        )
+                        try:
+                            proposed_seeks = locator.locate(seek_list, source_file_info)
+                        except (OSError, subprocess.CalledProcessError):
+                            logging.error(f"Seeks of '{file}' could not be located")
+                            proposed_seeks = {file: []}
+
+                    for seek_index, seek in enumerate(seek_list):
+                        with tracer.span(
+                            "seek",
+                            source=file,
+                            seek=seek.output_name,
+                            ss=seek.ss,
+                            to=seek.to,
+                        ):
+                            new_encoding_config = copy.copy(encoding_config)
+
+                            print(f"\033[92mOutput Name: {seek.output_name}\033[0m")
+                            new_encoding_config = CLI.video_filters(
+                                new_encoding_config, seek
+                            )
+
+                            if args.custom:
+                                print(f"\033[92mOutput Name: {seek.output_name}\033[0m")
+                                new_encoding_config = CLI.custom_options(
+                                    new_encoding_config
+                                )
+
+                            logging.info(
+                                f"Generating commands with seek ss: '{seek.ss}', to: '{seek.to}'"
+                            )
+                            encode_webm = EncodeWebM(file_value, seek)
+                            load_jobs = encode_webm.get_jobs(new_encoding_config)
+                            if encoding_config.alternate_source_files == True:
+                                for job in load_jobs:
+                                    job.options["seek_index"] = seek_index
+                            plan_writer.write(load_jobs)
+
+                except KeyboardInterrupt:
                     logging.info(
-                        f"Generating commands with seek ss: '{seek.ss}', to: '{seek.to}'"
+                        f"Exiting from inclusion of file '{file}' after keyboard interrupt"
                     )
-                    encode_webm = EncodeWebM(file_value, seek)
-                    load_commands = encode_webm.get_commands(new_encoding_config)
-                    commands = commands + load_commands
 
-            except KeyboardInterrupt:
-                logging.info(
-                    f"Exiting from inclusion of file '{file}' after keyboard interrupt"
-                )
+        # Build tools execute exported plans in place of our scheduler
+        if args.export:
+            BuildFile.write(Plan.read(args.file), args.file, args.export)
 
-        # Alternate lines per source files
-        if encoding_config.alternate_source_files == True:
-            output_list = []
-            lines_per_source = len(load_commands)
-            for i in range(lines_per_source):
-                output_list.append(commands[i])
-                for k in range(1, len(commands) // lines_per_source):
-                    output_list.append(commands[i + lines_per_source * k])
-
-            commands = output_list
-
-        # Write commands to file
-        logging.info(f"Writing {len(commands)} commands to file '{args.file}'...")
-        with open(args.file, mode="w", encoding="utf8") as f:
-            for command in commands:
-                f.write(command + "\n")
-
-        # Execute commands in memory and write commands to file if requested
-        if mode == 3:
-            logging.info(f"Executing {len(commands)} commands...")
-            for command in commands:
-                subprocess.call(command, shell=True)
-
-    # Read and execute commands from file
+        # Execute the jobs written to file if requested
+        elif mode == 3:
+            execute(args, encoding_config, dirs, Plan.read(args.file))
+
+    # Read and execute jobs from file
     if mode == 2:
         if not os.path.isfile(args.file):
             logging.error(f"File '{args.file}' does not exist")
             sys.exit()
 
-        with open(args.file, mode="r", encoding="utf8") as f:
-            for command in f:
-                commands.append(command)
+        jobs = Plan.read(args.file)
+
+        if args.export:
+            BuildFile.write(jobs, args.file, args.export)
+        else:
+            execute(args, encoding_config, dirs, jobs)
+
+
+# Probe the source file, with its streams selected by our config or the prompts
+def get_source_file(file, encoding_config) -> SourceFile:
+    with tracer.span("source", source=file):
+        return SourceFile.from_file(file, encoding_config)
+
+
+# Scheduler with the resource governor and memory estimates of our config
+# Memory estimates learned from past runs are shared by every scheduler of the user
+def get_scheduler(encoding_config, dirs, state_file=None):
+    os.makedirs(dirs.user_data_dir, exist_ok=True)
+    memory_estimator = MemoryEstimator(
+        budget=(
+            int(encoding_config.memory_budget)
+            if encoding_config.memory_budget
+            else None
+        ),
+        state_file=os.path.join(dirs.user_data_dir, "memory_estimates.json"),
+    )
+    memory_estimator.load()
+
+    return Scheduler(
+        workers=encoding_config.workers,
+        state_file=state_file,
+        governor=ResourceGovernor.from_config(encoding_config),
+        memory_estimator=memory_estimator,
+        metrics_file=encoding_config.metrics_file or None,
+        retries=encoding_config.job_retries,
+        retry_backoff=encoding_config.retry_backoff,
+        workspace=Workspace.from_config(encoding_config),
+        source_cache=(
+            SourceCache.from_config(encoding_config)
+            if encoding_config.source_cache_directory
+            else None
+        ),
+    )
+
+
+# Token file of the control API of the daemon
+def get_token_file(dirs) -> str:
+    return os.path.join(dirs.user_data_dir, "daemon_token")
+
+
+# Execute jobs with a local scheduler, or submit the command file to the daemon
+def execute(args, encoding_config, dirs, jobs):
+    if args.submit:
+        try:
+            response = Daemon.request(
+                encoding_config.daemon_port,
+                get_token_file(dirs),
+                "/plans",
+                {"file": os.path.abspath(args.file), "cwd": os.getcwd()},
+            )
+        except OSError:
+            logging.error(
+                f"Daemon is not running on port '{encoding_config.daemon_port}'"
+            )
+            sys.exit()
 
-        logging.info(f"Reading {len(commands)} commands from file '{args.file}'...")
+        logging.info(
+            f"Submitted {response.get('jobs')} jobs as batch '{response.get('batch')}'"
+        )
+        return
 
-        for command in commands:
-            subprocess.call(command, shell=True)
+    logging.info(f"Executing {len(jobs)} jobs...")
+    scheduler = get_scheduler(encoding_config, dirs)
+    scheduler.submit(jobs)
+    scheduler.run()
 
 
 if __name__ == "__main__":
@@ -38,3 +38,19 @@ class BitrateMode(Enum):
         cbr_max_bitrate,
         crf: f"-crf {crf} -b:v {cbr_bitrate} -qcomp 0.7",
     )
+    # Variable Bitrate Mode with a search for the lowest CRF that fits the target file size
+    VBR_TARGET = (
+        3,
+        lambda cbr_bitrate, cbr_max_bitrate, crf: f"-crf {crf} -b:v 0 -qcomp 0.7",
+        lambda cbr_bitrate, cbr_max_bitrate, crf: f"-crf {crf} -b:v 0 -qcomp 0.7",
+    )
+    # Constrained Quality Mode with a search for the lowest CRF that fits the target file size
+    CQ_TARGET = (
+        4,
+        lambda cbr_bitrate,
+        cbr_max_bitrate,
+        crf: f"-crf {crf} -b:v {cbr_bitrate} -qcomp 0.7",
+        lambda cbr_bitrate,
+        cbr_max_bitrate,
+        crf: f"-crf {crf} -b:v {cbr_bitrate} -qcomp 0.7",
+    )
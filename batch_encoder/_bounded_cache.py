@@ -0,0 +1,32 @@
+from collections import OrderedDict
+
+import threading
+
+
+# Cache of a long-lived process that keeps its most recently used entries
+# Probe and measurement caches stay bounded however many sources and seeks a daemon or a large batch goes through
+# Entries are read with a single call under the lock, so that an entry evicted by another thread is a miss
+class BoundedCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    # The entry of the key, None on a miss
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
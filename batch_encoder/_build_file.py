@@ -0,0 +1,233 @@
+from ._job_type import JobType
+
+import logging
+import os
+import shlex
+import sys
+
+
+# Export of our plan as a Makefile or Ninja build file
+# Jobs become rules from their inputs (source files, passlogs and the outputs of the jobs they depend on) to their outputs,
+# jobs without known outputs touch a stamp file next to the plan so that the build tool can skip them once they ran
+class BuildFile:
+    # Outputs of FFmpeg that are not files
+    null_outputs = ["-", "NUL", "/dev/null"]
+
+    # Job types that run in Python through a self-invocation of batch_encoder
+    python_job_types = [
+        JobType.LOUDNORM,
+        JobType.ANALYSIS,
+        JobType.CRF_SEARCH,
+        JobType.VERIFY,
+        JobType.CLEANUP,
+    ]
+
+    # Outputs of the job, empty if they can not be known before it runs
+    @staticmethod
+    def get_outputs(job) -> list[str]:
+        if job.job_type in [JobType.LOUDNORM, JobType.ANALYSIS]:
+            return [job.options["filter_script"]]
+
+        if (
+            job.job_type in BuildFile.python_job_types
+            or job.job_type == JobType.COMMAND
+        ):
+            return []
+
+        args = shlex.split(job.command)
+        outputs = (
+            BuildFile.get_passlog_files(args) if BuildFile.get_pass(args) == "1" else []
+        )
+        outputs += [
+            args[i + 1]
+            for i, arg in enumerate(args[:-1])
+            if arg == "-y" and args[i + 1] not in BuildFile.null_outputs
+        ]
+        if "-y" not in args and args[-1] not in BuildFile.null_outputs:
+            outputs.append(args[-1])
+
+        return outputs
+
+    # Files the job reads that no job of the plan writes, such as the source file and the passlogs of first passes
+    @staticmethod
+    def get_inputs(job) -> list[str]:
+        if job.job_type == JobType.COMMAND:
+            return []
+
+        args = shlex.split(job.command)
+        inputs = [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == "-i"]
+        if BuildFile.get_pass(args) == "2":
+            inputs += BuildFile.get_passlog_files(args)
+
+        return inputs
+
+    @staticmethod
+    def get_pass(args) -> str | None:
+        if "-pass" not in args[:-1]:
+            return None
+
+        return args[args.index("-pass") + 1]
+
+    # libvpx writes the statistics of a pass to '[Passlog File]-0.log'
+    @staticmethod
+    def get_passlog_files(args) -> list[str]:
+        return [
+            args[i + 1] + "-0.log"
+            for i, arg in enumerate(args[:-1])
+            if arg == "-passlogfile"
+        ]
+
+    @staticmethod
+    def get_stamp_file(job, plan_file) -> str:
+        return f"{os.path.splitext(plan_file)[0]}-{job.id}.done"
+
+    # Python stages run through our CLI, jobs without known outputs touch their stamp file
+    @staticmethod
+    def get_recipe(job, plan_file) -> str:
+        recipe = (
+            f"{shlex.quote(sys.executable)} -m batch_encoder "
+            f"--file {shlex.quote(plan_file)} --job {job.id}"
+            if job.job_type in BuildFile.python_job_types
+            else job.command
+        )
+
+        if not BuildFile.get_outputs(job):
+            recipe += (
+                f" && touch {shlex.quote(BuildFile.get_stamp_file(job, plan_file))}"
+            )
+
+        return recipe
+
+    # Rules of the plan as (outputs, inputs, recipe) and the outputs that no job depends on
+    @staticmethod
+    def get_rules(jobs, plan_file) -> tuple[list, list]:
+        targets = {}
+        for job in jobs:
+            targets[job.id] = BuildFile.get_outputs(job) or [
+                BuildFile.get_stamp_file(job, plan_file)
+            ]
+
+        rules = []
+        for job in jobs:
+            inputs = list(BuildFile.get_inputs(job))
+            for dependency in job.depends_on:
+                inputs += targets[dependency.id]
+
+            rules.append(
+                (
+                    targets[job.id],
+                    list(dict.fromkeys(inputs)),
+                    BuildFile.get_recipe(job, plan_file),
+                )
+            )
+
+        dependency_ids = {
+            dependency.id for job in jobs for dependency in job.depends_on
+        }
+        default_targets = [
+            target
+            for job in jobs
+            if job.id not in dependency_ids
+            for target in targets[job.id]
+        ]
+
+        return rules, default_targets
+
+    @staticmethod
+    def escape_make_path(path) -> str:
+        return (
+            path.replace("$", "$$")
+            .replace(" ", "\\ ")
+            .replace(":", "\\:")
+            .replace("#", "\\#")
+        )
+
+    @staticmethod
+    def escape_ninja_path(path) -> str:
+        return path.replace("$", "$$").replace(" ", "$ ").replace(":", "$:")
+
+    # Multiple outputs of a rule are grouped targets, which need GNU Make 4.3 or later
+    # Files removed by cleanup jobs are secondary, Make does not encode them again while the outputs that use them are up to date
+    @staticmethod
+    def write_makefile(file, jobs, plan_file) -> None:
+        rules, default_targets = BuildFile.get_rules(jobs, plan_file)
+        intermediate_files = [
+            intermediate_file
+            for job in jobs
+            if job.job_type == JobType.CLEANUP
+            for intermediate_file in job.options["files"]
+        ]
+
+        lines = [
+            "# Generated by batch_encoder from " + plan_file,
+            ".DELETE_ON_ERROR:",
+            "",
+        ]
+        if intermediate_files:
+            lines += [
+                ".SECONDARY: "
+                + " ".join(map(BuildFile.escape_make_path, intermediate_files)),
+                "",
+            ]
+        lines += [
+            ".PHONY: all",
+            "all: " + " ".join(map(BuildFile.escape_make_path, default_targets)),
+            "",
+        ]
+        for outputs, inputs, recipe in rules:
+            lines.append(
+                " ".join(map(BuildFile.escape_make_path, outputs))
+                + (" &: " if len(outputs) > 1 else ": ")
+                + " ".join(map(BuildFile.escape_make_path, inputs))
+            )
+            lines.append("\t" + recipe.replace("$", "$$"))
+            lines.append("")
+
+        with open(file, mode="w", encoding="utf8") as f:
+            f.write("\n".join(lines))
+
+    # Ninja encodes missing intermediate files again, so cleanup jobs are left out and the intermediates are kept
+    @staticmethod
+    def write_ninja(file, jobs, plan_file) -> None:
+        rules, default_targets = BuildFile.get_rules(
+            [job for job in jobs if job.job_type != JobType.CLEANUP], plan_file
+        )
+
+        lines = [
+            "# Generated by batch_encoder from " + plan_file,
+            "rule job",
+            "  command = $recipe",
+            "  description = $out",
+            "",
+        ]
+        for outputs, inputs, recipe in rules:
+            lines.append(
+                "build "
+                + " ".join(map(BuildFile.escape_ninja_path, outputs))
+                + ": job"
+                + "".join(" " + BuildFile.escape_ninja_path(i) for i in inputs)
+            )
+            lines.append("  recipe = " + recipe.replace("$", "$$"))
+            lines.append("")
+        lines.append(
+            "default " + " ".join(map(BuildFile.escape_ninja_path, default_targets))
+        )
+        lines.append("")
+
+        with open(file, mode="w", encoding="utf8") as f:
+            f.write("\n".join(lines))
+
+    # Write the build file of the plan next to it, '[Plan Name].mk' or '[Plan Name].ninja'
+    @staticmethod
+    def write(jobs, plan_file, build_format) -> str:
+        file = os.path.splitext(plan_file)[0] + (
+            ".mk" if build_format == "make" else ".ninja"
+        )
+
+        logging.info(f"Writing {len(jobs)} rules to file '{file}'...")
+        if build_format == "make":
+            BuildFile.write_makefile(file, jobs, plan_file)
+        else:
+            BuildFile.write_ninja(file, jobs, plan_file)
+
+        return file
@@ -0,0 +1,129 @@
+from ._host_profile import HostProfile
+from ._process_runner import process_runner
+
+import logging
+import math
+import os
+import shlex
+import socket
+import statistics
+import time
+
+
+# Calibration of the encoder threading settings of this host
+# Short second-pass encodes of a clip at each resolution class are run with different numbers of threads
+# and row multithreading, and with different numbers of concurrent encodes
+# Settings are searched one at a time and the fastest aggregate frames per second is kept in the host profile
+class Calibration:
+    # Synthetic clip with film grain, close to the encoding cost of anime sources
+    synthetic_source = "testsrc2=size=1920x1080:rate=24000/1001,noise=alls=10:allf=t+u"
+
+    # Tile columns of our encodes, not calibrated since they change the bitstream and its compression
+    tile_columns = 6
+
+    def __init__(self, clip=None, frames=240, repeats=3, host_profile=None):
+        self.clip = clip
+        # Enough frames that the alt-ref lag of the encoder is a small part of the run
+        self.frames = frames
+        self.repeats = repeats
+        self.cpu_count = os.cpu_count() or 1
+        self.host_profile = host_profile or HostProfile(
+            HostProfile.get_default_file(), socket.gethostname(), self.cpu_count
+        )
+
+    # Numbers of concurrent encodes and of threads per encode, powers of two within our CPUs
+    # Encodes beyond the process limit would not run concurrently, so they are not measured
+    def get_workers_options(self) -> list[int]:
+        max_workers = min(self.cpu_count, process_runner.max_processes)
+        return [2**i for i in range(int(math.log2(max_workers)) + 1)]
+
+    def get_threads_options(self, workers) -> list[int]:
+        return [
+            2**i for i in range(int(math.log2(max(1, self.cpu_count // workers))) + 1)
+        ]
+
+    # The encode of the calibration, with the settings of a second pass
+    def get_command(self, height, threads, row_mt) -> str:
+        source = (
+            f"-i {shlex.quote(self.clip)}"
+            if self.clip is not None
+            else f"-f lavfi -i {Calibration.synthetic_source}"
+        )
+        return (
+            f"ffmpeg -v error -nostats {source} -map 0:v:0 -vf scale=-2:{height} -frames:v {self.frames} "
+            f"-c:v libvpx-vp9 -b:v 0 -crf 30 -cpu-used 0 -g 240 -threads {threads} -tile-columns {Calibration.tile_columns} "
+            f"-frame-parallel 0 -auto-alt-ref 1 -lag-in-frames 25 -row-mt {row_mt} -pix_fmt yuv420p "
+            f"-an -sn -dn -f null -"
+        )
+
+    # Aggregate frames per second of concurrent encodes with the settings
+    # The median of repeated runs is kept, so that a run slowed by other processes of the host does not count
+    def measure(self, height, workers, threads, row_mt) -> float:
+        command = self.get_command(height, threads, row_mt)
+
+        runs_fps = []
+        for _ in range(self.repeats):
+            start_time = time.perf_counter()
+            results = process_runner.run_all([shlex.split(command)] * workers)
+            elapsed_time = time.perf_counter() - start_time
+
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+
+            runs_fps.append(workers * self.frames / elapsed_time)
+
+        fps = statistics.median(runs_fps)
+
+        logging.info(
+            f"{height}p, workers: {workers}, threads: {threads}, "
+            f"row-mt: {row_mt}: {fps:.2f} fps"
+        )
+
+        return fps
+
+    # Fastest settings for the resolution class and number of workers
+    def calibrate(self, height, workers) -> dict:
+        threads_fps = {
+            threads: self.measure(height, workers, threads, 1)
+            for threads in self.get_threads_options(workers)
+        }
+        threads = max(threads_fps, key=threads_fps.get)
+
+        row_mt_fps = {
+            1: threads_fps[threads],
+            0: self.measure(height, workers, threads, 0),
+        }
+        row_mt = max(row_mt_fps, key=row_mt_fps.get)
+
+        return {
+            "threads": threads,
+            "row_mt": row_mt,
+            "fps": round(row_mt_fps[row_mt], 2),
+        }
+
+    def run(self) -> HostProfile:
+        logging.info(
+            f"Calibrating encoder settings of host '{self.host_profile.host}' with {self.cpu_count} CPUs..."
+        )
+
+        for height in HostProfile.resolution_classes:
+            self.host_profile.classes[height] = {
+                workers: self.calibrate(height, workers)
+                for workers in self.get_workers_options()
+            }
+
+            workers, settings = max(
+                self.host_profile.classes[height].items(),
+                key=lambda item: item[1]["fps"],
+            )
+            logging.info(
+                f"Fastest for {height}p: {workers} workers with {settings['threads']} threads "
+                f"and row-mt {settings['row_mt']} "
+                f"({settings['fps']} fps)"
+            )
+
+        self.host_profile.save()
+        logging.info(f"Host profile written to '{self.host_profile.file}'")
+
+        return self.host_profile
@@ -1,5 +1,8 @@
 from ._audio_filter import AudioFilter
 from ._bitrate_mode import BitrateMode
+from ._filter_proxy import FilterProxy
+from ._source_analysis import SourceAnalysis
+from ._tracer import tracer
 from ._typing import Args, EncodingConfigType
 from ._video_filter import VideoFilter
 from typing import Literal
@@ -18,8 +21,7 @@ class CLI:
     # Validations
     validate_time = lambda _, x: all(CLI.time_pattern.match(y) for y in x.split(","))
     validate_encoding_modes = lambda _, x: all(
-        y.strip().upper()
-        in [BitrateMode.VBR.name, BitrateMode.CBR.name, BitrateMode.CQ.name]
+        y.strip().upper() in [bitrate_mode.name for bitrate_mode in BitrateMode]
         for y in x.split(",")
     )
     validate_digits = (
@@ -41,9 +43,9 @@ class CLI:
         return answer["text"]
 
     # Prompt the user for time questions
-    def prompt_time(message, validate=validate_time) -> str:
+    def prompt_time(message, validate=validate_time, default=None) -> str:
         answer = inquirer.prompt(
-            [inquirer.Text("time", message=message, validate=validate)]
+            [inquirer.Text("time", message=message, validate=validate, default=default)]
         )
 
         if answer is None:
@@ -80,6 +82,7 @@ class CLI:
             return answer["mode"]
 
     # Prompt the user for source files to choose
+    @tracer.traced
     def choose_source_files(source_files) -> list[str]:
         answer = inquirer.prompt(
             [
@@ -175,11 +178,27 @@ class CLI:
         return ",".join(af_list)
 
     # Prompt the user for our list of video filters
-    def video_filters(encoding_config: EncodingConfigType) -> EncodingConfigType:
+    # With proxy previews enabled, the selected filters are encoded as proxies before we confirm which to keep
+    @tracer.traced
+    def video_filters(
+        encoding_config: EncodingConfigType, seek=None
+    ) -> EncodingConfigType:
         video_filters_options = VideoFilter.get_obj()
 
         if encoding_config.include_unfiltered:
-            encoding_config.video_filters.append((None, "No Filters"))
+            encoding_config.video_filters = encoding_config.video_filters + [
+                (None, "No Filters")
+            ]
+
+        # Deinterlacing and crop bars found by the analysis of the seek are suggested
+        default_video_filters = [tp[1] for tp in encoding_config.video_filters]
+        if encoding_config.source_analysis_enable and seek is not None:
+            detected_video_filter = SourceAnalysis.from_seek(seek).get_video_filter(
+                seek.source_file
+            )
+            if detected_video_filter is not None:
+                video_filters_options[detected_video_filter] = "detected"
+                default_video_filters.append(detected_video_filter)
 
         answer = inquirer.prompt(
             [
@@ -187,7 +206,7 @@ class CLI:
                     "video_filters",
                     message="Select Video Filters (Space to select)",
                     choices=video_filters_options.keys(),
-                    default=[tp[1] for tp in encoding_config.video_filters],
+                    default=default_video_filters,
                 )
             ]
         )
@@ -214,13 +233,50 @@ class CLI:
                 ]
             )
 
+        if (
+            encoding_config.proxy_preview_enable
+            and seek is not None
+            and len(tp_list) > 1
+        ):
+            tp_list = CLI.choose_proxy_filters(seek, tp_list)
+
         encoding_config.video_filters = tp_list
 
         logging.debug(f"[CLI.video_filters] tp_list: '{tp_list}'")
 
         return encoding_config
 
+    # Prompt the user for the video filters to keep after reviewing their proxies
+    def choose_proxy_filters(seek, tp_list) -> list:
+        proxy_filenames = FilterProxy(seek).encode(tp_list)
+        choices = [
+            (f"{filter_value} ({proxy_filename})", (filter_name, filter_value))
+            for (filter_name, filter_value), proxy_filename in zip(
+                tp_list, proxy_filenames
+            )
+        ]
+
+        answer = inquirer.prompt(
+            [
+                inquirer.Checkbox(
+                    "proxy_filters",
+                    message="Keep Video Filters (Space to select)",
+                    choices=choices,
+                )
+            ]
+        )
+
+        if answer is None or len(answer["proxy_filters"]) == 0:
+            return tp_list
+
+        logging.debug(
+            f"[CLI.choose_proxy_filters] answer[\"proxy_filters\"]: '{answer['proxy_filters']}'"
+        )
+
+        return answer["proxy_filters"]
+
     # Prompt the user for custom options if requested
+    @tracer.traced
     def custom_options(encoding_config: EncodingConfigType) -> EncodingConfigType:
         create_preview = encoding_config.create_preview
         limit_size_enable = encoding_config.limit_size_enable
@@ -253,10 +309,12 @@ class CLI:
 
         encoding_mode_questions = []
         for encoding_mode in answer["encoding_modes"].split(","):
-            if (
-                encoding_mode == BitrateMode.VBR.name
-                or encoding_mode == BitrateMode.CQ.name
-            ):
+            if encoding_mode in [
+                BitrateMode.VBR.name,
+                BitrateMode.CQ.name,
+                BitrateMode.VBR_TARGET.name,
+                BitrateMode.CQ_TARGET.name,
+            ]:
                 encoding_mode_questions.append(
                     inquirer.Text(
                         "crfs",
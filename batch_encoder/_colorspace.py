@@ -25,15 +25,9 @@ class Colorspace(Enum):
     @staticmethod
     def value_of(source_file):
         # Method 1: Carry over color data from source if specified
-        source_colorspace = source_file.video_format["streams"][0].get(
-            "color_space", ""
-        )
-        source_color_primaries = source_file.video_format["streams"][0].get(
-            "color_primaries", ""
-        )
-        source_color_trc = source_file.video_format["streams"][0].get(
-            "color_transfer", ""
-        )
+        source_colorspace = source_file.metadata.color_space
+        source_color_primaries = source_file.metadata.color_primaries
+        source_color_trc = source_file.metadata.color_transfer
 
         logging.debug(
             f"[Colorspace.value_of] source_colorspace: {source_colorspace}, "
@@ -53,7 +47,7 @@ class Colorspace(Enum):
                 return colorspace_candidate
 
         # Method 2: Infer color date from source file resolution
-        resolution = int(source_file.video_format["streams"][0]["height"])
+        resolution = source_file.metadata.height
 
         if resolution >= 720:
             logging.debug(
@@ -0,0 +1,183 @@
+from ._bounded_cache import BoundedCache
+from ._metrics import metrics
+from ._process_runner import process_runner
+from ._tracer import tracer
+
+from enum import Enum, nonmember
+
+import asyncio
+import functools
+import logging
+import re
+
+
+# The Complexity Enumerated List
+# Classify the content of a seek from sampled frames to pick bitrates, keyframe interval and CRF range
+class Complexity(Enum):
+    # Sampling of the seek for the complexity probe
+    sample_count = nonmember(5)
+    sample_length = nonmember(3)
+
+    # Thresholds on average temporal information and scene changes per minute
+    low_ti = nonmember(8)
+    high_ti = nonmember(20)
+    low_scene_rate = nonmember(15)
+    high_scene_rate = nonmember(40)
+
+    # Probe results are cached per seek
+    complexity_cache = nonmember(BoundedCache(4096))
+
+    # Lines of the summary of the siti filter, each average is printed under the name of its measure
+    frames_pattern = nonmember(re.compile(r"Total frames: (\d+)"))
+    average_pattern = nonmember(re.compile(r"Average: ([\d.]+)"))
+
+    def __new__(cls, bitrate_factor, keyframe_factor, crf_position):
+        value = len(cls.__members__) + 1
+        obj = object.__new__(cls)
+        obj._value_ = value
+        obj.bitrate_factor = bitrate_factor
+        obj.keyframe_factor = keyframe_factor
+        obj.crf_position = crf_position
+        return obj
+
+    # Static-heavy content fits the size limit with lower bitrates and longer GOPs
+    LOW = (0.8, 2, 0.0)
+    MEDIUM = (0.9, 1, 0.5)
+    # High-motion content needs the full bitrate and the higher CRFs to fit the size limit
+    HIGH = (1.0, 1, 1.0)
+
+    # Scale a bitrate value such as '5600k' by our bitrate factor
+    def get_bitrate(self, bitrate) -> str:
+        scaled_bitrate = int(bitrate.rstrip("k")) * self.bitrate_factor
+
+        return f"{round(scaled_bitrate / 100) * 100}k"
+
+    # Narrow the CRF range to the window that fits our content
+    def get_crfs(self, crfs, window=3) -> list[str]:
+        crfs = sorted(crfs, key=int)
+        if len(crfs) <= window:
+            return crfs
+
+        start = round((len(crfs) - window) * self.crf_position)
+        return crfs[start : start + window]
+
+    @staticmethod
+    def value_of(seek):
+        stats = Complexity.get_stats(seek)
+
+        # Without complexity data we keep the middle of the ranges
+        if stats["frames"] == 0:
+            complexity = Complexity.MEDIUM
+        elif (
+            stats["ti"] >= Complexity.high_ti
+            or stats["scene_rate"] >= Complexity.high_scene_rate
+        ):
+            complexity = Complexity.HIGH
+        elif (
+            stats["ti"] < Complexity.low_ti
+            and stats["scene_rate"] < Complexity.low_scene_rate
+        ):
+            complexity = Complexity.LOW
+        else:
+            complexity = Complexity.MEDIUM
+
+        logging.debug(
+            f"[Complexity.value_of] complexity: '{complexity.name}', "
+            f"si: '{stats['si']}', "
+            f"ti: '{stats['ti']}', "
+            f"scene_rate: '{stats['scene_rate']}'"
+        )
+
+        return complexity
+
+    # Spatial/temporal information and scene change rate over sample windows of the seek
+    @staticmethod
+    @tracer.traced
+    def get_stats(seek) -> dict:
+        key = (seek.source_file.file, seek.ss, seek.to)
+        stats = Complexity.complexity_cache.get(key)
+        if stats is not None:
+            metrics.inc(
+                "batch_encoder_cache_requests_total", cache="complexity", result="hit"
+            )
+            return stats
+
+        metrics.inc(
+            "batch_encoder_cache_requests_total", cache="complexity", result="miss"
+        )
+
+        logging.info("Retrieving complexity data...")
+
+        # Windows are probed concurrently and their output is parsed line by line
+        windows = seek.get_sample_windows(
+            Complexity.sample_count, Complexity.sample_length
+        )
+        windows_stats = [{"section": None, "scene_changes": 0} for _ in windows]
+
+        async def probe_windows():
+            return await asyncio.gather(
+                *(
+                    process_runner.run_async(
+                        Complexity.get_probe_args(seek, start, length),
+                        check=False,
+                        stderr_callback=functools.partial(
+                            Complexity.parse_line, window_stats
+                        ),
+                    )
+                    for (start, length), window_stats in zip(windows, windows_stats)
+                )
+            )
+
+        process_runner.run_coroutine(probe_windows())
+
+        frames, si, ti, scene_changes, sampled_duration = 0, 0.0, 0.0, 0, 0.0
+        for (start, length), window_stats in zip(windows, windows_stats):
+            if not all(measure in window_stats for measure in ["frames", "si", "ti"]):
+                logging.error(f"Complexity data unavailable for window at '{start}'")
+                continue
+
+            window_frames = window_stats["frames"]
+            frames += window_frames
+            si += window_stats["si"] * window_frames
+            ti += window_stats["ti"] * window_frames
+            scene_changes += window_stats["scene_changes"]
+            sampled_duration += length
+
+        stats = {
+            "frames": frames,
+            "si": si / frames if frames else 0.0,
+            "ti": ti / frames if frames else 0.0,
+            "scene_rate": (
+                scene_changes * 60 / sampled_duration if sampled_duration else 0.0
+            ),
+        }
+        Complexity.complexity_cache[key] = stats
+
+        return stats
+
+    # Probe of the spatial/temporal information and scene changes of a sample window
+    @staticmethod
+    def get_probe_args(seek, start, length) -> list[str]:
+        return (
+            ["ffmpeg", "-nostats"]
+            + ["-ss", str(start), "-t", str(length), "-i", seek.source_file.file]
+            + ["-map", f"0:v:{seek.source_file.selected_video_stream}"]
+            + ["-vf", "scale=-2:360,siti=print_summary=1,scdet=threshold=10"]
+            + ["-an", "-sn", "-dn", "-f", "null", "-"]
+        )
+
+    # Parse a line of the output of the probe of a sample window into its stats
+    @staticmethod
+    def parse_line(window_stats, line) -> None:
+        if match := Complexity.frames_pattern.search(line):
+            window_stats["frames"] = int(match.group(1))
+        elif "Spatial Information" in line:
+            window_stats["section"] = "si"
+        elif "Temporal Information" in line:
+            window_stats["section"] = "ti"
+        elif (match := Complexity.average_pattern.search(line)) and window_stats[
+            "section"
+        ] is not None:
+            window_stats.setdefault(window_stats["section"], float(match.group(1)))
+        elif "lavfi.scd.time" in line:
+            window_stats["scene_changes"] += 1
@@ -0,0 +1,182 @@
+from ._job import JobError
+from ._job_type import JobType
+from ._process_runner import process_runner
+from ._tracer import tracer
+
+import logging
+import math
+import os
+import subprocess
+
+
+# Search for the lowest CRF whose encode fits under the target file size
+# Each trial is a second pass that reuses the first pass of the search, the CRF placeholder of the commands is "{crf}"
+class CRFSearch:
+    # Encodes within this share of the size limit are considered truncated by "-fs"
+    truncation_ratio = 0.99
+
+    # Approximate change of log(size) per CRF step, used until two trials have been measured
+    default_slope = -0.11
+
+    def __init__(
+        self,
+        command,
+        output,
+        final_commands,
+        min_crf,
+        max_crf,
+        target_size,
+        limit_size,
+        tolerance,
+        cwd=None,
+        governor=None,
+        job=None,
+    ):
+        self.command = command
+        self.output = output
+        self.final_commands = final_commands
+        self.min_crf = min_crf
+        self.max_crf = max_crf
+        self.target_size = target_size
+        self.limit_size = limit_size
+        self.tolerance = tolerance
+        self.cwd = cwd
+        self.governor = governor
+        self.job = job
+        self.sizes = {}
+
+    @classmethod
+    def from_job(cls, job, governor=None):
+        return cls(
+            job.resolve(job.command),
+            job.options["output"],
+            [
+                job.resolve(final_command)
+                for final_command in job.options["final_commands"]
+            ],
+            job.options["min_crf"],
+            job.options["max_crf"],
+            job.options["target_size"],
+            job.options["limit_size"],
+            job.options["tolerance"],
+            cwd=job.cwd,
+            governor=governor,
+            job=job,
+        )
+
+    # Resolve a path against the working directory of the search, or the intermediate directory of its job
+    def get_path(self, path) -> str:
+        if self.job is not None:
+            return self.job.get_intermediate_path(path)
+
+        return os.path.join(self.cwd, path) if self.cwd is not None else path
+
+    # Commands of the search run with the priorities of its job type
+    def call(self, command) -> int:
+        if self.governor is not None:
+            return self.governor.call(
+                command, JobType.CRF_SEARCH, cwd=self.cwd, job=self.job
+            )
+
+        return process_runner.run(command, cwd=self.cwd, check=False).returncode
+
+    # Encode a trial at the CRF and return the output size, or None if the encode was truncated
+    def encode(self, crf) -> int | None:
+        logging.info(f"Encoding CRF search trial with CRF '{crf}'...")
+        command = self.command.replace("{crf}", str(crf))
+        with tracer.span("CRFSearch.encode", crf=crf):
+            returncode = self.call(command)
+
+        # A failed trial is a failure of the search, not a miss
+        if returncode != 0:
+            self.sizes[crf] = None
+            self.remove_trials()
+            raise subprocess.CalledProcessError(returncode, command)
+
+        output = self.get_path(self.output.replace("{crf}", str(crf)))
+        size = os.path.getsize(output) if os.path.isfile(output) else None
+        if size is not None and self.limit_size is not None:
+            if size >= self.limit_size * CRFSearch.truncation_ratio:
+                size = None
+
+        logging.debug(f"[CRFSearch.encode] crf: '{crf}', size: '{size}'")
+
+        self.sizes[crf] = size
+        return size
+
+    # Remove the outputs of our trials, except the one of the selected CRF
+    def remove_trials(self, keep_crf=None) -> None:
+        for crf in self.sizes:
+            output = self.get_path(self.output.replace("{crf}", str(crf)))
+            if crf != keep_crf and os.path.isfile(output):
+                os.remove(output)
+
+    # Next CRF to try between the largest CRF that missed and the smallest CRF that fit
+    # Encode size is close to exponential in CRF, so we fit log(size) to the measured trials nearest to our bounds
+    def next_crf(self, miss_crf, fit_crf) -> int:
+        measured = sorted(
+            (crf for crf, size in self.sizes.items() if size is not None),
+            key=lambda crf: abs(crf - (miss_crf + fit_crf) / 2),
+        )
+
+        if len(measured) == 0:
+            return min(max((miss_crf + fit_crf) // 2, miss_crf + 1), fit_crf - 1)
+
+        crf_a = measured[0]
+        if len(measured) > 1 and self.sizes[measured[1]] != self.sizes[crf_a]:
+            crf_b = measured[1]
+            slope = (math.log(self.sizes[crf_b]) - math.log(self.sizes[crf_a])) / (
+                crf_b - crf_a
+            )
+        else:
+            slope = CRFSearch.default_slope
+
+        if slope >= 0:
+            slope = CRFSearch.default_slope
+
+        goal = math.log(self.target_size * (1 - self.tolerance / 2))
+        crf = round(crf_a + (goal - math.log(self.sizes[crf_a])) / slope)
+
+        return min(max(crf, miss_crf + 1), fit_crf - 1)
+
+    def run(self) -> int:
+        # The bounds are outside of the range until a trial fits or misses
+        miss_crf, fit_crf = self.min_crf - 1, self.max_crf + 1
+
+        while fit_crf - miss_crf > 1:
+            crf = self.next_crf(miss_crf, fit_crf)
+            size = self.encode(crf)
+
+            if size is not None and size <= self.target_size:
+                fit_crf = crf
+                if size >= self.target_size * (1 - self.tolerance):
+                    break
+            else:
+                miss_crf = crf
+
+        # Nothing fits, every trial is truncated or too large and the job fails
+        if fit_crf > self.max_crf:
+            self.remove_trials()
+            raise JobError(
+                f"No CRF in [{self.min_crf}, {self.max_crf}] fits under '{self.target_size}' bytes"
+            )
+
+        logging.info(
+            f"CRF search selected CRF '{fit_crf}' after {len(self.sizes)} trial(s)"
+        )
+
+        self.remove_trials(keep_crf=fit_crf)
+
+        for final_command in self.final_commands:
+            final_command = final_command.replace("{crf}", str(fit_crf))
+            returncode = self.call(final_command)
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, final_command)
+
+        # The selected trial is a video-only encode once the final commands mux it with the shared audio
+        if self.final_commands:
+            output = self.get_path(self.output.replace("{crf}", str(fit_crf)))
+            if os.path.isfile(output):
+                os.remove(output)
+
+        return fit_crf
@@ -0,0 +1,156 @@
+from ._metrics import metrics
+from ._plan import Plan
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import urllib.error
+import urllib.request
+
+
+# Long-running scheduler shared by the operators of a node
+# The daemon keeps the loudness measurements and analysis reports of its jobs cached and serves a control API on localhost
+# Probes run in the generating client, which prompts for streams, and are not cached by the daemon
+# Requests carry the token of the token file of the daemon, which only its user can read
+class Daemon:
+    def __init__(self, port, scheduler, token_file):
+        self.port = port
+        self.scheduler = scheduler
+        self.token_file = token_file
+
+    # A new token for every start of the daemon, readable by its user only
+    def write_token(self) -> str:
+        token = secrets.token_hex(32)
+        fd = os.open(self.token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, mode="w", encoding="utf8") as f:
+            os.fchmod(f.fileno(), 0o600)
+            f.write(token)
+
+        return token
+
+    @staticmethod
+    def read_token(token_file) -> str:
+        with open(token_file, mode="r", encoding="utf8") as f:
+            return f.read().strip()
+
+    def serve(self) -> None:
+        token = self.write_token()
+        self.scheduler.load()
+        scheduler_thread = threading.Thread(
+            target=self.scheduler.run, kwargs={"serve": True}, daemon=True
+        )
+        scheduler_thread.start()
+
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", self.port), Daemon.get_handler(self.scheduler, token)
+        )
+        logging.info(f"Daemon listening on http://127.0.0.1:{self.port}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            self.scheduler.stop()
+
+    # Request handler of the control API
+    # GET /status, POST /plans {file, cwd, priority}, POST /priority {key, priority}, POST /workers {workers}
+    # Requests without the bearer token of the daemon are rejected, and POST bodies must be JSON
+    @staticmethod
+    def get_handler(scheduler, token):
+        class DaemonHandler(BaseHTTPRequestHandler):
+            def is_authorized(self) -> bool:
+                if hmac.compare_digest(
+                    self.headers.get("Authorization", ""), f"Bearer {token}"
+                ):
+                    return True
+
+                self.send_json(401, {"error": "Missing or invalid token"})
+                return False
+
+            def send_json(self, status, body) -> None:
+                response = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def send_text(self, status, body, content_type) -> None:
+                response = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def do_GET(self) -> None:
+                if not self.is_authorized():
+                    return
+
+                if self.path == "/status":
+                    self.send_json(200, scheduler.get_status())
+                elif self.path == "/metrics":
+                    self.send_text(200, metrics.render(), "text/plain; version=0.0.4")
+                else:
+                    self.send_json(404, {"error": f"Unknown path '{self.path}'"})
+
+            def do_POST(self) -> None:
+                if not self.is_authorized():
+                    return
+
+                if self.headers.get_content_type() != "application/json":
+                    self.send_json(
+                        415, {"error": "Requests must be of type 'application/json'"}
+                    )
+                    return
+
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    body = json.loads(self.rfile.read(length) or b"{}")
+
+                    if self.path == "/plans":
+                        jobs = Plan.read(body["file"])
+                        batch = scheduler.submit(
+                            jobs,
+                            priority=int(body.get("priority", 0)),
+                            cwd=body.get("cwd", os.path.dirname(body["file"])),
+                        )
+                        self.send_json(200, {"batch": batch, "jobs": len(jobs)})
+                    elif self.path == "/priority":
+                        count = scheduler.set_priority(
+                            body["key"], int(body["priority"])
+                        )
+                        self.send_json(200, {"jobs": count})
+                    elif self.path == "/workers":
+                        scheduler.set_workers(int(body["workers"]))
+                        self.send_json(200, {"workers": scheduler.workers})
+                    else:
+                        self.send_json(404, {"error": f"Unknown path '{self.path}'"})
+                except (KeyError, ValueError, OSError) as e:
+                    self.send_json(400, {"error": str(e)})
+
+            def log_message(self, format, *args) -> None:
+                logging.debug(f"[Daemon] {format % args}")
+
+        return DaemonHandler
+
+    # Thin client of the control API, authorized by the token file of the daemon
+    @staticmethod
+    def request(port, token_file, path, body=None) -> dict:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}{path}",
+            data=data,
+            headers={
+                "Authorization": f"Bearer {Daemon.read_token(token_file)}",
+                "Content-Type": "application/json",
+            },
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return json.loads(e.read())
@@ -1,8 +1,16 @@
 from ._bitrate_mode import BitrateMode
 from ._colorspace import Colorspace
+from ._complexity import Complexity
+from ._host_profile import HostProfile
+from ._job import Job
+from ._job_type import JobType
+from ._trial_predictor import TrialPredictor
 from ._loudnorm_filter import LoudnormFilter
-from ._utils import string_to_seconds
+from ._output_verifier import OutputVerifier
+from ._source_analysis import SourceAnalysis
+from ._typing import EncodingConfigType
 
+import copy
 import logging
 
 
@@ -12,29 +20,23 @@ class EncodeWebM:
     def __init__(self, source_file, seek):
         self.source_file = source_file
         self.seek = seek
-        self.loudnorm_filter = LoudnormFilter.from_seek(self.seek)
+        self.loudnorm_filter = None
+        self.loudnorm_job = None
+        self.analysis = None
+        self.intermediate_files = []
         self.g = self.get_keyframe_interval()
         self.audio_bitrate = self.get_audio_bitrate()
         self.cbr_bitrate = self.get_cbr_bitrate()
         self.cbr_max_bitrate = self.get_cbr_max_bitrate()
         self.colorspace = Colorspace.value_of(self.source_file)
+        self.tile_columns = 6
+        self.row_mt = 1
 
     # We want at least 10 keyframes in our encode and consistency in our interval
     def get_keyframe_interval(self) -> int:
-        source_file_duration = float(self.source_file.file_format["format"]["duration"])
+        duration = self.seek.get_duration()
 
-        start_time = string_to_seconds(self.seek.ss) if self.seek.ss else 0
-        end_time = (
-            string_to_seconds(self.seek.to) if self.seek.to else source_file_duration
-        )
-        duration = end_time - start_time
-
-        logging.debug(
-            f"[EncodeWebm.get_keyframe_interval] "
-            f"duration: '{duration}', "
-            f"end_time: '{end_time}', "
-            f"start_time: '{start_time}'"
-        )
+        logging.debug(f"[EncodeWebm.get_keyframe_interval] duration: '{duration}'")
 
         if duration < 60:
             return 96
@@ -43,10 +45,62 @@ class EncodeWebM:
         else:
             return 240
 
+    # Adjust our keyframe interval and CBR targets to the content complexity of the seek
+    # Longer keyframe intervals must still give us at least 10 keyframes
+    def apply_complexity(self, complexity) -> None:
+        max_keyframe_interval = int(
+            self.seek.get_duration() * self.get_frame_rate() / 10
+        )
+        self.g = max(
+            self.g, min(self.g * complexity.keyframe_factor, max_keyframe_interval)
+        )
+        self.cbr_bitrate = complexity.get_bitrate(self.cbr_bitrate)
+        self.cbr_max_bitrate = complexity.get_bitrate(self.cbr_max_bitrate)
+
+        logging.debug(
+            f"[EncodeWebm.apply_complexity] complexity: '{complexity.name}', "
+            f"g: '{self.g}', "
+            f"cbr_bitrate: '{self.cbr_bitrate}', "
+            f"cbr_max_bitrate: '{self.cbr_max_bitrate}'"
+        )
+
+    # Threads and row multithreading measured by the calibration of this host for our number of workers
+    def apply_host_profile(self, encoding_config) -> EncodingConfigType:
+        host_profile = HostProfile.load()
+        if host_profile is None:
+            return encoding_config
+
+        settings = host_profile.get_settings(
+            self.source_file.metadata.height,
+            encoding_config.workers,
+        )
+        if settings is None:
+            return encoding_config
+
+        self.row_mt = settings["row_mt"]
+        encoding_config = copy.copy(encoding_config)
+        encoding_config.threads = settings["threads"]
+
+        logging.debug(
+            f"[EncodeWebm.apply_host_profile] threads: '{encoding_config.threads}', "
+            f"row_mt: '{self.row_mt}'"
+        )
+
+        return encoding_config
+
+    # Average frame rate of the source video stream
+    def get_frame_rate(self) -> float:
+        frame_rate = self.source_file.metadata.avg_frame_rate
+        numerator, _, denominator = frame_rate.partition("/")
+        if not denominator or float(denominator) == 0:
+            return float(numerator) or 24000 / 1001
+
+        return float(numerator) / float(denominator) or 24000 / 1001
+
     # Audio must use a default bitrate of 192 kbps
     # Audio must use a bitrate of 320 kbps if the source bitrate is > 320 kbps
     def get_audio_bitrate(self) -> str:
-        audio_bitrate = int(self.source_file.audio_format["format"]["bit_rate"])
+        audio_bitrate = self.source_file.metadata.audio_bit_rate
 
         logging.debug(
             f"[EncodeWebm.get_audio_bitrate] audio_bitrate: '{audio_bitrate}'"
@@ -59,7 +113,7 @@ class EncodeWebM:
 
     # Approximation of target average bitrate near file size limit
     def get_cbr_bitrate(self) -> str:
-        resolution = int(self.source_file.video_format["streams"][0]["height"])
+        resolution = self.source_file.metadata.height
 
         logging.debug(f"[EncodeWebm.get_cbr_bitrate] resolution: '{resolution}'")
 
@@ -74,7 +128,7 @@ class EncodeWebM:
 
     # Approximation of max overall bitrate near file size limit
     def get_cbr_max_bitrate(self) -> str:
-        resolution = int(self.source_file.video_format["streams"][0]["height"])
+        resolution = self.source_file.metadata.height
 
         logging.debug(f"[EncodeWebm.get_cbr_max_bitrate] resolution: '{resolution}'")
 
@@ -87,22 +141,22 @@ class EncodeWebM:
         else:
             return "3200k"
 
+    # Estimated size of the shared audio stream, reserved from the file size limit of video-only encodes
+    def get_audio_size(self) -> int:
+        audio_bitrate = int(self.audio_bitrate.rstrip("k")) * 1000
+
+        return round(audio_bitrate * self.seek.get_duration() / 8)
+
     # Limiting file size based on resolution and duration
     def get_limit_file_size(self, video_filters="") -> str:
-        source_file_duration = float(self.source_file.file_format["format"]["duration"])
-
-        start_time = string_to_seconds(self.seek.ss) if self.seek.ss else 0
-        end_time = (
-            string_to_seconds(self.seek.to) if self.seek.to else source_file_duration
-        )
-        duration = end_time - start_time
+        duration = self.seek.get_duration()
 
         for filter in video_filters.split(","):
             if "scale=-1:" in filter:
                 resolution = int(filter.split(":")[1])
                 break
             else:
-                resolution = int(self.source_file.video_format["streams"][0]["height"])
+                resolution = self.source_file.metadata.height
 
         logging.debug(f"[EncodeWebm.get_limit_file_size] resolution: '{resolution}'")
 
@@ -122,17 +176,36 @@ class EncodeWebM:
 
     # First-pass encode
     def get_first_pass(
-        self, encoding_mode, crf=None, cbr_bitrate=None, cbr_max_bitrate=None, threads=4
+        self,
+        encoding_mode,
+        crf=None,
+        cbr_bitrate=None,
+        cbr_max_bitrate=None,
+        threads=4,
+        passlogfile=None,
     ) -> str:
+        passlogfile = passlogfile or self.get_passlog_filename(
+            encoding_mode, crf, cbr_bitrate, cbr_max_bitrate
+        )
         return (
             f"ffmpeg {self.colorspace.get_args()} {self.seek.get_seek_string()} "
-            f"-pass 1 -passlogfile {self.seek.output_name} "
+            f"-pass 1 -passlogfile {passlogfile} "
             f"-map 0:v:{self.source_file.selected_video_stream} "
             f"-map 0:a:{self.source_file.selected_audio_stream} "
             f"-c:v libvpx-vp9 "
             f"{encoding_mode.first_pass_rate_control(cbr_bitrate, cbr_max_bitrate, crf)} "
-            f"-cpu-used 4 -g {self.g} -threads {threads} -tile-columns 6 -frame-parallel 0 -auto-alt-ref 1 "
-            f"-lag-in-frames 25 -row-mt 1 -pix_fmt yuv420p -an -sn -f webm -y NUL"
+            f"-cpu-used 4 -g {self.g} -threads {threads} -tile-columns {self.tile_columns} -frame-parallel 0 -auto-alt-ref 1 "
+            f"-lag-in-frames 25 -row-mt {self.row_mt} -pix_fmt yuv420p -an -sn -f null -"
+        )
+
+    # Audio encode shared by every video encode of the seek
+    def get_audio_pass(self) -> str:
+        return (
+            f"ffmpeg {self.seek.get_seek_string()} "
+            f"-map 0:a:{self.source_file.selected_audio_stream} "
+            f"{self.get_audio_filters()} "
+            f"-c:a libopus -b:a {self.audio_bitrate} -ar 48k "
+            f"-map_metadata -1 -map_chapters -1 -vn -sn -dn -f ogg -y {self.get_audio_filename()}"
         )
 
     # Second-pass encode
@@ -146,7 +219,12 @@ class EncodeWebM:
         video_filters="",
         limit_size_enable=True,
         webm_filename="",
+        shared_audio_enable=False,
+        passlogfile=None,
     ) -> str:
+        passlogfile = passlogfile or self.get_passlog_filename(
+            encoding_mode, crf, cbr_bitrate, cbr_max_bitrate
+        )
         limit_size = (
             "-fs "
             + EncodeWebM.get_limit_file_size(self, video_filters=video_filters)
@@ -154,22 +232,341 @@ class EncodeWebM:
             if limit_size_enable
             else ""
         )
+
+        # The audio is encoded once by the audio pass, so we encode the video stream only
+        # and leave room for the audio stream in the file size limit
+        if shared_audio_enable:
+            if limit_size_enable:
+                limit_size = (
+                    "-fs "
+                    + str(
+                        int(self.get_limit_file_size(video_filters=video_filters))
+                        - self.get_audio_size()
+                    )
+                    + " "
+                )
+            return (
+                f"ffmpeg {self.colorspace.get_args()} {self.seek.get_seek_string()} "
+                f"-pass 2 -passlogfile {passlogfile} "
+                f"-map 0:v:{self.source_file.selected_video_stream} "
+                f"-c:v libvpx-vp9 "
+                f"{encoding_mode.second_pass_rate_control(cbr_bitrate, cbr_max_bitrate, crf)} "
+                f"-cpu-used 0 -g {self.g} -threads {threads}{video_filters} -tile-columns {self.tile_columns} "
+                f"-frame-parallel 0 -auto-alt-ref 1 -lag-in-frames 25 -row-mt {self.row_mt} -pix_fmt yuv420p "
+                f"{limit_size}"
+                f"-map_metadata:g -1 -map_metadata:s:v -1 -map_chapters -1 -an -sn -f webm -y {webm_filename}-video.webm"
+            )
+
         return (
             f"ffmpeg {self.colorspace.get_args()} {self.seek.get_seek_string()} "
-            f"-pass 2 -passlogfile {self.seek.output_name} "
+            f"-pass 2 -passlogfile {passlogfile} "
             f"-map 0:v:{self.source_file.selected_video_stream} "
             f"-map 0:a:{self.source_file.selected_audio_stream} "
             f"-c:v libvpx-vp9 "
             f"{encoding_mode.second_pass_rate_control(cbr_bitrate, cbr_max_bitrate, crf)} "
-            f"-cpu-used 0 -g {self.g} -threads {threads} {self.get_audio_filters()}{video_filters} -tile-columns 6 "
-            f"-frame-parallel 0 -auto-alt-ref 1 -lag-in-frames 25 -row-mt 1 -pix_fmt yuv420p "
+            f"-cpu-used 0 -g {self.g} -threads {threads} {self.get_audio_filters()}{video_filters} -tile-columns {self.tile_columns} "
+            f"-frame-parallel 0 -auto-alt-ref 1 -lag-in-frames 25 -row-mt {self.row_mt} -pix_fmt yuv420p "
             f"-c:a libopus -b:a {self.audio_bitrate} -ar 48k "
             f"{limit_size}"
             f"-map_metadata:g -1 -map_metadata:s:v -1 -map_metadata:s:a -1 -map_chapters -1 -sn -f webm -y {webm_filename}.webm"
         )
 
+    # Single-decode first pass of several rungs, each encoder writes the passlog of its rung
+    def get_multi_first_pass(self, rungs, threads=4) -> str:
+        split = "".join(f"[v{i}]" for i in range(len(rungs)))
+        outputs = "".join(
+            f"-map [v{i}] -c:v libvpx-vp9 "
+            f"{rung['encoding_mode'].first_pass_rate_control(rung['cbr_bitrate'], rung['cbr_max_bitrate'], rung['crf'])} "
+            f"-pass 1 -passlogfile {rung['passlogfile']} "
+            f"-cpu-used 4 -g {self.g} -threads {threads} -tile-columns {self.tile_columns} -frame-parallel 0 -auto-alt-ref 1 "
+            f"-lag-in-frames 25 -row-mt {self.row_mt} -pix_fmt yuv420p -an -sn -f null - "
+            for i, rung in enumerate(rungs)
+        )
+        return (
+            f"ffmpeg {self.colorspace.get_args()} {self.seek.get_seek_string()} "
+            f'-filter_complex "[0:v:{self.source_file.selected_video_stream}]split={len(rungs)}{split}" '
+            f"{outputs}"
+        ).rstrip()
+
+    # Single-decode second pass of several outputs
+    # Each filter chain runs once and its frames are split between the encoders that use it
+    def get_multi_second_pass(
+        self, outputs, threads=4, limit_size_enable=True, shared_audio_enable=False
+    ) -> str:
+        filter_values = list(
+            dict.fromkeys(filter_value for _, filter_value, _ in outputs)
+        )
+        filter_chains = [
+            EncodeWebM.get_video_filters(config_filter=filter_value).replace(
+                " -vf ", "", 1
+            )
+            or "null"
+            for filter_value in filter_values
+        ]
+        filter_graph = (
+            f"[0:v:{self.source_file.selected_video_stream}]split={len(filter_values)}"
+            + "".join(f"[f{j}]" for j in range(len(filter_values)))
+        )
+        for j, (filter_value, filter_chain) in enumerate(
+            zip(filter_values, filter_chains)
+        ):
+            labels = [
+                f"[v{i}]"
+                for i, (_, output_filter, _) in enumerate(outputs)
+                if output_filter == filter_value
+            ]
+            filter_graph += (
+                f";[f{j}]{filter_chain},split={len(labels)}{''.join(labels)}"
+            )
+
+        output_args = ""
+        for i, (rung, filter_value, webm_filename) in enumerate(outputs):
+            video_filters = EncodeWebM.get_video_filters(config_filter=filter_value)
+            limit_size = int(self.get_limit_file_size(video_filters=video_filters))
+            rate_control = rung["encoding_mode"].second_pass_rate_control(
+                rung["cbr_bitrate"], rung["cbr_max_bitrate"], rung["crf"]
+            )
+            output_args += (
+                f"-map [v{i}] -c:v libvpx-vp9 {rate_control} "
+                f"-pass 2 -passlogfile {rung['passlogfile']} "
+                f"-cpu-used 0 -g {self.g} -threads {threads} -tile-columns {self.tile_columns} "
+                f"-frame-parallel 0 -auto-alt-ref 1 -lag-in-frames 25 -row-mt {self.row_mt} -pix_fmt yuv420p "
+            )
+
+            # The audio is encoded once by the audio pass and muxed into each output
+            if shared_audio_enable:
+                if limit_size_enable:
+                    output_args += f"-fs {limit_size - self.get_audio_size()} "
+                output_args += (
+                    f"-map_metadata:g -1 -map_metadata:s:v -1 -map_chapters -1 "
+                    f"-an -sn -f webm -y {webm_filename}-video.webm "
+                )
+            else:
+                output_args += (
+                    f"-map 0:a:{self.source_file.selected_audio_stream} {self.get_audio_filters()} "
+                    f"-c:a libopus -b:a {self.audio_bitrate} -ar 48k "
+                )
+                if limit_size_enable:
+                    output_args += f"-fs {limit_size} "
+                output_args += (
+                    f"-map_metadata:g -1 -map_metadata:s:v -1 -map_metadata:s:a -1 -map_chapters -1 "
+                    f"-sn -f webm -y {webm_filename}.webm "
+                )
+
+        return (
+            f"ffmpeg {self.colorspace.get_args()} {self.seek.get_seek_string()} "
+            f'-filter_complex "{filter_graph}" '
+            f"{output_args}"
+        ).rstrip()
+
+    # Mux the video-only encode with the shared audio encode
+    def get_mux(self, webm_filename="") -> str:
+        return (
+            f"ffmpeg -i {webm_filename}-video.webm -i {self.get_audio_filename()} "
+            f"-map 0:v -map 1:a -c copy "
+            f"-map_metadata -1 -map_chapters -1 -f webm -y {webm_filename}.webm"
+        )
+
+    # Second-pass encode followed by the mux of the shared audio if enabled
+    def get_second_pass_jobs(
+        self, encoding_config, encoding_mode, first_pass_job, audio_job, **kwargs
+    ) -> list[Job]:
+        second_pass_job = Job(
+            JobType.SECOND_PASS,
+            self.get_second_pass(
+                encoding_mode,
+                threads=encoding_config.threads,
+                limit_size_enable=encoding_config.limit_size_enable,
+                shared_audio_enable=encoding_config.shared_audio_enable,
+                **kwargs,
+            ),
+            depends_on=[first_pass_job],
+        )
+        second_pass_jobs = [second_pass_job]
+
+        if encoding_config.shared_audio_enable:
+            second_pass_jobs.append(
+                Job(
+                    JobType.MUX,
+                    self.get_mux(webm_filename=kwargs.get("webm_filename", "")),
+                    depends_on=[second_pass_job, audio_job],
+                )
+            )
+            self.intermediate_files.append(
+                f"{kwargs.get('webm_filename', '')}-video.webm"
+            )
+
+        if encoding_config.verify_enable:
+            second_pass_jobs.append(
+                self.get_verify_job(
+                    encoding_config, encoding_mode, second_pass_jobs[-1], **kwargs
+                )
+            )
+
+        return second_pass_jobs
+
+    # Verification of the output of a second pass, and of its mux with the shared audio if enabled
+    # Encodes with a CRF are encoded again at the next-higher CRF on failure while retries remain
+    def get_verify_job(
+        self,
+        encoding_config,
+        encoding_mode,
+        final_job,
+        crf=None,
+        cbr_bitrate=None,
+        cbr_max_bitrate=None,
+        video_filters="",
+        webm_filename="",
+        passlogfile=None,
+    ) -> Job:
+        retry_commands = []
+        retry_intermediates = []
+        retry_output = None
+        if crf is not None and encoding_config.verify_retries > 0:
+            # Filenames start with the output name and the CRF, the suffix keeps retries apart from the other CRFs of our ladder
+            # Retries reuse the passlog of the original CRF
+            retry_filename = (
+                f"{self.seek.output_name}-{{crf}}"
+                + webm_filename[len(f"{self.seek.output_name}-{crf}") :]
+                + "-retry"
+            )
+            retry_commands.append(
+                self.get_second_pass(
+                    encoding_mode,
+                    crf="{crf}",
+                    cbr_bitrate=cbr_bitrate,
+                    cbr_max_bitrate=cbr_max_bitrate,
+                    threads=encoding_config.threads,
+                    video_filters=video_filters,
+                    limit_size_enable=encoding_config.limit_size_enable,
+                    webm_filename=retry_filename,
+                    shared_audio_enable=encoding_config.shared_audio_enable,
+                    passlogfile=passlogfile
+                    or self.get_passlog_filename(
+                        encoding_mode, crf, cbr_bitrate, cbr_max_bitrate
+                    ),
+                )
+            )
+            if encoding_config.shared_audio_enable:
+                retry_commands.append(self.get_mux(webm_filename=retry_filename))
+                retry_intermediates.append(f"{retry_filename}-video.webm")
+            retry_output = f"{retry_filename}.webm"
+
+        return Job(
+            JobType.VERIFY,
+            OutputVerifier.get_probe_command(f"{webm_filename}.webm"),
+            depends_on=[final_job],
+            options={
+                "output": f"{webm_filename}.webm",
+                "duration": self.seek.get_duration(),
+                "limit_size": (
+                    int(self.get_limit_file_size(video_filters=video_filters))
+                    if encoding_config.limit_size_enable
+                    else None
+                ),
+                "audio": True,
+                "crf": int(crf) if crf is not None else None,
+                "retries": encoding_config.verify_retries,
+                "retry_commands": retry_commands,
+                "retry_output": retry_output,
+                "retry_intermediates": retry_intermediates,
+            },
+        )
+
+    # Removal of the shared audio and of the video-only encodes once every job that reads them has finished
+    # CRF searches mux the shared audio and verifications mux it into their retries, so the cleanup waits for them too
+    def get_cleanup_job(self, file_jobs) -> Job:
+        return Job(
+            JobType.CLEANUP,
+            "",
+            depends_on=[
+                job
+                for job in file_jobs
+                if job.job_type
+                in [JobType.AUDIO, JobType.MUX, JobType.CRF_SEARCH, JobType.VERIFY]
+            ],
+            options={"files": [self.get_audio_filename()] + self.intermediate_files},
+        )
+
+    # Search for the lowest CRF of our range whose second pass fits the target file size
+    def get_crf_search_job(
+        self,
+        encoding_config,
+        encoding_mode,
+        first_pass_job,
+        audio_job,
+        min_crf,
+        max_crf,
+        video_filters="",
+        filter_name=None,
+        passlogfile=None,
+    ) -> Job:
+        cbr_bitrate = (
+            self.cbr_bitrate if encoding_mode == BitrateMode.CQ_TARGET else None
+        )
+        webm_filename = self.get_webm_filename(
+            crf="{crf}", cbr_bitrate=cbr_bitrate, filter_name=filter_name
+        )
+        command = self.get_second_pass(
+            encoding_mode,
+            crf="{crf}",
+            cbr_bitrate=self.cbr_bitrate,
+            threads=encoding_config.threads,
+            video_filters=video_filters,
+            limit_size_enable=encoding_config.limit_size_enable,
+            webm_filename=webm_filename,
+            shared_audio_enable=encoding_config.shared_audio_enable,
+            passlogfile=passlogfile,
+        )
+
+        limit_size = int(self.get_limit_file_size(video_filters=video_filters))
+        target_size = (
+            int(encoding_config.target_file_size)
+            if encoding_config.target_file_size
+            else limit_size
+        )
+        if encoding_config.limit_size_enable:
+            target_size = min(target_size, limit_size)
+        else:
+            limit_size = None
+
+        output = f"{webm_filename}.webm"
+        final_commands = []
+        depends_on = [first_pass_job]
+
+        # Trials encode the video stream only, the audio is muxed into the selected encode
+        if encoding_config.shared_audio_enable:
+            target_size -= self.get_audio_size()
+            if limit_size is not None:
+                limit_size -= self.get_audio_size()
+            output = f"{webm_filename}-video.webm"
+            final_commands.append(self.get_mux(webm_filename=webm_filename))
+            depends_on.append(audio_job)
+
+        return Job(
+            JobType.CRF_SEARCH,
+            command,
+            depends_on=depends_on,
+            options={
+                "output": output,
+                "final_commands": final_commands,
+                "min_crf": min_crf,
+                "max_crf": max_crf,
+                "target_size": target_size,
+                "limit_size": limit_size,
+                "tolerance": encoding_config.crf_search_tolerance,
+            },
+        )
+
     # Build audio filtergraph for encodes
+    # With a loudness job in our plan, the encodes read the filtergraph that the job writes
     def get_audio_filters(self) -> str:
+        if self.loudnorm_job is not None:
+            return f"-filter_script:a {self.loudnorm_job.options['filter_script']}"
+
+        if self.loudnorm_filter is None:
+            self.loudnorm_filter = LoudnormFilter.from_seek(self.seek)
+
         audio_filters = []
         self.source_file.apply_audio_resampling(audio_filters)
         audio_filters.append(self.loudnorm_filter.get_normalization_filter())
@@ -178,6 +575,37 @@ class EncodeWebM:
         ) if self.seek.new_audio_filter.strip() != "" else None
         return "-af " + ",".join(audio_filters)
 
+    # Loudness measurement deferred to the execution of our plan
+    # With the source analysis, the job analyzes the seek in the same decode and logs the events at its boundaries
+    def get_loudnorm_job(self, analysis=False) -> Job:
+        pre_filters = []
+        self.source_file.apply_audio_resampling(pre_filters)
+        post_filters = (
+            [self.seek.new_audio_filter]
+            if self.seek.new_audio_filter.strip() != ""
+            else []
+        )
+
+        options = {
+            "filter_script": f"{self.seek.output_name}-audio-filters.txt",
+            "pre_filters": pre_filters,
+            "post_filters": post_filters,
+        }
+        if not analysis:
+            return Job(
+                JobType.LOUDNORM,
+                LoudnormFilter.get_first_pass_command(self.seek),
+                options=options,
+            )
+
+        options["output_name"] = self.seek.output_name
+        options["duration"] = self.seek.get_duration()
+        return Job(
+            JobType.ANALYSIS,
+            SourceAnalysis.get_command(self.seek),
+            options=options,
+        )
+
     # Build video filtergraph for encodes
     @staticmethod
     def get_video_filters(config_filter=None) -> str:
@@ -195,6 +623,10 @@ class EncodeWebM:
 
         return " -vf " + ",".join(video_filters)
 
+    # Build filename for the shared audio encode
+    def get_audio_filename(self) -> str:
+        return f"{self.seek.output_name}-audio.ogg"
+
     # Build unique WebM filename for encodes
     def get_webm_filename(
         self, crf=None, cbr_bitrate=None, cbr_max_bitrate=None, filter_name=None
@@ -215,60 +647,258 @@ class EncodeWebM:
 
         return webm_filename
 
-    # Get list of commands in sequence specified by configuration file
+    # Build unique passlog filename for the rate control of a first pass
+    # Concurrent first passes of a seek would otherwise overwrite each other's statistics
+    def get_passlog_filename(
+        self, encoding_mode, crf=None, cbr_bitrate=None, cbr_max_bitrate=None
+    ) -> str:
+        return (
+            self.get_webm_filename(
+                crf=crf, cbr_bitrate=cbr_bitrate, cbr_max_bitrate=cbr_max_bitrate
+            )
+            + f"-{encoding_mode.name.lower()}"
+        )
+
+    # Rungs of the CBR/VBR/CQ ladders, each a first pass with the filters and filenames of its second passes
+    def get_ladder_rungs(
+        self, encoding_config, crfs, cbr_bitrates, cbr_max_bitrates
+    ) -> list[dict]:
+        rungs = []
+
+        for encoding_mode in encoding_config.encoding_modes:
+            if BitrateMode.CBR.name == encoding_mode.upper():
+                for cbr_bitrate in (
+                    cbr_bitrates if cbr_bitrates is not None else [self.cbr_bitrate]
+                ):
+                    for cbr_max_bitrate in (
+                        cbr_max_bitrates
+                        if cbr_max_bitrates is not None
+                        else [self.cbr_max_bitrate]
+                    ):
+                        rungs.append(
+                            {
+                                "encoding_mode": BitrateMode.CBR,
+                                "crf": None,
+                                "cbr_bitrate": cbr_bitrate,
+                                "cbr_max_bitrate": cbr_max_bitrate,
+                                "video_filters": encoding_config.video_filters,
+                                "filename": {
+                                    "cbr_bitrate": cbr_bitrate,
+                                    "cbr_max_bitrate": cbr_max_bitrate,
+                                },
+                            }
+                        )
+            elif encoding_mode.upper() in [BitrateMode.VBR.name, BitrateMode.CQ.name]:
+                bitrate_mode = BitrateMode[encoding_mode.upper()]
+                cbr_bitrate = (
+                    self.cbr_bitrate if bitrate_mode == BitrateMode.CQ else None
+                )
+                for crf, video_filters in self.get_crf_rungs(
+                    encoding_config, bitrate_mode, crfs
+                ):
+                    rungs.append(
+                        {
+                            "encoding_mode": bitrate_mode,
+                            "crf": crf,
+                            "cbr_bitrate": cbr_bitrate,
+                            "cbr_max_bitrate": None,
+                            "video_filters": video_filters,
+                            "filename": {"crf": crf, "cbr_bitrate": cbr_bitrate},
+                        }
+                    )
+
+        for rung in rungs:
+            rung["passlogfile"] = self.get_passlog_filename(
+                rung["encoding_mode"],
+                crf=rung["crf"],
+                cbr_bitrate=rung["cbr_bitrate"],
+                cbr_max_bitrate=rung["cbr_max_bitrate"],
+            )
+
+        return rungs
+
+    # One first pass and one second pass for every rung of the ladders, with the mux of each output if enabled
+    def get_multi_output_jobs(self, encoding_config, rungs, audio_job) -> list[Job]:
+        if not rungs:
+            return []
+
+        outputs = [
+            (
+                rung,
+                filter_value,
+                self.get_webm_filename(filter_name=filter_name, **rung["filename"]),
+            )
+            for rung in rungs
+            for filter_name, filter_value in rung["video_filters"]
+        ]
+
+        first_pass_job = Job(
+            JobType.FIRST_PASS,
+            self.get_multi_first_pass(rungs, threads=encoding_config.threads),
+            options={"outputs": len(rungs)},
+        )
+        second_pass_job = Job(
+            JobType.SECOND_PASS,
+            self.get_multi_second_pass(
+                outputs,
+                threads=encoding_config.threads,
+                limit_size_enable=encoding_config.limit_size_enable,
+                shared_audio_enable=encoding_config.shared_audio_enable,
+            ),
+            depends_on=[first_pass_job],
+            options={"outputs": len(outputs)},
+        )
+        multi_output_jobs = [first_pass_job, second_pass_job]
+
+        for rung, filter_value, webm_filename in outputs:
+            final_job = second_pass_job
+            if encoding_config.shared_audio_enable:
+                final_job = Job(
+                    JobType.MUX,
+                    self.get_mux(webm_filename=webm_filename),
+                    depends_on=[second_pass_job, audio_job],
+                )
+                multi_output_jobs.append(final_job)
+                self.intermediate_files.append(f"{webm_filename}-video.webm")
+
+            # The outputs of a multi-output encode are verified without retries
+            if encoding_config.verify_enable:
+                multi_output_jobs.append(
+                    self.get_verify_job(
+                        encoding_config,
+                        rung["encoding_mode"],
+                        final_job,
+                        video_filters=EncodeWebM.get_video_filters(
+                            config_filter=filter_value
+                        ),
+                        webm_filename=webm_filename,
+                    )
+                )
+
+        return multi_output_jobs
+
+    # CRF rungs of our ladder with their video filters, pruned by trial encodes if enabled
+    def get_crf_rungs(self, encoding_config, encoding_mode, crfs) -> list[tuple]:
+        if not encoding_config.trial_encode_enable:
+            return [(crf, encoding_config.video_filters) for crf in crfs]
+
+        return TrialPredictor(self, encoding_config).get_rungs(
+            encoding_mode, crfs, encoding_config.video_filters
+        )
+
+    # Get list of jobs in sequence specified by configuration file
     # Sequencing - 1. Encoding Mode, 2: CRF, 3: Filter mapping
-    def get_commands(self, encoding_config) -> list[str]:
-        file_commands = []
+    def get_jobs(self, encoding_config) -> list[Job]:
+        file_jobs = []
 
+        # The config may be shared between seeks, we only replace its attributes on a copy
         if len(encoding_config.video_filters) == 0:
-            encoding_config.video_filters.append((None, "No Filters"))
+            encoding_config = copy.copy(encoding_config)
+            encoding_config.video_filters = [(None, "No Filters")]
+
+        if encoding_config.host_profile_enable:
+            encoding_config = self.apply_host_profile(encoding_config)
 
         logging.debug(
-            f"[EncodeWebm.get_commands] encoding_modes: '{encoding_config.encoding_modes}', "
+            f"[EncodeWebm.get_jobs] encoding_modes: '{encoding_config.encoding_modes}', "
             f"crfs: '{encoding_config.crfs}', "
+            f"complexity_probe_enable: '{encoding_config.complexity_probe_enable}', "
             f"include_unfiltered: '{encoding_config.include_unfiltered}', "
             f"video_filters: '{encoding_config.video_filters}'"
         )
 
-        if encoding_config.create_preview:
-            file_commands.append(
-                self.preview_seek(webm_filename=self.get_webm_filename())
+        # The analysis measures loudness in the same decode, in a job of our plan if the measurement is deferred
+        if encoding_config.deferred_loudnorm_enable and self.loudnorm_filter is None:
+            self.loudnorm_job = self.get_loudnorm_job(
+                encoding_config.source_analysis_enable
             )
+            file_jobs.append(self.loudnorm_job)
+        elif encoding_config.source_analysis_enable and self.loudnorm_filter is None:
+            self.analysis = SourceAnalysis.from_seek(self.seek)
+            self.loudnorm_filter = self.analysis.loudnorm_filter
+            for hint in self.analysis.get_boundary_hints(self.seek.get_duration()):
+                logging.info(f"{self.seek.output_name}: {hint}")
 
-        for encoding_mode in encoding_config.encoding_modes:
-            if BitrateMode.CBR.name == encoding_mode.upper():
-                cbr_bitrates = (
-                    encoding_config.cbr_bitrates
-                    if encoding_config.cbr_bitrates is not None
-                    else [self.cbr_bitrate]
+        if encoding_config.create_preview:
+            file_jobs.append(
+                Job(
+                    JobType.PREVIEW,
+                    self.preview_seek(webm_filename=self.get_webm_filename()),
                 )
-                cbr_max_bitrates = (
-                    encoding_config.cbr_max_bitrates
-                    if encoding_config.cbr_max_bitrates is not None
-                    else [self.cbr_max_bitrate]
+            )
+
+        audio_job = None
+        if encoding_config.shared_audio_enable:
+            audio_job = Job(JobType.AUDIO, self.get_audio_pass())
+            file_jobs.append(audio_job)
+
+        crfs = encoding_config.crfs
+        cbr_bitrates = encoding_config.cbr_bitrates
+        cbr_max_bitrates = encoding_config.cbr_max_bitrates
+
+        # The complexity probe picks the keyframe interval and narrows the CRF range
+        if encoding_config.complexity_probe_enable:
+            complexity = Complexity.value_of(self.seek)
+            self.apply_complexity(complexity)
+            crfs = complexity.get_crfs(crfs)
+
+            # Only the CBR targets left blank follow the complexity of the seek
+            if not any(cbr_bitrates):
+                cbr_bitrates = None
+            if not any(cbr_max_bitrates):
+                cbr_max_bitrates = None
+
+        # Multi-output encodes decode the seek once for every rung of the CBR/VBR/CQ ladders
+        if encoding_config.multi_output_enable:
+            file_jobs.extend(
+                self.get_multi_output_jobs(
+                    encoding_config,
+                    self.get_ladder_rungs(
+                        encoding_config, crfs, cbr_bitrates, cbr_max_bitrates
+                    ),
+                    audio_job,
                 )
+            )
+
+        for encoding_mode in encoding_config.encoding_modes:
+            if encoding_config.multi_output_enable and encoding_mode.upper() in [
+                BitrateMode.CBR.name,
+                BitrateMode.VBR.name,
+                BitrateMode.CQ.name,
+            ]:
+                continue
 
-                for cbr_bitrate in cbr_bitrates:
-                    for cbr_max_bitrate in cbr_max_bitrates:
-                        file_commands.append(
+            if BitrateMode.CBR.name == encoding_mode.upper():
+                for cbr_bitrate in (
+                    cbr_bitrates if cbr_bitrates is not None else [self.cbr_bitrate]
+                ):
+                    for cbr_max_bitrate in (
+                        cbr_max_bitrates
+                        if cbr_max_bitrates is not None
+                        else [self.cbr_max_bitrate]
+                    ):
+                        first_pass_job = Job(
+                            JobType.FIRST_PASS,
                             self.get_first_pass(
                                 BitrateMode.CBR,
                                 cbr_bitrate=cbr_bitrate,
                                 cbr_max_bitrate=cbr_max_bitrate,
                                 threads=encoding_config.threads,
-                            )
+                            ),
                         )
+                        file_jobs.append(first_pass_job)
                         for filter_name, filter_value in encoding_config.video_filters:
-                            file_commands.append(
-                                self.get_second_pass(
+                            file_jobs.extend(
+                                self.get_second_pass_jobs(
+                                    encoding_config,
                                     BitrateMode.CBR,
+                                    first_pass_job,
+                                    audio_job,
                                     cbr_bitrate=cbr_bitrate,
                                     cbr_max_bitrate=cbr_max_bitrate,
-                                    threads=encoding_config.threads,
                                     video_filters=EncodeWebM.get_video_filters(
                                         config_filter=filter_value
                                     ),
-                                    limit_size_enable=encoding_config.limit_size_enable,
                                     webm_filename=self.get_webm_filename(
                                         cbr_bitrate=cbr_bitrate,
                                         cbr_max_bitrate=cbr_max_bitrate,
@@ -277,44 +907,54 @@ class EncodeWebM:
                                 )
                             )
             elif BitrateMode.VBR.name == encoding_mode.upper():
-                for crf in encoding_config.crfs:
-                    file_commands.append(
+                for crf, video_filters in self.get_crf_rungs(
+                    encoding_config, BitrateMode.VBR, crfs
+                ):
+                    first_pass_job = Job(
+                        JobType.FIRST_PASS,
                         self.get_first_pass(
                             BitrateMode.VBR, crf=crf, threads=encoding_config.threads
-                        )
+                        ),
                     )
-                    for filter_name, filter_value in encoding_config.video_filters:
-                        file_commands.append(
-                            self.get_second_pass(
+                    file_jobs.append(first_pass_job)
+                    for filter_name, filter_value in video_filters:
+                        file_jobs.extend(
+                            self.get_second_pass_jobs(
+                                encoding_config,
                                 BitrateMode.VBR,
+                                first_pass_job,
+                                audio_job,
                                 crf=crf,
-                                threads=encoding_config.threads,
                                 video_filters=EncodeWebM.get_video_filters(
                                     config_filter=filter_value
                                 ),
-                                limit_size_enable=encoding_config.limit_size_enable,
                                 webm_filename=self.get_webm_filename(
                                     crf=crf, filter_name=filter_name
                                 ),
                             )
                         )
             elif BitrateMode.CQ.name == encoding_mode.upper():
-                for crf in encoding_config.crfs:
-                    file_commands.append(
+                for crf, video_filters in self.get_crf_rungs(
+                    encoding_config, BitrateMode.CQ, crfs
+                ):
+                    first_pass_job = Job(
+                        JobType.FIRST_PASS,
                         self.get_first_pass(
                             BitrateMode.CQ, crf=crf, threads=encoding_config.threads
-                        )
+                        ),
                     )
-                    for filter_name, filter_value in encoding_config.video_filters:
-                        file_commands.append(
-                            self.get_second_pass(
+                    file_jobs.append(first_pass_job)
+                    for filter_name, filter_value in video_filters:
+                        file_jobs.extend(
+                            self.get_second_pass_jobs(
+                                encoding_config,
                                 BitrateMode.CQ,
+                                first_pass_job,
+                                audio_job,
                                 crf=crf,
-                                threads=encoding_config.threads,
                                 video_filters=EncodeWebM.get_video_filters(
                                     config_filter=filter_value
                                 ),
-                                limit_size_enable=encoding_config.limit_size_enable,
                                 webm_filename=self.get_webm_filename(
                                     crf=crf,
                                     cbr_bitrate=self.cbr_bitrate,
@@ -322,9 +962,67 @@ class EncodeWebM:
                                 ),
                             )
                         )
+            elif encoding_mode.upper() in [
+                BitrateMode.VBR_TARGET.name,
+                BitrateMode.CQ_TARGET.name,
+            ]:
+                # A single first pass in the middle of the CRF range is shared by every trial
+                bitrate_mode = BitrateMode[encoding_mode.upper()]
+                min_crf = min(int(crf) for crf in crfs)
+                max_crf = max(int(crf) for crf in crfs)
+                passlogfile = self.get_passlog_filename(
+                    bitrate_mode,
+                    crf=(min_crf + max_crf) // 2,
+                    cbr_bitrate=self.cbr_bitrate,
+                )
+                first_pass_job = Job(
+                    JobType.FIRST_PASS,
+                    self.get_first_pass(
+                        bitrate_mode,
+                        crf=(min_crf + max_crf) // 2,
+                        cbr_bitrate=self.cbr_bitrate,
+                        threads=encoding_config.threads,
+                        passlogfile=passlogfile,
+                    ),
+                )
+                file_jobs.append(first_pass_job)
+                for filter_name, filter_value in encoding_config.video_filters:
+                    file_jobs.append(
+                        self.get_crf_search_job(
+                            encoding_config,
+                            bitrate_mode,
+                            first_pass_job,
+                            audio_job,
+                            min_crf,
+                            max_crf,
+                            video_filters=EncodeWebM.get_video_filters(
+                                config_filter=filter_value
+                            ),
+                            filter_name=filter_name,
+                            passlogfile=passlogfile,
+                        )
+                    )
 
-        logging.debug(
-            f"[EncodeWebm.get_commands] # of file_commands: '{len(file_commands)}'"
-        )
+        # Source resolution for the memory estimates of the scheduler
+        for job in file_jobs:
+            if job.job_type.frames > 0:
+                job.options["width"] = self.source_file.metadata.width
+                job.options["height"] = self.source_file.metadata.height
+
+        # Jobs that filter the audio wait for the loudness job
+        if self.loudnorm_job is not None:
+            audio_job_types = [JobType.PREVIEW, JobType.AUDIO]
+            if not encoding_config.shared_audio_enable:
+                audio_job_types += [JobType.SECOND_PASS, JobType.CRF_SEARCH]
+
+            for job in file_jobs:
+                if job.job_type in audio_job_types:
+                    job.depends_on.append(self.loudnorm_job)
+
+        # Intermediates of the shared audio are removed once the outputs of the seek are complete
+        if audio_job is not None:
+            file_jobs.append(self.get_cleanup_job(file_jobs))
+
+        logging.debug(f"[EncodeWebm.get_jobs] # of file_jobs: '{len(file_jobs)}'")
 
-        return file_commands
+        return file_jobs
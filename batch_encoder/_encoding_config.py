@@ -1,5 +1,7 @@
 from ._bitrate_mode import BitrateMode
 
+import configparser
+
 
 class EncodingConfig:
     # Config keys
@@ -13,6 +15,41 @@ class EncodingConfig:
     config_alternate_source_files = "AlternateSourceFiles"
     config_create_preview = "CreatePreview"
     config_include_unfiltered = "IncludeUnfiltered"
+    config_shared_audio_enable = "SharedAudioEnable"
+    config_complexity_probe_enable = "ComplexityProbeEnable"
+    config_target_file_size = "TargetFileSize"
+    config_crf_search_tolerance = "CRFSearchTolerance"
+    config_proxy_preview_enable = "ProxyPreviewEnable"
+    config_trial_encode_enable = "TrialEncodeEnable"
+    config_trial_quality_floor = "TrialQualityFloor"
+    config_deferred_loudnorm_enable = "DeferredLoudnormEnable"
+    config_workers = "Workers"
+    config_daemon_port = "DaemonPort"
+    config_watch_interval = "WatchInterval"
+    config_watch_settle_time = "WatchSettleTime"
+    config_process_priority_enable = "ProcessPriorityEnable"
+    config_max_load_average = "MaxLoadAverage"
+    config_min_available_memory = "MinAvailableMemory"
+    config_max_io_pressure = "MaxIOPressure"
+    config_memory_budget = "MemoryBudget"
+    config_multi_output_enable = "MultiOutputEnable"
+    config_metrics_file = "MetricsFile"
+    config_verify_enable = "VerifyEnable"
+    config_verify_retries = "VerifyRetries"
+    config_job_retries = "JobRetries"
+    config_retry_backoff = "RetryBackoff"
+    config_stall_timeout = "StallTimeout"
+    config_scratch_directory = "ScratchDirectory"
+    config_passlog_directory = "PasslogDirectory"
+    config_min_free_space = "MinFreeSpace"
+    config_source_cache_directory = "SourceCacheDirectory"
+    config_source_cache_size = "SourceCacheSize"
+    config_locator_min_confidence = "LocatorMinConfidence"
+    config_source_analysis_enable = "SourceAnalysisEnable"
+    config_host_profile_enable = "HostProfileEnable"
+    config_max_processes = "MaxProcesses"
+    config_probe_timeout = "ProbeTimeout"
+    config_intermediate_directory = "IntermediateDirectory"
 
     # Default Config keys
     config_default_video_stream = "DefaultVideoStream"
@@ -29,6 +66,41 @@ class EncodingConfig:
     default_alternate_source_files = False
     default_create_preview = False
     default_include_unfiltered = True
+    default_shared_audio_enable = False
+    default_complexity_probe_enable = False
+    default_target_file_size = ""
+    default_crf_search_tolerance = 0.05
+    default_proxy_preview_enable = False
+    default_trial_encode_enable = False
+    default_trial_quality_floor = ""
+    default_deferred_loudnorm_enable = True
+    default_workers = 1
+    default_daemon_port = 8765
+    default_watch_interval = 10
+    default_watch_settle_time = 30
+    default_process_priority_enable = True
+    default_max_load_average = ""
+    default_min_available_memory = ""
+    default_max_io_pressure = ""
+    default_memory_budget = ""
+    default_multi_output_enable = False
+    default_metrics_file = ""
+    default_verify_enable = False
+    default_verify_retries = 0
+    default_job_retries = 1
+    default_retry_backoff = 60
+    default_stall_timeout = 300
+    default_scratch_directory = ""
+    default_passlog_directory = ""
+    default_min_free_space = 1024
+    default_source_cache_directory = ""
+    default_source_cache_size = 102400
+    default_locator_min_confidence = 0.5
+    default_source_analysis_enable = False
+    default_host_profile_enable = True
+    default_max_processes = 0
+    default_probe_timeout = 120
+    default_intermediate_directory = ""
     default_video_filters = {
         "filtered": "hqdn3d=0:0:3:3,gradfun,unsharp",
         "lightdenoise": "hqdn3d=0:0:3:3",
@@ -48,6 +120,41 @@ class EncodingConfig:
         alternate_source_files,
         create_preview,
         include_unfiltered,
+        shared_audio_enable,
+        complexity_probe_enable,
+        target_file_size,
+        crf_search_tolerance,
+        proxy_preview_enable,
+        trial_encode_enable,
+        trial_quality_floor,
+        deferred_loudnorm_enable,
+        workers,
+        daemon_port,
+        watch_interval,
+        watch_settle_time,
+        process_priority_enable,
+        max_load_average,
+        min_available_memory,
+        max_io_pressure,
+        memory_budget,
+        multi_output_enable,
+        metrics_file,
+        verify_enable,
+        verify_retries,
+        job_retries,
+        retry_backoff,
+        stall_timeout,
+        scratch_directory,
+        passlog_directory,
+        min_free_space,
+        source_cache_directory,
+        source_cache_size,
+        locator_min_confidence,
+        source_analysis_enable,
+        host_profile_enable,
+        max_processes,
+        probe_timeout,
+        intermediate_directory,
         video_filters,
         default_video_stream,
         default_audio_stream,
@@ -62,6 +169,41 @@ class EncodingConfig:
         self.alternate_source_files = alternate_source_files
         self.create_preview = create_preview
         self.include_unfiltered = include_unfiltered
+        self.shared_audio_enable = shared_audio_enable
+        self.complexity_probe_enable = complexity_probe_enable
+        self.target_file_size = target_file_size
+        self.crf_search_tolerance = crf_search_tolerance
+        self.proxy_preview_enable = proxy_preview_enable
+        self.trial_encode_enable = trial_encode_enable
+        self.trial_quality_floor = trial_quality_floor
+        self.deferred_loudnorm_enable = deferred_loudnorm_enable
+        self.workers = workers
+        self.daemon_port = daemon_port
+        self.watch_interval = watch_interval
+        self.watch_settle_time = watch_settle_time
+        self.process_priority_enable = process_priority_enable
+        self.max_load_average = max_load_average
+        self.min_available_memory = min_available_memory
+        self.max_io_pressure = max_io_pressure
+        self.memory_budget = memory_budget
+        self.multi_output_enable = multi_output_enable
+        self.metrics_file = metrics_file
+        self.verify_enable = verify_enable
+        self.verify_retries = verify_retries
+        self.job_retries = job_retries
+        self.retry_backoff = retry_backoff
+        self.stall_timeout = stall_timeout
+        self.scratch_directory = scratch_directory
+        self.passlog_directory = passlog_directory
+        self.min_free_space = min_free_space
+        self.source_cache_directory = source_cache_directory
+        self.source_cache_size = source_cache_size
+        self.locator_min_confidence = locator_min_confidence
+        self.source_analysis_enable = source_analysis_enable
+        self.host_profile_enable = host_profile_enable
+        self.max_processes = max_processes
+        self.probe_timeout = probe_timeout
+        self.intermediate_directory = intermediate_directory
         self.video_filters = video_filters
         self.default_video_stream = default_video_stream
         self.default_audio_stream = default_audio_stream
@@ -129,6 +271,181 @@ class EncodingConfig:
             EncodingConfig.config_include_unfiltered,
             fallback=EncodingConfig.default_include_unfiltered,
         )
+        shared_audio_enable = config.getboolean(
+            "Encoding",
+            EncodingConfig.config_shared_audio_enable,
+            fallback=EncodingConfig.default_shared_audio_enable,
+        )
+        complexity_probe_enable = config.getboolean(
+            "Encoding",
+            EncodingConfig.config_complexity_probe_enable,
+            fallback=EncodingConfig.default_complexity_probe_enable,
+        )
+        target_file_size = config["Encoding"].get(
+            EncodingConfig.config_target_file_size,
+            EncodingConfig.default_target_file_size,
+        )
+        crf_search_tolerance = float(
+            config["Encoding"].get(
+                EncodingConfig.config_crf_search_tolerance,
+                EncodingConfig.default_crf_search_tolerance,
+            )
+        )
+        proxy_preview_enable = config.getboolean(
+            "Encoding",
+            EncodingConfig.config_proxy_preview_enable,
+            fallback=EncodingConfig.default_proxy_preview_enable,
+        )
+        trial_encode_enable = config.getboolean(
+            "Encoding",
+            EncodingConfig.config_trial_encode_enable,
+            fallback=EncodingConfig.default_trial_encode_enable,
+        )
+        trial_quality_floor = config["Encoding"].get(
+            EncodingConfig.config_trial_quality_floor,
+            EncodingConfig.default_trial_quality_floor,
+        )
+        deferred_loudnorm_enable = config.getboolean(
+            "Encoding",
+            EncodingConfig.config_deferred_loudnorm_enable,
+            fallback=EncodingConfig.default_deferred_loudnorm_enable,
+        )
+        workers = int(
+            config["Encoding"].get(
+                EncodingConfig.config_workers, EncodingConfig.default_workers
+            )
+        )
+        daemon_port = int(
+            config["Encoding"].get(
+                EncodingConfig.config_daemon_port, EncodingConfig.default_daemon_port
+            )
+        )
+        watch_interval = int(
+            config["Encoding"].get(
+                EncodingConfig.config_watch_interval,
+                EncodingConfig.default_watch_interval,
+            )
+        )
+        watch_settle_time = int(
+            config["Encoding"].get(
+                EncodingConfig.config_watch_settle_time,
+                EncodingConfig.default_watch_settle_time,
+            )
+        )
+        process_priority_enable = config.getboolean(
+            "Encoding",
+            EncodingConfig.config_process_priority_enable,
+            fallback=EncodingConfig.default_process_priority_enable,
+        )
+        max_load_average = config["Encoding"].get(
+            EncodingConfig.config_max_load_average,
+            EncodingConfig.default_max_load_average,
+        )
+        min_available_memory = config["Encoding"].get(
+            EncodingConfig.config_min_available_memory,
+            EncodingConfig.default_min_available_memory,
+        )
+        max_io_pressure = config["Encoding"].get(
+            EncodingConfig.config_max_io_pressure,
+            EncodingConfig.default_max_io_pressure,
+        )
+        memory_budget = config["Encoding"].get(
+            EncodingConfig.config_memory_budget,
+            EncodingConfig.default_memory_budget,
+        )
+        multi_output_enable = config.getboolean(
+            "Encoding",
+            EncodingConfig.config_multi_output_enable,
+            fallback=EncodingConfig.default_multi_output_enable,
+        )
+        metrics_file = config["Encoding"].get(
+            EncodingConfig.config_metrics_file,
+            EncodingConfig.default_metrics_file,
+        )
+        verify_enable = config.getboolean(
+            "Encoding",
+            EncodingConfig.config_verify_enable,
+            fallback=EncodingConfig.default_verify_enable,
+        )
+        verify_retries = int(
+            config["Encoding"].get(
+                EncodingConfig.config_verify_retries,
+                EncodingConfig.default_verify_retries,
+            )
+        )
+        job_retries = int(
+            config["Encoding"].get(
+                EncodingConfig.config_job_retries, EncodingConfig.default_job_retries
+            )
+        )
+        retry_backoff = int(
+            config["Encoding"].get(
+                EncodingConfig.config_retry_backoff,
+                EncodingConfig.default_retry_backoff,
+            )
+        )
+        stall_timeout = int(
+            config["Encoding"].get(
+                EncodingConfig.config_stall_timeout,
+                EncodingConfig.default_stall_timeout,
+            )
+        )
+        scratch_directory = config["Encoding"].get(
+            EncodingConfig.config_scratch_directory,
+            EncodingConfig.default_scratch_directory,
+        )
+        passlog_directory = config["Encoding"].get(
+            EncodingConfig.config_passlog_directory,
+            EncodingConfig.default_passlog_directory,
+        )
+        min_free_space = int(
+            config["Encoding"].get(
+                EncodingConfig.config_min_free_space,
+                EncodingConfig.default_min_free_space,
+            )
+        )
+        source_cache_directory = config["Encoding"].get(
+            EncodingConfig.config_source_cache_directory,
+            EncodingConfig.default_source_cache_directory,
+        )
+        source_cache_size = int(
+            config["Encoding"].get(
+                EncodingConfig.config_source_cache_size,
+                EncodingConfig.default_source_cache_size,
+            )
+        )
+        locator_min_confidence = float(
+            config["Encoding"].get(
+                EncodingConfig.config_locator_min_confidence,
+                EncodingConfig.default_locator_min_confidence,
+            )
+        )
+        source_analysis_enable = config.getboolean(
+            "Encoding",
+            EncodingConfig.config_source_analysis_enable,
+            fallback=EncodingConfig.default_source_analysis_enable,
+        )
+        host_profile_enable = config.getboolean(
+            "Encoding",
+            EncodingConfig.config_host_profile_enable,
+            fallback=EncodingConfig.default_host_profile_enable,
+        )
+        max_processes = int(
+            config["Encoding"].get(
+                EncodingConfig.config_max_processes,
+                EncodingConfig.default_max_processes,
+            )
+        )
+        probe_timeout = int(
+            config["Encoding"].get(
+                EncodingConfig.config_probe_timeout,
+                EncodingConfig.default_probe_timeout,
+            )
+        )
+        intermediate_directory = config["Encoding"].get(
+            EncodingConfig.config_intermediate_directory,
+            EncodingConfig.default_intermediate_directory,
+        )
         video_filters = config.items(
             "VideoFilters", EncodingConfig.default_video_filters
         )
@@ -151,11 +468,103 @@ class EncodingConfig:
             alternate_source_files,
             create_preview,
             include_unfiltered,
+            shared_audio_enable,
+            complexity_probe_enable,
+            target_file_size,
+            crf_search_tolerance,
+            proxy_preview_enable,
+            trial_encode_enable,
+            trial_quality_floor,
+            deferred_loudnorm_enable,
+            workers,
+            daemon_port,
+            watch_interval,
+            watch_settle_time,
+            process_priority_enable,
+            max_load_average,
+            min_available_memory,
+            max_io_pressure,
+            memory_budget,
+            multi_output_enable,
+            metrics_file,
+            verify_enable,
+            verify_retries,
+            job_retries,
+            retry_backoff,
+            stall_timeout,
+            scratch_directory,
+            passlog_directory,
+            min_free_space,
+            source_cache_directory,
+            source_cache_size,
+            locator_min_confidence,
+            source_analysis_enable,
+            host_profile_enable,
+            max_processes,
+            probe_timeout,
+            intermediate_directory,
             video_filters,
             default_video_stream,
             default_audio_stream,
         )
 
+    # Config holding our default values, written when the config file does not exist
+    @staticmethod
+    def get_default_config() -> configparser.ConfigParser:
+        config = configparser.ConfigParser()
+        config["Encoding"] = {
+            EncodingConfig.config_allowed_filetypes: EncodingConfig.default_allowed_filetypes,
+            EncodingConfig.config_encoding_modes: EncodingConfig.default_encoding_modes,
+            EncodingConfig.config_crfs: EncodingConfig.default_crfs,
+            EncodingConfig.config_cbr_bitrates: EncodingConfig.default_cbr_bitrates,
+            EncodingConfig.config_cbr_max_bitrates: EncodingConfig.default_cbr_max_bitrates,
+            EncodingConfig.config_threads: EncodingConfig.default_threads,
+            EncodingConfig.config_limit_size_enable: EncodingConfig.default_limit_size_enable,
+            EncodingConfig.config_alternate_source_files: EncodingConfig.default_alternate_source_files,
+            EncodingConfig.config_create_preview: EncodingConfig.default_create_preview,
+            EncodingConfig.config_include_unfiltered: EncodingConfig.default_include_unfiltered,
+            EncodingConfig.config_shared_audio_enable: EncodingConfig.default_shared_audio_enable,
+            EncodingConfig.config_complexity_probe_enable: EncodingConfig.default_complexity_probe_enable,
+            EncodingConfig.config_target_file_size: EncodingConfig.default_target_file_size,
+            EncodingConfig.config_crf_search_tolerance: EncodingConfig.default_crf_search_tolerance,
+            EncodingConfig.config_proxy_preview_enable: EncodingConfig.default_proxy_preview_enable,
+            EncodingConfig.config_trial_encode_enable: EncodingConfig.default_trial_encode_enable,
+            EncodingConfig.config_trial_quality_floor: EncodingConfig.default_trial_quality_floor,
+            EncodingConfig.config_deferred_loudnorm_enable: EncodingConfig.default_deferred_loudnorm_enable,
+            EncodingConfig.config_workers: EncodingConfig.default_workers,
+            EncodingConfig.config_daemon_port: EncodingConfig.default_daemon_port,
+            EncodingConfig.config_watch_interval: EncodingConfig.default_watch_interval,
+            EncodingConfig.config_watch_settle_time: EncodingConfig.default_watch_settle_time,
+            EncodingConfig.config_process_priority_enable: EncodingConfig.default_process_priority_enable,
+            EncodingConfig.config_max_load_average: EncodingConfig.default_max_load_average,
+            EncodingConfig.config_min_available_memory: EncodingConfig.default_min_available_memory,
+            EncodingConfig.config_max_io_pressure: EncodingConfig.default_max_io_pressure,
+            EncodingConfig.config_memory_budget: EncodingConfig.default_memory_budget,
+            EncodingConfig.config_multi_output_enable: EncodingConfig.default_multi_output_enable,
+            EncodingConfig.config_metrics_file: EncodingConfig.default_metrics_file,
+            EncodingConfig.config_verify_enable: EncodingConfig.default_verify_enable,
+            EncodingConfig.config_verify_retries: EncodingConfig.default_verify_retries,
+            EncodingConfig.config_job_retries: EncodingConfig.default_job_retries,
+            EncodingConfig.config_retry_backoff: EncodingConfig.default_retry_backoff,
+            EncodingConfig.config_stall_timeout: EncodingConfig.default_stall_timeout,
+            EncodingConfig.config_scratch_directory: EncodingConfig.default_scratch_directory,
+            EncodingConfig.config_passlog_directory: EncodingConfig.default_passlog_directory,
+            EncodingConfig.config_min_free_space: EncodingConfig.default_min_free_space,
+            EncodingConfig.config_source_cache_directory: EncodingConfig.default_source_cache_directory,
+            EncodingConfig.config_source_cache_size: EncodingConfig.default_source_cache_size,
+            EncodingConfig.config_locator_min_confidence: EncodingConfig.default_locator_min_confidence,
+            EncodingConfig.config_source_analysis_enable: EncodingConfig.default_source_analysis_enable,
+            EncodingConfig.config_host_profile_enable: EncodingConfig.default_host_profile_enable,
+            EncodingConfig.config_max_processes: EncodingConfig.default_max_processes,
+            EncodingConfig.config_probe_timeout: EncodingConfig.default_probe_timeout,
+            EncodingConfig.config_intermediate_directory: EncodingConfig.default_intermediate_directory,
+            EncodingConfig.config_default_video_stream: "",
+            EncodingConfig.config_default_audio_stream: "",
+        }
+        config["VideoFilters"] = EncodingConfig.default_video_filters
+
+        return config
+
     def get_default_stream(self, stream_type):
         if stream_type == "video":
             return self.default_video_stream
@@ -0,0 +1,73 @@
+from ._crf_search import CRFSearch
+from ._job import JobError
+from ._job_type import JobType
+from ._loudnorm_filter import LoudnormFilter
+from ._output_verifier import OutputVerifier
+from ._process_runner import process_runner
+from ._source_analysis import SourceAnalysis
+from ._tracer import tracer
+
+import logging
+import os
+import subprocess
+
+
+# Execute a single job of our plan in its working directory
+# Commands run through the resource governor of the scheduler if there is one
+class Executor:
+    # Each job is a span on the timeline of its worker thread
+    @staticmethod
+    def run_job(job, governor=None) -> bool:
+        with tracer.span(job.job_type.value, job=job.key, cwd=job.cwd):
+            return Executor.run_command(job, governor)
+
+    @staticmethod
+    def run_command(job, governor=None) -> bool:
+        logging.debug(
+            f"[Executor.run_command] key: '{job.key}', type: '{job.job_type.value}'"
+        )
+
+        try:
+            if job.job_type == JobType.LOUDNORM:
+                LoudnormFilter.from_job(job, governor)
+            elif job.job_type == JobType.ANALYSIS:
+                SourceAnalysis.from_job(job, governor)
+            elif job.job_type == JobType.CRF_SEARCH:
+                CRFSearch.from_job(job, governor).run()
+            elif job.job_type == JobType.VERIFY:
+                OutputVerifier.from_job(job, governor).run()
+            elif job.job_type == JobType.CLEANUP:
+                Executor.remove_files(job)
+            else:
+                returncode = (
+                    governor.call(
+                        job.resolve(job.command), job.job_type, cwd=job.cwd, job=job
+                    )
+                    if governor is not None
+                    else process_runner.run(
+                        job.resolve(job.command), cwd=job.cwd, check=False
+                    ).returncode
+                )
+                if returncode != 0:
+                    logging.error(f"Job '{job.key}' exited with status {returncode}")
+                    return False
+        # Unreadable measurements are retried like failed processes
+        except (OSError, subprocess.CalledProcessError, ValueError) as e:
+            logging.error(f"Job '{job.key}' failed: {e}")
+            return False
+        # Invalid plans and failed verifications fail the same way on every attempt
+        except (JobError, KeyError) as e:
+            logging.error(f"Job '{job.key}' failed: {e}")
+            job.retryable = False
+            return False
+
+        return True
+
+    # Remove the intermediate files of a cleanup job, files that are already gone are skipped
+    @staticmethod
+    def remove_files(job) -> None:
+        for file in job.options["files"]:
+            if os.path.isfile(job.get_intermediate_path(file)):
+                os.remove(job.get_intermediate_path(file))
+
+        logging.debug(f"[Executor.remove_files] files: '{job.options['files']}'")
@@ -0,0 +1,47 @@
+from ._process_runner import process_runner
+
+import logging
+
+
+# Fast proxy encodes of the video filter candidates for a seek
+# Proxies drop every other frame and use a fast encoder so the filter choice can be made before encoding the ladder
+class FilterProxy:
+    def __init__(self, seek):
+        self.seek = seek
+
+    # Build proxy filename for the video filter
+    def get_proxy_filename(self, filter_name) -> str:
+        return f"{self.seek.output_name}-proxy-{filter_name or 'unfiltered'}.mp4"
+
+    # Proxy encode with the video filter
+    def get_proxy(self, filter_name, filter_value) -> str:
+        video_filters = []
+        if filter_value is not None and filter_value != "No Filters":
+            video_filters.append(filter_value)
+        video_filters.append("framestep=2")
+
+        return (
+            f"ffmpeg -v error {self.seek.get_seek_string()} "
+            f"-map 0:v:{self.seek.source_file.selected_video_stream} "
+            f'-vf "{",".join(video_filters)}" '
+            f"-c:v libx264 -preset ultrafast -crf 16 -threads 2 "
+            f"-an -sn -dn -f mp4 -y {self.get_proxy_filename(filter_name)}"
+        )
+
+    # Encode the proxies of our video filters in parallel
+    def encode(self, video_filters) -> list[str]:
+        commands = [
+            self.get_proxy(filter_name, filter_value)
+            for filter_name, filter_value in video_filters
+        ]
+        proxy_filenames = [
+            self.get_proxy_filename(filter_name) for filter_name, _ in video_filters
+        ]
+
+        logging.info(f"Encoding {len(commands)} filter proxies...")
+        results = process_runner.run_all(commands)
+        for proxy_filename, result in zip(proxy_filenames, results):
+            if isinstance(result, Exception):
+                logging.error(f"Proxy '{proxy_filename}' failed: {result}")
+
+        return proxy_filenames
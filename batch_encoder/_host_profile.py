@@ -0,0 +1,98 @@
+from appdirs import AppDirs
+
+import json
+import logging
+import os
+import socket
+
+
+# The fastest encoder threading settings of this host for each resolution class and number of workers
+# Threads and row multithreading do not change the output of an encode, tile columns are not part of the profile
+class HostProfile:
+    # Resolution classes of the calibration, by height
+    resolution_classes = [1080, 720, 576, 480]
+
+    # Host profiles by file, loaded once per process
+    host_profiles = {}
+
+    def __init__(self, file, host, cpu_count, classes=None):
+        self.file = file
+        self.host = host
+        self.cpu_count = cpu_count
+        # Height -> workers -> {'threads', 'row_mt', 'fps'}
+        self.classes = classes if classes is not None else {}
+
+    # Profiles are kept per host name, so that hosts sharing a user directory keep their own settings
+    @staticmethod
+    def get_default_file() -> str:
+        dirs = AppDirs("batch_encoder", "AnimeThemes")
+        return os.path.join(
+            dirs.user_data_dir, f"host_profile-{socket.gethostname()}.json"
+        )
+
+    @classmethod
+    def load(cls, file=None):
+        file = file or HostProfile.get_default_file()
+        if file in HostProfile.host_profiles:
+            return HostProfile.host_profiles[file]
+
+        host_profile = None
+        if os.path.isfile(file):
+            with open(file, mode="r", encoding="utf8") as f:
+                profile = json.load(f)
+            host_profile = cls(
+                file,
+                profile["host"],
+                profile["cpu_count"],
+                {
+                    int(height): {
+                        int(workers): settings
+                        for workers, settings in workers_settings.items()
+                    }
+                    for height, workers_settings in profile["classes"].items()
+                },
+            )
+
+        logging.debug(
+            f"[HostProfile.load] file: '{file}', loaded: '{host_profile is not None}'"
+        )
+
+        HostProfile.host_profiles[file] = host_profile
+        return host_profile
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.file), exist_ok=True)
+        file_tmp = self.file + ".tmp"
+        with open(file_tmp, mode="w", encoding="utf8") as f:
+            json.dump(
+                {
+                    "host": self.host,
+                    "cpu_count": self.cpu_count,
+                    "classes": self.classes,
+                },
+                f,
+                indent=2,
+            )
+        os.replace(file_tmp, self.file)
+        HostProfile.host_profiles[self.file] = self
+
+    # Settings of the nearest resolution class at or below the height,
+    # measured with the most workers that do not exceed our number of workers
+    def get_settings(self, height, workers) -> dict | None:
+        if not self.classes:
+            return None
+
+        heights = [h for h in self.classes if h <= height] or [min(self.classes)]
+        workers_settings = self.classes[max(heights)]
+        measured_workers = [w for w in workers_settings if w <= workers] or [
+            min(workers_settings)
+        ]
+        settings = workers_settings[max(measured_workers)]
+
+        logging.debug(
+            f"[HostProfile.get_settings] height: '{height}', "
+            f"workers: '{workers}', "
+            f"settings: '{settings}'"
+        )
+
+        return settings
@@ -0,0 +1,95 @@
+from ._job_status import JobStatus
+from ._job_type import JobType
+
+import os
+import re
+import shlex
+
+
+# Failure of a job that fails the same way on every attempt, such as an invalid plan or a failed verification
+class JobError(Exception):
+    pass
+
+
+# A single step of our plan
+# Jobs run their command after the jobs they depend on, options carry the data of stages that are not plain commands
+class Job:
+    # The shared audio and the video-only encodes of a seek, the intermediates that our scheduler may place elsewhere
+    intermediate_pattern = re.compile(
+        r"(?<![^\s])([^\s\"']+-(?:video\.webm|audio\.ogg))(?![^\s])"
+    )
+
+    def __init__(self, job_type, command, depends_on=None, options=None):
+        self.id = None
+        self.job_type = job_type
+        self.command = command
+        self.depends_on = depends_on if depends_on is not None else []
+        self.options = options if options is not None else {}
+
+        # Execution state, not written to the plan file
+        self.key = None
+        self.cwd = None
+        self.priority = 0
+        self.status = JobStatus.QUEUED
+        self.peak_rss = None
+        self.attempts = 0
+        self.retry_time = None
+        self.retryable = True
+        self.passlog_dir = None
+        self.intermediate_dir = None
+
+    # Resolve a path of the job against its working directory
+    def get_path(self, path) -> str:
+        return os.path.join(self.cwd, path) if self.cwd is not None else path
+
+    # Resolve an intermediate file in the intermediate directory of the job if it has one,
+    # other paths against its working directory
+    def get_intermediate_path(self, path) -> str:
+        if self.intermediate_dir is not None and Job.intermediate_pattern.fullmatch(
+            path
+        ):
+            return os.path.join(self.intermediate_dir, path)
+
+        return self.get_path(path)
+
+    # Place the passlogs of a command in the passlog directory of the job if it has one,
+    # and its intermediate files in the intermediate directory of the job if it has one
+    def resolve(self, command) -> str:
+        if self.passlog_dir is not None:
+            command = re.sub(
+                r"-passlogfile (\S+)",
+                lambda match: "-passlogfile "
+                + shlex.quote(os.path.join(self.passlog_dir, match.group(1))),
+                command,
+            )
+
+        if self.intermediate_dir is not None:
+            command = Job.intermediate_pattern.sub(
+                lambda match: shlex.quote(
+                    os.path.join(self.intermediate_dir, match.group(1))
+                ),
+                command,
+            )
+
+        return command
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "type": self.job_type.value,
+            "command": self.command,
+            "depends_on": [job.id for job in self.depends_on],
+            "options": self.options,
+        }
+
+    @classmethod
+    def from_dict(cls, job_dict, jobs_by_id):
+        job = cls(
+            JobType(job_dict["type"]),
+            job_dict["command"],
+            depends_on=[jobs_by_id[job_id] for job_id in job_dict["depends_on"]],
+            options=job_dict["options"],
+        )
+        job.id = job_dict["id"]
+
+        return job
@@ -0,0 +1,20 @@
+from enum import Enum
+
+
+# The Job Status Enumerated List
+# Job Status tracks a job of our plan through the scheduler
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    # Jobs depending on a failed job are cancelled instead of running on its missing outputs
+    CANCELLED = "cancelled"
+
+    # Whether a job with this status will not run again
+    def is_finished(self) -> bool:
+        return self in [JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED]
+
+    # Whether jobs depending on a job with this status are cancelled
+    def is_failed(self) -> bool:
+        return self in [JobStatus.FAILED, JobStatus.CANCELLED]
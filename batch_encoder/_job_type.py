@@ -0,0 +1,34 @@
+from enum import Enum
+
+
+# The Job Type Enumerated List
+# Job Type determines how the executor runs a job of our plan,
+# the CPU (nice) and I/O (best-effort level) priorities of its processes
+# and the number of decoded frames its encoder holds in memory
+class JobType(Enum):
+    def __new__(cls, value, nice, io_priority, frames):
+        obj = object.__new__(cls)
+        obj._value_ = value
+        obj.nice = nice
+        obj.io_priority = io_priority
+        obj.frames = frames
+        return obj
+
+    # Plain command, used for command files written by older versions
+    COMMAND = ("command", 0, 4, 120)
+    LOUDNORM = ("loudnorm", 5, 4, 0)
+    # Analyses measure loudness in the same decode as the detection filters of the seek
+    ANALYSIS = ("analysis", 5, 4, 0)
+    # Previews are waited on by the operator
+    PREVIEW = ("preview", 0, 0, 0)
+    AUDIO = ("audio", 5, 4, 0)
+    # First passes only produce statistics and give way to everything else
+    FIRST_PASS = ("first_pass", 10, 7, 40)
+    # Second passes hold the lag of alt-ref frames and their reference buffers
+    SECOND_PASS = ("second_pass", 5, 5, 120)
+    MUX = ("mux", 0, 4, 0)
+    CRF_SEARCH = ("crf_search", 5, 5, 120)
+    # Verifications probe their output and only encode again on failure
+    VERIFY = ("verify", 5, 5, 0)
+    # Cleanups remove the intermediate files of a seek
+    CLEANUP = ("cleanup", 0, 4, 0)
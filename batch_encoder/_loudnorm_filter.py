@@ -1,12 +1,22 @@
+from ._bounded_cache import BoundedCache
+from ._job_type import JobType
+from ._metrics import metrics
+from ._process_runner import process_runner
+from ._source_file import SourceFile
+from ._tracer import tracer
+
 import json
 import logging
-import re
+import os
 import shlex
 import subprocess
 
 
 # The audio normalization filter for our encode
 class LoudnormFilter:
+    # Loudness measurements by working directory, command and the modification time and size of its inputs
+    loudnorm_cache = BoundedCache(4096)
+
     first_pass_filter = (
         "loudnorm=I=-16:LRA=20:TP=-1:dual_mono=true:linear=true:print_format=json"
     )
@@ -19,23 +29,66 @@ class LoudnormFilter:
         self.target_offset = target_offset
 
     @classmethod
+    @tracer.traced
     def from_seek(cls, seek):
         logging.info("Retrieving loudness data...")
-        loudnorm_cmd = (
-            f"ffmpeg {seek.get_seek_string()} "
-            f"-map 0:a:{seek.source_file.selected_audio_stream} "
-            f"-af {LoudnormFilter.get_first_pass_filters(seek)} "
-            f"-vn -sn -dn -f null /dev/null"
-        )
+        return cls.from_command(LoudnormFilter.get_first_pass_command(seek))
+
+    # Run the measurement command and parse the loudness data from its output
+    # Measurements are cached for the lifetime of the process, until a source file is replaced
+    # Jobs of our plan measure through the resource governor of the scheduler if there is one
+    @classmethod
+    @tracer.traced
+    def from_command(cls, loudnorm_cmd, cwd=None, governor=None, job=None):
         loudnorm_args = shlex.split(loudnorm_cmd)
-        loudnorm_output = (
-            subprocess.check_output(loudnorm_args, stderr=subprocess.STDOUT)
-            .decode("utf-8")
-            .strip()
+        key = (
+            os.path.abspath(cwd or "."),
+            loudnorm_cmd,
+            SourceFile.get_input_keys(loudnorm_args, cwd),
+        )
+        loudnorm_filter = LoudnormFilter.loudnorm_cache.get(key)
+        if loudnorm_filter is not None:
+            metrics.inc(
+                "batch_encoder_cache_requests_total", cache="loudnorm", result="hit"
+            )
+            logging.debug(f"[LoudnormFilter.from_command] cache hit: '{loudnorm_cmd}'")
+            return loudnorm_filter
+
+        metrics.inc(
+            "batch_encoder_cache_requests_total", cache="loudnorm", result="miss"
         )
-        loudnorm_stats = re.search(r"\{[^}]*\}", loudnorm_output, re.DOTALL)
-        loudnorm_stats = json.loads(loudnorm_stats.group(0))
+        # The loudness data is a JSON object printed over several lines at the end of the measurement
+        loudnorm_lines = []
+
+        def parse_line(line):
+            if line == "{" or (
+                loudnorm_lines and not loudnorm_lines[-1].startswith("}")
+            ):
+                loudnorm_lines.append(line)
 
+        if governor is not None:
+            returncode = governor.call(
+                loudnorm_cmd,
+                JobType.LOUDNORM,
+                cwd=cwd,
+                job=job,
+                stderr_callback=parse_line,
+            )
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, loudnorm_cmd)
+        else:
+            process_runner.run(loudnorm_args, cwd=cwd, stderr_callback=parse_line)
+
+        if not loudnorm_lines:
+            raise ValueError(f"Loudness data missing from output of '{loudnorm_cmd}'")
+        loudnorm_filter = cls.from_stats(json.loads("\n".join(loudnorm_lines)))
+        LoudnormFilter.loudnorm_cache[key] = loudnorm_filter
+
+        return loudnorm_filter
+
+    # Loudness data printed by the measurement filter
+    @classmethod
+    def from_stats(cls, loudnorm_stats):
         logging.debug(
             f"[Loudnorm.__init__] input_i: '{loudnorm_stats['input_i']}', "
             f"input_lra: '{loudnorm_stats['input_lra']}', "
@@ -52,6 +105,35 @@ class LoudnormFilter:
             loudnorm_stats["target_offset"],
         )
 
+    # Measure loudness in a job of our plan and write the audio filtergraph for the encodes that depend on it
+    @classmethod
+    def from_job(cls, job, governor=None):
+        logging.info("Retrieving loudness data...")
+        loudnorm_filter = cls.from_command(
+            job.command, cwd=job.cwd, governor=governor, job=job
+        )
+
+        audio_filters = (
+            job.options["pre_filters"]
+            + [loudnorm_filter.get_normalization_filter()]
+            + job.options["post_filters"]
+        )
+        filter_script = job.get_path(job.options["filter_script"])
+        with open(filter_script, mode="w", encoding="utf8") as f:
+            f.write(",".join(audio_filters))
+
+        return loudnorm_filter
+
+    # The loudness measurement command for the seek
+    @staticmethod
+    def get_first_pass_command(seek) -> str:
+        return (
+            f"ffmpeg {seek.get_seek_string()} "
+            f"-map 0:a:{seek.source_file.selected_audio_stream} "
+            f"-af {LoudnormFilter.get_first_pass_filters(seek)} "
+            f"-vn -sn -dn -f null /dev/null"
+        )
+
     # The audio normalization filter argument for our encode
     def get_normalization_filter(self) -> str:
         return (
@@ -0,0 +1,134 @@
+from ._job_type import JobType
+
+import json
+import logging
+import os
+import re
+import threading
+
+
+# Memory estimates of the jobs of our scheduler, in MiB
+# Estimates start from resolution, filter chain and pass type and are refined from the peak RSS of past runs
+class MemoryEstimator:
+    # Resolution assumed for jobs of plans that do not carry it
+    default_width = 1920
+    default_height = 1080
+
+    # Memory of an FFmpeg process before any frames are decoded, in MiB
+    base_memory = 150
+
+    # Decoded frames held by the filters of a chain, filters not listed hold this many frames
+    default_filter_frames = 2
+    filter_frames = {"hqdn3d": 4, "null": 0, "split": 0}
+
+    # Video filters of single-output (-vf) and multi-output (-filter_complex) encodes
+    video_filters_pattern = re.compile(r'-(?:vf|filter_complex) "?([^"\s]+)')
+
+    def __init__(self, budget=None, state_file=None):
+        self.budget = budget
+        self.state_file = state_file
+        self.observed = {}
+        self.lock = threading.Lock()
+
+    # Job type and command of the encode of the job
+    # Verifications with retries may run second passes of their own, they are estimated as one
+    @staticmethod
+    def get_encode(job) -> tuple:
+        if job.job_type == JobType.VERIFY and job.options.get("retry_commands"):
+            return JobType.SECOND_PASS, job.options["retry_commands"][0]
+
+        return job.job_type, job.command
+
+    # Jobs with the same type, resolution and filter chain use the same memory
+    @staticmethod
+    def get_key(job) -> str:
+        job_type, command = MemoryEstimator.get_encode(job)
+        video_filters = MemoryEstimator.video_filters_pattern.search(command or "")
+        return (
+            f"{job_type.value}:"
+            f"{job.options.get('height', MemoryEstimator.default_height)}:"
+            f"{video_filters.group(1) if video_filters is not None else ''}"
+        )
+
+    # Frames of the source resolution that are buffered by the encoder and filters of the job
+    @staticmethod
+    def get_frames(job) -> int:
+        job_type, command = MemoryEstimator.get_encode(job)
+        if job_type.frames == 0:
+            return 0
+
+        video_filters = MemoryEstimator.video_filters_pattern.search(command or "")
+
+        # Multi-output encodes run an encoder for each of their outputs
+        frames = job_type.frames * job.options.get("outputs", 1)
+        if video_filters is not None:
+            for video_filter in re.split(r"[,;]", video_filters.group(1)):
+                video_filter = re.sub(r"\[[^\]]*\]", "", video_filter)
+                frames += MemoryEstimator.filter_frames.get(
+                    video_filter.split("=")[0], MemoryEstimator.default_filter_frames
+                )
+
+        return frames
+
+    def estimate(self, job) -> int:
+        with self.lock:
+            observed = self.observed.get(MemoryEstimator.get_key(job))
+        if observed is not None:
+            return observed
+
+        # yuv420p frames take 1.5 bytes per pixel
+        frame_size = (
+            job.options.get("width", MemoryEstimator.default_width)
+            * job.options.get("height", MemoryEstimator.default_height)
+            * 1.5
+            / 2**20
+        )
+
+        return round(
+            MemoryEstimator.base_memory + frame_size * MemoryEstimator.get_frames(job)
+        )
+
+    # Follow the peak RSS of finished jobs, never staying below the latest run
+    # Verifications only run their second passes on a retry, so they do not lower the estimates of second passes
+    def observe(self, job, peak_rss) -> None:
+        if MemoryEstimator.get_encode(job)[0] != job.job_type:
+            return
+
+        peak_memory = round(peak_rss / 2**20)
+        key = MemoryEstimator.get_key(job)
+
+        with self.lock:
+            previous = self.observed.get(key)
+            self.observed[key] = (
+                max(peak_memory, (previous + peak_memory) // 2)
+                if previous is not None
+                else peak_memory
+            )
+
+            logging.debug(
+                f"[MemoryEstimator.observe] key: '{key}', "
+                f"peak_memory: '{peak_memory}', "
+                f"estimate: '{self.observed[key]}'"
+            )
+
+            self.save()
+
+    # Whether the job fits in the budget next to the memory reserved by running jobs
+    def fits(self, job, reserved) -> bool:
+        return self.budget is None or reserved + self.estimate(job) <= self.budget
+
+    def save(self) -> None:
+        if self.state_file is None:
+            return
+
+        state_file_tmp = self.state_file + ".tmp"
+        with open(state_file_tmp, mode="w", encoding="utf8") as f:
+            json.dump(self.observed, f)
+        os.replace(state_file_tmp, self.state_file)
+
+    def load(self) -> None:
+        if self.state_file is None or not os.path.isfile(self.state_file):
+            return
+
+        with open(self.state_file, mode="r", encoding="utf8") as f:
+            self.observed = json.load(f)
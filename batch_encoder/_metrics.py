@@ -0,0 +1,240 @@
+import bisect
+import os
+import re
+import threading
+
+
+# Live counters, gauges and histograms of our batches in the Prometheus text exposition format
+class Metrics:
+    # Metric definitions: name -> (type, help, histogram buckets)
+    definitions = {
+        "batch_encoder_jobs": ("gauge", "Jobs of the scheduler by status", None),
+        "batch_encoder_jobs_finished_total": (
+            "counter",
+            "Finished jobs by type and status",
+            None,
+        ),
+        "batch_encoder_job_retries_total": (
+            "counter",
+            "Retries of failed jobs by type",
+            None,
+        ),
+        "batch_encoder_job_stalls_total": (
+            "counter",
+            "Jobs killed by the stall watchdog by type",
+            None,
+        ),
+        "batch_encoder_job_duration_seconds": (
+            "histogram",
+            "Wall time of finished jobs by type",
+            [1, 5, 15, 60, 300, 900, 1800, 3600, 7200],
+        ),
+        "batch_encoder_encode_fps": (
+            "histogram",
+            "Average frames per second of finished encodes by type",
+            [1, 2, 5, 10, 20, 50, 100, 200],
+        ),
+        "batch_encoder_encode_speed": (
+            "histogram",
+            "Speed factor against real time of finished encodes by type",
+            [0.1, 0.25, 0.5, 1, 2, 4, 8],
+        ),
+        "batch_encoder_running_encode_fps": (
+            "gauge",
+            "Current frames per second of running encodes by job and type",
+            None,
+        ),
+        "batch_encoder_running_encode_speed": (
+            "gauge",
+            "Current speed factor against real time of running encodes by job and type",
+            None,
+        ),
+        "batch_encoder_media_seconds_total": (
+            "counter",
+            "Seconds of media encoded by type",
+            None,
+        ),
+        "batch_encoder_bytes_written_total": (
+            "counter",
+            "Bytes of output written by type",
+            None,
+        ),
+        "batch_encoder_cache_requests_total": (
+            "counter",
+            "Cache lookups by cache and result",
+            None,
+        ),
+    }
+
+    # Stats line of FFmpeg, 'size=' while running and 'Lsize=' once finished:
+    # 'frame= 2160 fps= 12 q=-0.0 Lsize=  8123kB time=00:01:30.02 bitrate= 739.1kbits/s speed=0.5x'
+    progress_pattern = re.compile(
+        r"(?:frame=\s*(?P<frame>\d+)\s+fps=\s*(?P<fps>[\d.]+).*?)?"
+        r"L?size=\s*(?:(?P<size>\d+)(?P<unit>[kKMG]i?B)|N/A)"
+        r"\s+time=\s*(?P<time>-?[\d:.]+)"
+        r".*?speed=\s*(?P<speed>[\d.e+-]+)x"
+    )
+    size_units = {
+        "kB": 1000,
+        "KiB": 1024,
+        "MB": 1000**2,
+        "MiB": 1024**2,
+        "GB": 1000**3,
+        "GiB": 1024**3,
+    }
+
+    def __init__(self):
+        self.values = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_labels(labels) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels) -> None:
+        key = (name, Metrics.get_labels(labels))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels) -> None:
+        with self.lock:
+            self.values[(name, Metrics.get_labels(labels))] = value
+
+    def remove(self, name, **labels) -> None:
+        with self.lock:
+            self.values.pop((name, Metrics.get_labels(labels)), None)
+
+    def observe(self, name, value, **labels) -> None:
+        buckets = Metrics.definitions[name][2]
+        key = (name, Metrics.get_labels(labels))
+        with self.lock:
+            histogram = self.histograms.setdefault(
+                key, {"counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            )
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram["counts"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    # Last stats line in the output of an FFmpeg process
+    @staticmethod
+    def get_progress(output) -> re.Match | None:
+        progress = None
+        for line in re.split(r"[\r\n]", output):
+            match = Metrics.progress_pattern.search(line)
+            if match is not None:
+                progress = match
+
+        return progress
+
+    # Update the gauges of a running FFmpeg process from the stats lines of its output
+    def set_progress(self, output, **labels) -> None:
+        progress = Metrics.get_progress(output)
+        if progress is None:
+            return
+
+        if progress.group("fps") is not None:
+            self.set(
+                "batch_encoder_running_encode_fps",
+                float(progress.group("fps")),
+                **labels,
+            )
+        self.set(
+            "batch_encoder_running_encode_speed",
+            float(progress.group("speed")),
+            **labels,
+        )
+
+    # Remove the gauges of a finished FFmpeg process
+    def remove_progress(self, **labels) -> None:
+        self.remove("batch_encoder_running_encode_fps", **labels)
+        self.remove("batch_encoder_running_encode_speed", **labels)
+
+    # Record the final stats line of an FFmpeg process
+    def observe_progress(self, job_type, output) -> None:
+        progress = Metrics.get_progress(output)
+        if progress is None:
+            return
+
+        if progress.group("fps") is not None and float(progress.group("fps")) > 0:
+            self.observe(
+                "batch_encoder_encode_fps",
+                float(progress.group("fps")),
+                type=job_type.value,
+            )
+        if float(progress.group("speed")) > 0:
+            self.observe(
+                "batch_encoder_encode_speed",
+                float(progress.group("speed")),
+                type=job_type.value,
+            )
+
+        hours, minutes, seconds = (["0", "0"] + progress.group("time").split(":"))[-3:]
+        media_seconds = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        if media_seconds > 0:
+            self.inc(
+                "batch_encoder_media_seconds_total",
+                media_seconds,
+                type=job_type.value,
+            )
+        if progress.group("size") is not None:
+            self.inc(
+                "batch_encoder_bytes_written_total",
+                int(progress.group("size"))
+                * Metrics.size_units[progress.group("unit")],
+                type=job_type.value,
+            )
+
+    @staticmethod
+    def format_labels(labels, **extra_labels) -> str:
+        labels = list(labels) + list(extra_labels.items())
+        if not labels:
+            return ""
+
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, (metric_type, help_text, buckets) in Metrics.definitions.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+
+                for (key_name, labels), value in sorted(self.values.items()):
+                    if key_name == name:
+                        lines.append(f"{name}{Metrics.format_labels(labels)} {value}")
+
+                for (key_name, labels), histogram in sorted(self.histograms.items()):
+                    if key_name != name:
+                        continue
+
+                    cumulative = 0
+                    for bucket, count in zip(buckets, histogram["counts"]):
+                        cumulative += count
+                        lines.append(
+                            f"{name}_bucket{Metrics.format_labels(labels, le=bucket)} {cumulative}"
+                        )
+                    lines.append(
+                        f"{name}_bucket{Metrics.format_labels(labels, le='+Inf')} {histogram['count']}"
+                    )
+                    lines.append(
+                        f"{name}_sum{Metrics.format_labels(labels)} {histogram['sum']}"
+                    )
+                    lines.append(
+                        f"{name}_count{Metrics.format_labels(labels)} {histogram['count']}"
+                    )
+
+        return "\n".join(lines) + "\n"
+
+    # Write the metrics for a textfile collector, replacing the file atomically
+    def write(self, file) -> None:
+        file_tmp = file + ".tmp"
+        with open(file_tmp, mode="w", encoding="utf8") as f:
+            f.write(self.render())
+        os.replace(file_tmp, file)
+
+
+# Metrics of this process, shared by our caches, scheduler and executor
+metrics = Metrics()
@@ -0,0 +1,187 @@
+from ._crf_search import CRFSearch
+from ._job import JobError
+from ._job_type import JobType
+from ._process_runner import ProcessError
+from ._process_runner import process_runner
+
+import json
+import logging
+import os
+import shlex
+
+
+# Verify the output of a second pass with FFprobe: its duration, its size against the file size limit and its streams
+# A failed output is encoded again at the next-higher CRF while retries remain, the CRF placeholder of the retry commands is "{crf}"
+class OutputVerifier:
+    # Outputs shorter or longer than the seek by more than this many seconds are incomplete
+    duration_tolerance = 0.5
+
+    # Highest CRF of libvpx-vp9
+    max_crf = 63
+
+    def __init__(
+        self,
+        output,
+        duration,
+        limit_size,
+        audio,
+        crf=None,
+        retries=0,
+        retry_commands=None,
+        retry_output=None,
+        retry_intermediates=None,
+        cwd=None,
+        governor=None,
+        job=None,
+    ):
+        self.output = output
+        self.duration = duration
+        self.limit_size = limit_size
+        self.audio = audio
+        self.crf = crf
+        self.retries = retries
+        self.retry_commands = retry_commands if retry_commands is not None else []
+        self.retry_output = retry_output
+        self.retry_intermediates = (
+            retry_intermediates if retry_intermediates is not None else []
+        )
+        self.cwd = cwd
+        self.governor = governor
+        self.job = job
+
+    @classmethod
+    def from_job(cls, job, governor=None):
+        return cls(
+            job.options["output"],
+            job.options["duration"],
+            job.options["limit_size"],
+            job.options["audio"],
+            crf=job.options.get("crf"),
+            retries=job.options.get("retries", 0),
+            retry_commands=[
+                job.resolve(retry_command)
+                for retry_command in job.options.get("retry_commands", [])
+            ],
+            retry_output=job.options.get("retry_output"),
+            retry_intermediates=job.options.get("retry_intermediates", []),
+            cwd=job.cwd,
+            governor=governor,
+            job=job,
+        )
+
+    @staticmethod
+    def get_probe_command(output) -> str:
+        return (
+            f"ffprobe -v error -show_entries format=duration,size:stream=codec_type,codec_name "
+            f"-of json {shlex.quote(output)}"
+        )
+
+    # Resolve a path against the working directory of the verification, or the intermediate directory of its job
+    def get_path(self, path) -> str:
+        if self.job is not None:
+            return self.job.get_intermediate_path(path)
+
+        return os.path.join(self.cwd, path) if self.cwd is not None else path
+
+    # Problems of the output, empty if the output is complete
+    def get_errors(self, output) -> list[str]:
+        if not os.path.isfile(self.get_path(output)):
+            return ["output does not exist"]
+
+        try:
+            probe = json.loads(
+                process_runner.probe(
+                    shlex.split(OutputVerifier.get_probe_command(output)), cwd=self.cwd
+                )
+            )
+        except (ProcessError, ValueError):
+            return ["output could not be probed"]
+
+        errors = []
+
+        duration = float(probe.get("format", {}).get("duration", 0))
+        if abs(duration - self.duration) > OutputVerifier.duration_tolerance:
+            errors.append(
+                f"duration '{duration}' does not match seek '{self.duration}'"
+            )
+
+        size = int(probe.get("format", {}).get("size", 0))
+        if (
+            self.limit_size is not None
+            and size >= self.limit_size * CRFSearch.truncation_ratio
+        ):
+            errors.append(f"size '{size}' reached the limit '{self.limit_size}'")
+
+        streams = [
+            (stream.get("codec_type"), stream.get("codec_name"))
+            for stream in probe.get("streams", [])
+        ]
+        expected_streams = [("video", "vp9")] + (
+            [("audio", "opus")] if self.audio else []
+        )
+        if sorted(streams) != sorted(expected_streams):
+            errors.append(f"streams '{streams}' do not match '{expected_streams}'")
+
+        logging.debug(
+            f"[OutputVerifier.get_errors] output: '{output}', "
+            f"duration: '{duration}', "
+            f"size: '{size}', "
+            f"streams: '{streams}'"
+        )
+
+        return errors
+
+    # Retries run with the priorities of a second pass
+    def call(self, command) -> int:
+        if self.governor is not None:
+            return self.governor.call(
+                command, JobType.SECOND_PASS, cwd=self.cwd, job=self.job
+            )
+
+        return process_runner.run(command, cwd=self.cwd, check=False).returncode
+
+    # Raise if the output, or the output of the last retry, is incomplete
+    def run(self) -> str:
+        output = self.output
+        errors = self.get_errors(output)
+        crf = self.crf
+        retries = self.retries
+        failed_outputs = []
+
+        while errors and retries > 0 and self.retry_commands:
+            if crf is None or crf >= OutputVerifier.max_crf:
+                break
+
+            logging.error(f"Output '{output}' failed verification: {'; '.join(errors)}")
+            failed_outputs.append(output)
+
+            crf += 1
+            retries -= 1
+            logging.info(f"Encoding '{output}' again with CRF '{crf}'...")
+            for retry_command in self.retry_commands:
+                self.call(retry_command.replace("{crf}", str(crf)))
+
+            # The video-only encode of a retry is muxed with the shared audio
+            for retry_intermediate in self.retry_intermediates:
+                retry_intermediate = self.get_path(
+                    retry_intermediate.replace("{crf}", str(crf))
+                )
+                if os.path.isfile(retry_intermediate):
+                    os.remove(retry_intermediate)
+
+            output = self.retry_output.replace("{crf}", str(crf))
+            errors = self.get_errors(output)
+
+        if errors:
+            raise JobError(
+                f"Output '{output}' failed verification: {'; '.join(errors)}"
+            )
+
+        logging.info(f"Output '{output}' passed verification")
+
+        # Incomplete outputs are replaced by the retry that passed
+        for failed_output in failed_outputs:
+            if os.path.isfile(self.get_path(failed_output)):
+                os.remove(self.get_path(failed_output))
+
+        return output
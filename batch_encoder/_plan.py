@@ -0,0 +1,40 @@
+from ._job import Job
+from ._job_type import JobType
+from ._plan_writer import PlanWriter
+
+import json
+import logging
+
+
+# The plan of jobs that we write to and read from the command file
+# Each line holds one job as a JSON object, jobs are ordered after the jobs they depend on
+class Plan:
+    @staticmethod
+    def write(file, jobs) -> None:
+        with PlanWriter(file) as plan_writer:
+            plan_writer.write(jobs)
+
+    # Lines that are not JSON objects are plain commands written by older versions
+    @staticmethod
+    def read(file) -> list[Job]:
+        jobs = []
+        jobs_by_id = {}
+
+        with open(file, mode="r", encoding="utf8") as f:
+            for line in f:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+
+                if line.startswith("{"):
+                    job = Job.from_dict(json.loads(line), jobs_by_id)
+                else:
+                    job = Job(JobType.COMMAND, line)
+                    job.id = f"line-{len(jobs)}"
+
+                jobs_by_id[job.id] = job
+                jobs.append(job)
+
+        logging.info(f"Reading {len(jobs)} jobs from file '{file}'...")
+
+        return jobs
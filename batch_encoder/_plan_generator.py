@@ -0,0 +1,124 @@
+from ._encode_webm import EncodeWebM
+from ._encoding_config import EncodingConfig
+from ._plan_writer import PlanWriter
+from ._seek_collector import SeekCollector
+from ._source_file import SourceFile
+from ._tracer import tracer
+
+import copy
+import logging
+import threading
+
+
+# Generate plans of jobs from source files and seeks without prompting
+# Output names are unique within a generator, generators may be shared between threads
+class PlanGenerator:
+    def __init__(self, encoding_config=None):
+        self.encoding_config = (
+            encoding_config
+            if encoding_config is not None
+            else EncodingConfig.from_config(EncodingConfig.get_default_config())
+        )
+        self.all_output_names = set()
+        self.lock = threading.Lock()
+
+    # Load the encoding config from a config file, missing values use our defaults
+    @classmethod
+    def from_config_file(cls, config_file):
+        config = EncodingConfig.get_default_config()
+        config.remove_section("VideoFilters")
+        config.read(config_file, encoding="utf8")
+        if not config.has_section("VideoFilters"):
+            config["VideoFilters"] = EncodingConfig.default_video_filters
+
+        return cls(EncodingConfig.from_config(config))
+
+    # Streams must be given if the source file has more than one of a type and no default is configured
+    def get_source_file(self, file, video_stream=None, audio_stream=None):
+        with tracer.span("source", source=file):
+            return SourceFile.from_file(
+                file,
+                self.encoding_config,
+                video_stream=video_stream,
+                audio_stream=audio_stream,
+                interactive=False,
+            )
+
+    # Validate seeks given as dicts of 'ss', 'to', 'output_name' and optional 'audio_filter'
+    def get_seeks(self, source_file, seeks) -> list:
+        seek_collector = SeekCollector(
+            source_file,
+            [seek.get("ss", "") for seek in seeks],
+            [seek.get("to", "") for seek in seeks],
+            [seek["output_name"] for seek in seeks],
+            [seek.get("audio_filter", "") for seek in seeks],
+            self.all_output_names,
+        )
+
+        with self.lock:
+            if not seek_collector.is_valid():
+                raise ValueError(f"Invalid seeks for source file '{source_file.file}'")
+
+        return seek_collector.get_seek_list()
+
+    # Jobs of the seeks of a source file, video_filters default to the filters of our config
+    def get_jobs(self, source_file, seeks, video_filters=None) -> list:
+        jobs = []
+        for seek_jobs in self.get_seek_jobs(source_file, seeks, video_filters):
+            jobs.extend(seek_jobs)
+
+        return jobs
+
+    # Jobs of each seek of a source file, generated as they are consumed
+    def get_seek_jobs(self, source_file, seeks, video_filters=None):
+        for seek in self.get_seeks(source_file, seeks):
+            encoding_config = copy.copy(self.encoding_config)
+            encoding_config.video_filters = list(
+                video_filters
+                if video_filters is not None
+                else self.encoding_config.video_filters
+            )
+            if video_filters is None and self.encoding_config.include_unfiltered:
+                encoding_config.video_filters.append((None, "No Filters"))
+
+            logging.debug(
+                f"[PlanGenerator.get_jobs] ss: '{seek.ss}', "
+                f"to: '{seek.to}', "
+                f"output_name: '{seek.output_name}'"
+            )
+
+            with tracer.span(
+                "seek",
+                source=source_file.file,
+                seek=seek.output_name,
+                ss=seek.ss,
+                to=seek.to,
+            ):
+                seek_jobs = EncodeWebM(source_file, seek).get_jobs(encoding_config)
+
+            yield seek_jobs
+
+    # Jobs of the seeks of each source file path, in order of the mapping
+    def generate(self, sources) -> list:
+        jobs = []
+        for seek_jobs in self.stream(sources):
+            jobs.extend(seek_jobs)
+
+        return jobs
+
+    # Jobs of each seek of the sources, a mapping or pairs of source file paths or SourceFile objects and their seeks
+    # Source files are probed when their seeks are reached, and only the seek being generated is held in memory
+    def stream(self, sources):
+        for file, seeks in sources.items() if hasattr(sources, "items") else sources:
+            source_file = (
+                file if isinstance(file, SourceFile) else self.get_source_file(file)
+            )
+            yield from self.get_seek_jobs(source_file, seeks)
+
+    # Write the jobs of the sources to the command file as each seek is generated, returns the number of jobs
+    def write(self, file, sources) -> int:
+        with PlanWriter(file) as plan_writer:
+            for seek_jobs in self.stream(sources):
+                plan_writer.write(seek_jobs)
+
+        return plan_writer.count
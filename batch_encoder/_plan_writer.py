@@ -0,0 +1,32 @@
+import json
+import logging
+
+
+# Incremental writer of the command file
+# Jobs are numbered and written as they are generated, and every write is flushed so that the plan
+# holds every seek generated before a crash or an interrupt
+# The jobs a job depends on must be written before it
+class PlanWriter:
+    def __init__(self, file):
+        self.file = file
+        self.f = None
+        self.count = 0
+
+    def __enter__(self):
+        self.f = open(self.file, mode="w", encoding="utf8")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.f.close()
+        logging.info(f"Wrote {self.count} jobs to file '{self.file}'")
+
+    # Write the jobs of a seek in a single write
+    def write(self, jobs) -> None:
+        lines = []
+        for job in jobs:
+            job.id = self.count
+            self.count += 1
+            lines.append(json.dumps(job.to_dict()) + "\n")
+
+        self.f.write("".join(lines))
+        self.f.flush()
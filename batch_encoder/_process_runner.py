@@ -0,0 +1,285 @@
+import asyncio
+import codecs
+import collections
+import contextlib
+import logging
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+
+
+# Failed, timed out or cancelled process, with the end of its stderr
+class ProcessError(subprocess.CalledProcessError):
+    def __init__(self, returncode, cmd, stderr=None, timeout=None):
+        super().__init__(returncode, cmd, stderr=stderr)
+        self.timeout = timeout
+
+    def __str__(self):
+        command = self.cmd if isinstance(self.cmd, str) else " ".join(self.cmd)
+        message = (
+            f"Command '{command}' timed out after {self.timeout} seconds"
+            if self.timeout is not None
+            else f"Command '{command}' exited with status {self.returncode}"
+        )
+        return message + (f": {self.stderr}" if self.stderr else "")
+
+
+# The process layer of our FFmpeg and FFprobe calls, jobs of the resource governor included
+# Processes run on an asyncio event loop in a background thread, so probes, analysis and encodes overlap
+# without a thread per child, and at most max_processes of them run at the same time outside the governor
+# Stderr is parsed line by line, and timed out or cancelled processes are killed with their temp files
+class ProcessRunner:
+    # Lines of stderr kept for the error of a failed process
+    stderr_tail_lines = 20
+
+    # Bytes of output read at once
+    chunk_size = 65536
+
+    def __init__(self, max_processes=None, probe_timeout=None):
+        self.max_processes = max_processes or os.cpu_count() or 1
+        self.probe_timeout = probe_timeout
+        self.loop = None
+        self.semaphore = None
+        self.lock = threading.Lock()
+
+    # Blank and 0 values are the number of CPUs and no timeout
+    # The process limit is set before the first process, it takes effect with the event loop
+    def configure(self, encoding_config) -> None:
+        self.max_processes = encoding_config.max_processes or os.cpu_count() or 1
+        self.probe_timeout = encoding_config.probe_timeout or None
+
+    # The event loop and its process limit are created once, with the first process
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None:
+                self.semaphore = asyncio.Semaphore(self.max_processes)
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+        return self.loop
+
+    # Processes get their own process group, so that shells are killed with their children
+    @staticmethod
+    def kill(process) -> None:
+        try:
+            if os.name == "posix":
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+
+    @staticmethod
+    def remove_temp_paths(temp_paths) -> None:
+        for temp_path in temp_paths:
+            if os.path.isdir(temp_path):
+                shutil.rmtree(temp_path, ignore_errors=True)
+            elif os.path.isfile(temp_path):
+                os.remove(temp_path)
+
+    # A stream of the event loop for a pipe of a process, None for an unpiped output
+    @staticmethod
+    async def get_reader(pipe) -> asyncio.StreamReader | None:
+        if pipe is None:
+            return None
+
+        reader = asyncio.StreamReader()
+        await asyncio.get_running_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), pipe
+        )
+        return reader
+
+    # Start a process with its stdout and stderr streams
+    # On POSIX we reap our processes ourselves for their resource usage, so their pipes are connected to the loop directly
+    @staticmethod
+    async def create_process(args, cwd, stdout, stderr) -> tuple:
+        if os.name != "posix":
+            create_subprocess = (
+                asyncio.create_subprocess_shell
+                if isinstance(args, str)
+                else asyncio.create_subprocess_exec
+            )
+            process = await create_subprocess(
+                *([args] if isinstance(args, str) else args),
+                stdin=subprocess.DEVNULL,
+                stdout=stdout,
+                stderr=stderr,
+                cwd=cwd,
+            )
+            return process, process.stdout, process.stderr
+
+        process = subprocess.Popen(
+            args,
+            shell=isinstance(args, str),
+            stdin=subprocess.DEVNULL,
+            stdout=stdout,
+            stderr=stderr,
+            cwd=cwd,
+            start_new_session=True,
+        )
+        return (
+            process,
+            await ProcessRunner.get_reader(process.stdout),
+            await ProcessRunner.get_reader(process.stderr),
+        )
+
+    # Wait for a process to exit and return its exit code and resource usage
+    # Linux wakes the event loop through a pidfd of the process, other systems wait in a thread of the loop's executor
+    @staticmethod
+    async def wait(process) -> tuple:
+        if os.name != "posix":
+            return await process.wait(), None
+
+        loop = asyncio.get_running_loop()
+        if hasattr(os, "pidfd_open"):
+            pidfd = os.pidfd_open(process.pid)
+            exited = loop.create_future()
+            loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+            try:
+                await exited
+            finally:
+                loop.remove_reader(pidfd)
+                os.close(pidfd)
+            _, status, rusage = os.wait4(process.pid, 0)
+        else:
+            _, status, rusage = await loop.run_in_executor(
+                None, os.wait4, process.pid, 0
+            )
+
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return process.returncode, rusage
+
+    # Run a command, a list of arguments or a shell command string, on our event loop
+    # Stderr goes to stderr_callback line by line, is captured with capture_stderr or is inherited otherwise,
+    # and is also passed through to our stderr with echo_stderr
+    # Jobs of the resource governor are limited by the workers of the scheduler rather than by max_processes,
+    # start_callback gets the started process and rusage_callback its resource usage once it exited, on POSIX
+    async def run_async(
+        self,
+        args,
+        cwd=None,
+        timeout=None,
+        capture_stdout=False,
+        capture_stderr=False,
+        stderr_callback=None,
+        echo_stderr=False,
+        temp_paths=(),
+        check=True,
+        limited=True,
+        start_callback=None,
+        rusage_callback=None,
+    ) -> subprocess.CompletedProcess:
+        pipe_stderr = capture_stderr or stderr_callback is not None or check
+        async with self.semaphore if limited else contextlib.nullcontext():
+            process, stdout_reader, stderr_reader = await ProcessRunner.create_process(
+                args,
+                cwd,
+                subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
+                subprocess.PIPE if pipe_stderr or echo_stderr else None,
+            )
+            exited = asyncio.ensure_future(ProcessRunner.wait(process))
+            if start_callback is not None:
+                start_callback(process)
+
+            stderr_chunks = []
+            stderr_tail = collections.deque(maxlen=ProcessRunner.stderr_tail_lines)
+
+            def read_line(line):
+                if not line.strip():
+                    return
+                stderr_tail.append(line.rstrip())
+                if stderr_callback is not None:
+                    stderr_callback(line.strip())
+
+            # FFmpeg ends its stats lines with a carriage return, so lines end at either
+            async def read_stderr():
+                if stderr_reader is None:
+                    return
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                partial_line = ""
+                while chunk := await stderr_reader.read(ProcessRunner.chunk_size):
+                    if echo_stderr:
+                        sys.stderr.buffer.write(chunk)
+                        sys.stderr.buffer.flush()
+                    text = decoder.decode(chunk)
+                    if capture_stderr:
+                        stderr_chunks.append(text)
+                    lines = re.split(r"[\r\n]", partial_line + text)
+                    partial_line = lines.pop()
+                    for line in lines:
+                        read_line(line)
+                read_line(partial_line + decoder.decode(b"", final=True))
+
+            async def read_stdout():
+                return await stdout_reader.read() if capture_stdout else None
+
+            try:
+                stdout, _ = await asyncio.wait_for(
+                    asyncio.gather(read_stdout(), read_stderr()), timeout
+                )
+                returncode, rusage = await asyncio.shield(exited)
+            except BaseException as e:
+                ProcessRunner.kill(process)
+                await exited
+                ProcessRunner.remove_temp_paths(temp_paths)
+                if not isinstance(e, asyncio.TimeoutError):
+                    raise
+                raise ProcessError(
+                    process.returncode, args, "\n".join(stderr_tail), timeout
+                )
+
+        logging.debug(
+            f"[ProcessRunner.run_async] args: '{args}', returncode: '{returncode}'"
+        )
+
+        if rusage_callback is not None and rusage is not None:
+            rusage_callback(rusage)
+
+        if check and returncode != 0:
+            ProcessRunner.remove_temp_paths(temp_paths)
+            raise ProcessError(returncode, args, "\n".join(stderr_tail))
+
+        return subprocess.CompletedProcess(
+            args,
+            returncode,
+            stdout,
+            "".join(stderr_chunks) if capture_stderr else None,
+        )
+
+    # Run a coroutine of run_async calls on our event loop from a synchronous caller
+    # An interrupt of the caller cancels the coroutine, which kills its processes
+    def run_coroutine(self, coroutine):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.get_loop())
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    # Run a command from a synchronous caller
+    def run(self, args, **kwargs) -> subprocess.CompletedProcess:
+        return self.run_coroutine(self.run_async(args, **kwargs))
+
+    # Run commands concurrently within our limit, results are in the order of the commands
+    def run_all(self, commands, **kwargs) -> list:
+        async def gather():
+            return await asyncio.gather(
+                *(self.run_async(args, **kwargs) for args in commands),
+                return_exceptions=True,
+            )
+
+        return self.run_coroutine(gather())
+
+    # Run an FFprobe command and return its stdout, with the probe timeout
+    def probe(self, args, cwd=None) -> str:
+        return self.run(
+            args, cwd=cwd, timeout=self.probe_timeout, capture_stdout=True
+        ).stdout.decode("utf-8")
+
+
+# Process runner of this process, shared by probes, analysis stages and jobs with or without a resource governor
+process_runner = ProcessRunner()
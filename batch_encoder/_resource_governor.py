@@ -0,0 +1,350 @@
+from ._metrics import metrics
+from ._process_runner import process_runner
+
+import logging
+import math
+import os
+import shutil
+import signal
+import sys
+import re
+import threading
+import time
+
+
+# Admission control and process priorities for the jobs of our scheduler
+# New jobs only start while load average, available memory and I/O pressure are within our thresholds,
+# and running jobs are paused with SIGSTOP while the host is well beyond them
+# The load average counts our own jobs, so we follow their share of it and only compare the rest of the load
+# Running jobs whose output has not advanced for the stall timeout are killed
+class ResourceGovernor:
+    # Position of FFmpeg in its stats line, the watchdog considers a process stalled while it does not advance
+    progress_pattern = re.compile(r"time=\s*(\S+)")
+
+    # Encoder threads of a command, commands without them count as one thread
+    threads_pattern = re.compile(r"-threads (\d+)")
+
+    # Seconds between two checks of the host
+    interval = 5
+
+    # Our share of the one-minute load average decays like the kernel's, which samples every 5 seconds
+    load_decay = math.exp(-interval / 60)
+
+    # Running jobs are paused beyond this multiple of our thresholds, and resumed once within them
+    pause_ratio = 1.5
+
+    def __init__(
+        self,
+        priority_enable=True,
+        max_load_average=None,
+        min_available_memory=None,
+        max_io_pressure=None,
+        stall_timeout=None,
+    ):
+        self.priority_enable = priority_enable
+        self.max_load_average = max_load_average
+        self.min_available_memory = min_available_memory
+        self.max_io_pressure = max_io_pressure
+        self.stall_timeout = stall_timeout
+        self.processes = {}
+        self.threads = {}
+        self.own_load = 0.0
+        self.paused = set()
+        self.progress = {}
+        self.stalled = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    # Blank thresholds and a stall timeout of 0 are disabled
+    @classmethod
+    def from_config(cls, encoding_config):
+        return cls(
+            encoding_config.process_priority_enable,
+            (
+                float(encoding_config.max_load_average)
+                if encoding_config.max_load_average
+                else None
+            ),
+            (
+                int(encoding_config.min_available_memory)
+                if encoding_config.min_available_memory
+                else None
+            ),
+            (
+                float(encoding_config.max_io_pressure)
+                if encoding_config.max_io_pressure
+                else None
+            ),
+            encoding_config.stall_timeout or None,
+        )
+
+    # One-minute load average
+    @staticmethod
+    def get_load_average() -> float | None:
+        if not hasattr(os, "getloadavg"):
+            return None
+
+        return os.getloadavg()[0]
+
+    # Available memory in MiB
+    @staticmethod
+    def get_available_memory() -> int | None:
+        try:
+            with open("/proc/meminfo", encoding="utf8") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) // 1024
+        except OSError:
+            pass
+
+        return None
+
+    # Share of the last 10 seconds in which some tasks were stalled on I/O
+    @staticmethod
+    def get_io_pressure() -> float | None:
+        try:
+            with open("/proc/pressure/io", encoding="utf8") as f:
+                for line in f:
+                    if line.startswith("some"):
+                        return float(line.split()[1].split("=")[1])
+        except (OSError, IndexError, ValueError):
+            pass
+
+        return None
+
+    # Follow the load of the threads of our running jobs, as the kernel follows the runnable threads of the host
+    def update_own_load(self) -> None:
+        with self.lock:
+            threads = sum(
+                threads
+                for pid, threads in self.threads.items()
+                if pid not in self.paused
+            )
+            self.own_load = self.own_load * ResourceGovernor.load_decay + threads * (
+                1 - ResourceGovernor.load_decay
+            )
+
+    # Whether the host is beyond our thresholds scaled by the ratio
+    # Only the load average of other processes is compared, our jobs would otherwise pause themselves
+    def is_under_pressure(self, ratio=1.0) -> bool:
+        load_average = ResourceGovernor.get_load_average()
+        if load_average is not None:
+            load_average = max(0.0, load_average - self.own_load)
+        available_memory = ResourceGovernor.get_available_memory()
+        io_pressure = ResourceGovernor.get_io_pressure()
+
+        logging.debug(
+            f"[ResourceGovernor.is_under_pressure] load_average: '{load_average}', "
+            f"own_load: '{self.own_load}', "
+            f"available_memory: '{available_memory}', "
+            f"io_pressure: '{io_pressure}', "
+            f"ratio: '{ratio}'"
+        )
+
+        if (
+            self.max_load_average is not None
+            and load_average is not None
+            and load_average > self.max_load_average * ratio
+        ):
+            return True
+
+        if (
+            self.min_available_memory is not None
+            and available_memory is not None
+            and available_memory < self.min_available_memory / ratio
+        ):
+            return True
+
+        if (
+            self.max_io_pressure is not None
+            and io_pressure is not None
+            and io_pressure > self.max_io_pressure * ratio
+        ):
+            return True
+
+        return False
+
+    # New jobs wait for paused jobs to resume
+    def is_admissible(self) -> bool:
+        with self.lock:
+            if self.paused:
+                return False
+
+        return not self.is_under_pressure()
+
+    # Run the command through nice and ionice when they are available
+    def get_args(self, command, job_type) -> list[str] | str:
+        args = []
+        if self.priority_enable and shutil.which("nice") is not None:
+            args += ["nice", "-n", str(job_type.nice)]
+        if self.priority_enable and shutil.which("ionice") is not None:
+            args += ["ionice", "-c", "2", "-n", str(job_type.io_priority)]
+
+        return args + ["/bin/sh", "-c", command] if args else command
+
+    # Run a command of a job through the process runner, in its own process group so that it can be paused as a whole
+    # Jobs are limited by the workers of the scheduler, not by the process limit of the runner
+    def call(self, command, job_type, cwd=None, job=None, stderr_callback=None) -> int:
+        return process_runner.run_coroutine(
+            self.call_async(command, job_type, cwd, job, stderr_callback)
+        )
+
+    # The started process is tracked for pauses, the stall watchdog and our own load, and its peak RSS is recorded
+    # on the job for the memory estimates of the scheduler
+    # Lines of stderr are passed to stderr_callback for jobs that parse the output of their command
+    async def call_async(
+        self, command, job_type, cwd=None, job=None, stderr_callback=None
+    ) -> int:
+        pids = []
+        stats_lines = []
+        progress_labels = {
+            "job": job.key if job is not None else None,
+            "type": job_type.value,
+        }
+
+        def start(process):
+            if progress_labels["job"] is None:
+                progress_labels["job"] = str(process.pid)
+            if os.name != "posix":
+                return
+
+            pids.append(process.pid)
+            with self.lock:
+                self.processes[process.pid] = job_type
+                self.threads[process.pid] = (
+                    sum(
+                        int(threads)
+                        for threads in ResourceGovernor.threads_pattern.findall(command)
+                    )
+                    or 1
+                )
+                self.progress[process.pid] = (time.monotonic(), None)
+
+        # Output other than a stats line at an unchanged position counts as progress of the process
+        def read_line(line):
+            match = ResourceGovernor.progress_pattern.search(line)
+            position = match.group(1) if match is not None else None
+            with self.lock:
+                for pid in pids:
+                    if position is None or position != self.progress[pid][1]:
+                        self.progress[pid] = (time.monotonic(), position)
+
+            if position is not None:
+                metrics.set_progress(line, **progress_labels)
+                stats_lines[:] = [line]
+            if stderr_callback is not None:
+                stderr_callback(line)
+
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        def observe_rusage(rusage):
+            peak_rss = rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+            if job is not None:
+                job.peak_rss = max(job.peak_rss or 0, peak_rss)
+
+        try:
+            completed = await process_runner.run_async(
+                self.get_args(command, job_type),
+                cwd=cwd,
+                stderr_callback=read_line,
+                echo_stderr=True,
+                check=False,
+                limited=False,
+                start_callback=start,
+                rusage_callback=observe_rusage,
+            )
+        finally:
+            stalled = False
+            with self.lock:
+                for pid in pids:
+                    self.processes.pop(pid, None)
+                    self.threads.pop(pid, None)
+                    self.paused.discard(pid)
+                    self.progress.pop(pid, None)
+                    stalled = pid in self.stalled
+                    self.stalled.discard(pid)
+            if progress_labels["job"] is not None:
+                metrics.remove_progress(**progress_labels)
+
+        if stalled:
+            logging.error(
+                f"Killed job process '{pids[0]}' after no progress for {self.stall_timeout} seconds"
+            )
+            metrics.inc("batch_encoder_job_stalls_total", type=job_type.value)
+        metrics.observe_progress(job_type, "".join(stats_lines))
+
+        return completed.returncode
+
+    def signal_process(self, pid, signal_number) -> None:
+        try:
+            os.killpg(pid, signal_number)
+        except ProcessLookupError:
+            pass
+
+    # Pause the running job of lowest priority, most recently started first
+    def pause(self) -> None:
+        with self.lock:
+            running = [pid for pid in self.processes if pid not in self.paused]
+            if not running:
+                return
+
+            pid = max(reversed(running), key=lambda pid: self.processes[pid].nice)
+            self.signal_process(pid, signal.SIGSTOP)
+            self.paused.add(pid)
+
+        logging.info(f"Paused job process '{pid}' while the host is under pressure")
+
+    # Resume the paused job of highest priority
+    def resume(self) -> None:
+        with self.lock:
+            if not self.paused:
+                return
+
+            pid = min(self.paused, key=lambda pid: self.processes[pid].nice)
+            self.signal_process(pid, signal.SIGCONT)
+            self.paused.discard(pid)
+
+            # Time spent paused does not count against the stall timeout
+            self.progress[pid] = (time.monotonic(), self.progress[pid][1])
+
+        logging.info(f"Resumed job process '{pid}'")
+
+    # Kill the process groups of running jobs without progress for the stall timeout
+    def kill_stalled(self) -> None:
+        if self.stall_timeout is None:
+            return
+
+        now = time.monotonic()
+        with self.lock:
+            for pid, (progress_time, _) in self.progress.items():
+                if pid in self.paused or pid in self.stalled:
+                    continue
+
+                if now - progress_time > self.stall_timeout:
+                    self.signal_process(pid, signal.SIGKILL)
+                    self.stalled.add(pid)
+
+    # Pause and resume jobs and kill stalled jobs until stopped, one job per check for pauses
+    def monitor(self) -> None:
+        if os.name != "posix":
+            return
+
+        while not self.stopped.wait(ResourceGovernor.interval):
+            self.update_own_load()
+            self.kill_stalled()
+
+            if self.is_under_pressure(ResourceGovernor.pause_ratio):
+                self.pause()
+            elif not self.is_under_pressure():
+                self.resume()
+
+    # Resume paused jobs, and terminate running jobs if requested
+    def stop(self, terminate=False) -> None:
+        self.stopped.set()
+
+        with self.lock:
+            for pid in self.processes:
+                if terminate:
+                    self.signal_process(pid, signal.SIGTERM)
+                if pid in self.paused:
+                    self.signal_process(pid, signal.SIGCONT)
+            self.paused.clear()
@@ -0,0 +1,399 @@
+from ._executor import Executor
+from ._job import Job
+from ._job_status import JobStatus
+from ._job_type import JobType
+from ._metrics import metrics
+
+import json
+import logging
+import os
+import threading
+import time
+
+
+# The queue of jobs that we run with a pool of workers
+# Jobs start once the jobs they depend on are done, higher priorities first and then in order of submission
+# Failed jobs are retried after an exponential backoff, and the jobs depending on them are cancelled once they fail for good
+class Scheduler:
+    # Seconds between two writes of the metrics file while jobs are running, for the live progress of their encodes
+    metrics_interval = 10
+
+    def __init__(
+        self,
+        workers=1,
+        state_file=None,
+        governor=None,
+        memory_estimator=None,
+        metrics_file=None,
+        retries=0,
+        retry_backoff=60,
+        workspace=None,
+        source_cache=None,
+    ):
+        self.workers = workers
+        self.workspace = workspace
+        self.source_cache = source_cache
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.state_file = state_file
+        self.metrics_file = metrics_file
+        self.metrics_time = 0.0
+        self.governor = governor
+        self.memory_estimator = memory_estimator
+        self.jobs = []
+        self.batches = {}
+        self.running = set()
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    # Add the jobs of a plan to the queue
+    def submit(self, jobs, priority=0, cwd=None) -> str:
+        with self.condition:
+            batch = str(len(self.batches))
+            self.batches[batch] = {"cwd": cwd, "jobs": jobs}
+            passlog_dir, intermediate_dir = (
+                self.workspace.create(batch)
+                if self.workspace is not None
+                else (None, None)
+            )
+
+            for job in jobs:
+                job.key = f"{batch}:{job.id}"
+                job.cwd = cwd
+                job.passlog_dir = passlog_dir
+                job.intermediate_dir = intermediate_dir
+                job.priority = priority
+                if job.status == JobStatus.RUNNING:
+                    job.status = JobStatus.QUEUED
+
+            self.jobs.extend(jobs)
+            self.save()
+            self.publish_metrics()
+            self.condition.notify_all()
+
+        logging.info(f"Queued {len(jobs)} jobs in batch '{batch}'")
+
+        return batch
+
+    # Change the priority of a batch or of a single job
+    def set_priority(self, key, priority) -> int:
+        with self.condition:
+            jobs = [
+                job
+                for job in self.jobs
+                if job.key == key or job.key.split(":")[0] == key
+            ]
+            for job in jobs:
+                job.priority = priority
+
+            self.save()
+            self.condition.notify_all()
+
+        return len(jobs)
+
+    # Resize the pool of workers, running jobs finish before the pool shrinks
+    def set_workers(self, workers) -> None:
+        with self.condition:
+            self.workers = max(1, workers)
+            self.condition.notify_all()
+
+        logging.info(f"Scheduler workers set to {self.workers}")
+
+    def get_status(self) -> dict:
+        with self.condition:
+            counts = {status.value: 0 for status in JobStatus}
+            for job in self.jobs:
+                counts[job.status.value] += 1
+
+            return {
+                "workers": self.workers,
+                "counts": counts,
+                "jobs": [
+                    {
+                        "key": job.key,
+                        "type": job.job_type.value,
+                        "status": job.status.value,
+                        "priority": job.priority,
+                        "memory": (
+                            self.memory_estimator.estimate(job)
+                            if self.memory_estimator is not None
+                            else None
+                        ),
+                    }
+                    for job in self.jobs
+                ],
+            }
+
+    # Cancel queued jobs that depend on failed or cancelled jobs
+    # Jobs are ordered after the jobs they depend on, so a single pass cancels every dependent
+    def cancel_dependents(self) -> None:
+        cancelled_batches = set()
+        for job in self.jobs:
+            if job.status == JobStatus.QUEUED and any(
+                dependency.status.is_failed() for dependency in job.depends_on
+            ):
+                logging.error(
+                    f"Cancelled job '{job.key}' after a job it depends on failed"
+                )
+                job.status = JobStatus.CANCELLED
+                cancelled_batches.add(job.key.split(":")[0])
+
+        # Batches may have finished with the cancellation of their last jobs
+        for batch in cancelled_batches:
+            self.remove_workspace(batch)
+
+        if cancelled_batches:
+            self.save()
+            self.publish_metrics()
+
+    # Next queued job whose dependencies are done, whose backoff has passed and that fits in the memory budget
+    def get_ready_job(self) -> Job | None:
+        now = time.monotonic()
+        ready_jobs = [
+            job
+            for job in self.jobs
+            if job.status == JobStatus.QUEUED
+            and (job.retry_time is None or job.retry_time <= now)
+            and all(
+                dependency.status == JobStatus.DONE for dependency in job.depends_on
+            )
+        ]
+
+        # A job beyond the budget on its own still runs once nothing else is running
+        if self.memory_estimator is not None and self.running:
+            reserved = sum(self.memory_estimator.estimate(job) for job in self.running)
+            ready_jobs = [
+                job for job in ready_jobs if self.memory_estimator.fits(job, reserved)
+            ]
+
+        # A job beyond the free space on its own still runs once nothing else is running
+        if self.workspace is not None and self.running:
+            ready_jobs = [
+                job for job in ready_jobs if self.workspace.fits(job, self.running)
+            ]
+
+        if not ready_jobs:
+            return None
+
+        # Jobs of alternated source files run in the order of their seek within their source file
+        return max(
+            ready_jobs,
+            key=lambda job: (job.priority, -job.options.get("seek_index", 0)),
+        )
+
+    def run_job(self, job) -> None:
+        start_time = time.monotonic()
+        succeeded = Executor.run_job(job, self.governor)
+        duration = time.monotonic() - start_time
+
+        if succeeded and self.memory_estimator is not None and job.peak_rss is not None:
+            self.memory_estimator.observe(job, job.peak_rss)
+
+        with self.condition:
+            # Jobs terminated by stop stay running in our state and are queued again on load
+            if not self.stopped and not succeeded and self.is_retryable(job):
+                backoff = self.retry_backoff * 2**job.attempts
+                job.attempts += 1
+                job.retry_time = time.monotonic() + backoff
+                job.status = JobStatus.QUEUED
+                metrics.inc("batch_encoder_job_retries_total", type=job.job_type.value)
+                logging.info(
+                    f"Retrying job '{job.key}' in {backoff} seconds "
+                    f"(attempt {job.attempts} of {self.retries})"
+                )
+            elif not self.stopped:
+                job.status = JobStatus.DONE if succeeded else JobStatus.FAILED
+                metrics.inc(
+                    "batch_encoder_jobs_finished_total",
+                    type=job.job_type.value,
+                    status=job.status.value,
+                )
+                metrics.observe(
+                    "batch_encoder_job_duration_seconds",
+                    duration,
+                    type=job.job_type.value,
+                )
+            self.running.discard(job)
+            self.remove_workspace(job.key.split(":")[0])
+            self.save()
+            self.publish_metrics()
+            self.condition.notify_all()
+
+    # Remove the scratch directory of a batch and unpin its staged source files once every job of the batch has finished
+    def remove_workspace(self, batch) -> None:
+        if self.stopped or not all(
+            job.status.is_finished() for job in self.batches[batch]["jobs"]
+        ):
+            return
+
+        if self.workspace is not None:
+            self.workspace.remove(batch)
+
+        if self.source_cache is not None and not self.batches[batch].get("released"):
+            self.source_cache.release(self.batches[batch]["jobs"])
+            self.batches[batch]["released"] = True
+
+    def is_retryable(self, job) -> bool:
+        return job.retryable and job.attempts < self.retries
+
+    # Jobs are admitted by the resource governor if there is one
+    def is_admissible(self) -> bool:
+        return self.governor is None or self.governor.is_admissible()
+
+    # Wait for the governor to check the host again, for the backoff of a retry to pass,
+    # or for the next write of the metrics file while jobs are running
+    def get_wait_timeout(self) -> float | None:
+        timeouts = [
+            job.retry_time - time.monotonic()
+            for job in self.jobs
+            if job.status == JobStatus.QUEUED and job.retry_time is not None
+        ]
+        if self.governor is not None:
+            timeouts.append(self.governor.interval)
+        if self.metrics_file and self.running:
+            timeouts.append(
+                self.metrics_time + Scheduler.metrics_interval - time.monotonic()
+            )
+
+        return max(0, min(timeouts)) if timeouts else None
+
+    # Dispatch jobs until stopped, or until the queue is empty if we are not serving
+    # While the governor holds back jobs, we check the host again after its interval
+    def run(self, serve=False) -> None:
+        if self.governor is not None:
+            threading.Thread(target=self.governor.monitor, daemon=True).start()
+
+        try:
+            with self.condition:
+                while not self.stopped:
+                    self.cancel_dependents()
+
+                    job = None
+                    if len(self.running) < self.workers and self.is_admissible():
+                        job = self.get_ready_job()
+
+                    if job is not None:
+                        job.status = JobStatus.RUNNING
+                        self.running.add(job)
+                        self.publish_metrics()
+                        threading.Thread(target=self.run_job, args=(job,)).start()
+                        continue
+
+                    if not serve and not self.running:
+                        if not any(job.status == JobStatus.QUEUED for job in self.jobs):
+                            break
+
+                    self.condition.wait(self.get_wait_timeout())
+
+                    if (
+                        self.running
+                        and time.monotonic() - self.metrics_time
+                        >= Scheduler.metrics_interval
+                    ):
+                        self.publish_metrics()
+        except KeyboardInterrupt:
+            self.stop()
+            raise
+
+        if self.governor is not None:
+            self.governor.stop()
+
+    # Jobs run in their own process groups and would outlive us, so they are terminated
+    def stop(self) -> None:
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+        if self.governor is not None:
+            self.governor.stop(terminate=True)
+
+        if self.workspace is not None:
+            self.workspace.remove_all()
+
+    # Update the job gauges and write the metrics file for a textfile collector if configured
+    # The file is also rewritten every metrics interval while jobs are running, with the progress gauges of their encodes
+    def publish_metrics(self) -> None:
+        self.metrics_time = time.monotonic()
+
+        counts = {status: 0 for status in JobStatus}
+        for job in self.jobs:
+            counts[job.status] += 1
+        for status, count in counts.items():
+            metrics.set("batch_encoder_jobs", count, status=status.value)
+
+        if self.metrics_file:
+            metrics.write(self.metrics_file)
+
+    # Persist unfinished batches so that a restarted scheduler picks them up
+    def save(self) -> None:
+        if self.state_file is None:
+            return
+
+        state = [
+            {
+                "cwd": batch["cwd"],
+                "jobs": [
+                    dict(
+                        job.to_dict(),
+                        status=job.status.value,
+                        priority=job.priority,
+                    )
+                    for job in batch["jobs"]
+                ],
+            }
+            for batch in self.batches.values()
+            if any(not job.status.is_finished() for job in batch["jobs"])
+        ]
+
+        state_file_tmp = self.state_file + ".tmp"
+        with open(state_file_tmp, mode="w", encoding="utf8") as f:
+            json.dump(state, f)
+        os.replace(state_file_tmp, self.state_file)
+
+    def load(self) -> None:
+        if self.state_file is None or not os.path.isfile(self.state_file):
+            return
+
+        with open(self.state_file, mode="r", encoding="utf8") as f:
+            state = json.load(f)
+
+        for batch in state:
+            jobs = []
+            jobs_by_id = {}
+            for job_dict in batch["jobs"]:
+                job = Job.from_dict(job_dict, jobs_by_id)
+                job.status = JobStatus(job_dict["status"])
+                jobs_by_id[job.id] = job
+                jobs.append(job)
+
+            self.submit(jobs, cwd=batch["cwd"])
+            for job, job_dict in zip(jobs, batch["jobs"]):
+                job.priority = job_dict["priority"]
+
+            # Intermediates in scratch directories are gone, the audio and video-only encodes that are still needed run again
+            for job in jobs:
+                if job.intermediate_dir is None or not job.status.is_finished():
+                    continue
+
+                if (
+                    job.job_type in [JobType.AUDIO, JobType.SECOND_PASS]
+                    and Job.intermediate_pattern.search(job.command)
+                    and any(
+                        not dependent.status.is_finished()
+                        for dependent in jobs
+                        if job in dependent.depends_on
+                    )
+                ):
+                    job.status = JobStatus.QUEUED
+
+            # Passlogs in scratch directories are gone, first passes that are still needed run again
+            for job in jobs:
+                if job.passlog_dir is None or not job.status.is_finished():
+                    continue
+
+                if job.job_type == JobType.FIRST_PASS and any(
+                    not dependent.status.is_finished()
+                    for dependent in jobs
+                    if job in dependent.depends_on
+                ):
+                    job.status = JobStatus.QUEUED
@@ -1,4 +1,5 @@
 from ._source_file import SourceFile
+from ._utils import string_to_seconds
 
 
 # The seek information for our encode
@@ -27,3 +28,31 @@ class Seek:
             return f'-i "{self.source_file.file}" -to {self.to}'
         else:
             return f'-i "{self.source_file.file}"'
+
+    # The duration of our encode in seconds
+    def get_duration(self) -> float:
+        source_file_duration = self.source_file.metadata.duration
+
+        start_time = string_to_seconds(self.ss) if self.ss else 0
+        end_time = string_to_seconds(self.to) if self.to else source_file_duration
+
+        return end_time - start_time
+
+    # Evenly spaced sample windows (start in source seconds, length) within our encode
+    def get_sample_windows(self, count, length) -> list[tuple[float, float]]:
+        start_time = string_to_seconds(self.ss) if self.ss else 0
+        duration = self.get_duration()
+
+        if duration <= count * length:
+            return [(start_time, duration)]
+
+        step = duration / count
+        return [
+            (round(start_time + step * i + (step - length) / 2, 3), length)
+            for i in range(count)
+        ]
+
+    # The seek string arguments for a sample window
+    # Sample windows always use fast seek, frame accuracy is not needed for analysis
+    def get_sample_seek_string(self, start, length) -> str:
+        return f'-ss {start} -t {length} -i "{self.source_file.file}"'
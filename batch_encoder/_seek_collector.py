@@ -1,5 +1,6 @@
 from ._cli import CLI
 from ._seek import Seek
+from ._tracer import tracer
 from ._utils import string_to_seconds
 
 import logging
@@ -16,71 +17,116 @@ class SeekCollector:
     # Examples: Tamayura-OP1, PlanetWith-ED1v2
     filename_pattern = re.compile(r"^[a-zA-Z0-9\-]+$")
 
-    # Lists for integrity tests
-    all_output_names = []
-    start_positions_len = 0
-
-    # Validations for our prompts
-    validate_seek = (
-        lambda _, x: len(x.strip()) == 0
-        or all(SeekCollector.time_pattern.match(y) for y in x.split(","))
-        and SeekCollector.start_positions_len in [len(x.split(",")), 0]
-    )
-
-    validate_output_name = (
-        lambda _, x: len(x.strip()) > 0
-        and all(
-            SeekCollector.filename_pattern.match(y)
-            and y.strip() not in SeekCollector.all_output_names
-            for y in x.split(",")
+    def __init__(
+        self,
+        source_file,
+        start_positions,
+        end_positions,
+        output_names,
+        new_audio_filters=None,
+        all_output_names=None,
+    ):
+        self.source_file = source_file
+        self.start_positions = start_positions
+        self.end_positions = end_positions
+        self.output_names = [output_name.strip() for output_name in output_names]
+        self.new_audio_filters = (
+            new_audio_filters
+            if new_audio_filters is not None
+            else ["" for _ in self.output_names]
+        )
+        # Output names already taken by the plan, shared between the collectors of a run
+        self.all_output_names = (
+            all_output_names if all_output_names is not None else set()
         )
-        and SeekCollector.start_positions_len == len(x.split(","))
-    )
 
-    def __init__(self, source_file):
-        self.source_file = source_file
-        self.start_positions_len = SeekCollector.prompt_time("Start time(s)")
-        self.end_positions = SeekCollector.prompt_time("End time(s)")
-        self.output_names = SeekCollector.prompt_output_name()
-        self.new_audio_filters = SeekCollector.prompt_new_audio_filters(self)
-
-    # Prompt the user for our list of starting/ending positions of our WebMs
-    # For starting positions, a blank input value is the 0 position of the source file
-    # For ending positions, a blank input value is the end position of the source file
-    def prompt_time(prompt_text) -> list[str]:
-        positions = CLI.prompt_time(
-            prompt_text, validate=SeekCollector.validate_seek
+    # Prompt the user for the positions, names and audio filters of our WebMs
+    # Seeks proposed by the locator as (ss, to, confidence) are the defaults of the positions
+    @classmethod
+    @tracer.traced
+    def from_prompts(cls, source_file, all_output_names=None, proposed_seeks=None):
+        all_output_names = all_output_names if all_output_names is not None else set()
+        proposed_seeks = [
+            proposed_seek
+            for proposed_seek in proposed_seeks or []
+            if proposed_seek is not None
+        ]
+        start_positions = CLI.prompt_time(
+            "Start time(s)",
+            validate=lambda _, x: SeekCollector.is_valid_seek(x),
+            default=",".join(ss for ss, _, _ in proposed_seeks) or None,
         ).split(",")
-        if prompt_text == "Start time(s)":
-            SeekCollector.start_positions_len = len(positions)
-
-        return positions
-
-    # Prompt the user for our list of name for our passlog/WebMs
-    def prompt_output_name() -> list[str]:
-        filenames = CLI.prompt_text(
-            message="Output file name(s)", validate=SeekCollector.validate_output_name
+        end_positions = CLI.prompt_time(
+            "End time(s)",
+            validate=lambda _, x: SeekCollector.is_valid_seek(x, len(start_positions)),
+            default=",".join(to for _, to, _ in proposed_seeks) or None,
+        ).split(",")
+        # A blank input value is the end position of the source file for every seek
+        if end_positions == [""]:
+            end_positions = ["" for _ in start_positions]
+        output_names = CLI.prompt_text(
+            message="Output file name(s)",
+            validate=lambda _, x: SeekCollector.is_valid_output_name(
+                x, len(start_positions), all_output_names
+            ),
         ).split(",")
-        SeekCollector.all_output_names.extend(filenames)
-        SeekCollector.start_positions_len = 0
+        new_audio_filters = [
+            CLI.audio_filters_options(output_name) for output_name in output_names
+        ]
+
+        return cls(
+            source_file,
+            start_positions,
+            end_positions,
+            output_names,
+            new_audio_filters,
+            all_output_names,
+        )
 
-        return filenames
+    # Validations for our prompts
+    # Blank positions are the start/end of the source file
+    @staticmethod
+    def is_valid_seek(value, positions_len=None) -> bool:
+        return len(value.strip()) == 0 or (
+            all(SeekCollector.time_pattern.match(y) for y in value.split(","))
+            and positions_len in [len(value.split(",")), None]
+        )
 
-    # Prompt the user for ours list of audio filters of ours WebMs
     @staticmethod
-    def prompt_new_audio_filters(self) -> list[str]:
-        new_audio_filters = []
-        for output_name in self.output_names:
-            new_audio_filters.append(CLI.audio_filters_options(output_name))
+    def is_valid_output_name(value, positions_len, all_output_names) -> bool:
+        output_names = [y.strip() for y in value.split(",")]
+        return (
+            len(value.strip()) > 0
+            and all(
+                SeekCollector.filename_pattern.match(y) and y not in all_output_names
+                for y in output_names
+            )
+            and len(set(output_names)) == len(output_names)
+            and positions_len == len(output_names)
+        )
 
-        return new_audio_filters
+    # Integrity Test 0: Positions and names are well formed, and names are unique within the plan
+    def is_well_formed(self) -> bool:
+        positions_len = len(self.start_positions)
+
+        return (
+            len(self.end_positions) == positions_len
+            and len(self.new_audio_filters) == positions_len
+            and all(
+                SeekCollector.is_valid_seek(position)
+                for position in self.start_positions + self.end_positions
+            )
+            and SeekCollector.is_valid_output_name(
+                ",".join(self.output_names), positions_len, self.all_output_names
+            )
+        )
 
     # Integrity Test 1: Positions should be within source file duration
     def is_within_source_duration(self) -> bool:
-        source_file_duration = float(self.source_file.file_format["format"]["duration"])
+        source_file_duration = self.source_file.metadata.duration
 
         for start_position, end_position in zip(
-            self.start_positions_len, self.end_positions
+            self.start_positions, self.end_positions
         ):
             start_time = string_to_seconds(start_position) if start_position else 0
             end_time = (
@@ -102,9 +148,9 @@ class SeekCollector:
 
     # Integrity Test 2: Start position is before end position
     def is_start_before_end(self) -> bool:
-        source_file_duration = float(self.source_file.file_format["format"]["duration"])
+        source_file_duration = self.source_file.metadata.duration
         for start_position, end_position in zip(
-            self.start_positions_len, self.end_positions
+            self.start_positions, self.end_positions
         ):
             start_time = string_to_seconds(start_position) if start_position else 0
             end_time = (
@@ -126,6 +172,11 @@ class SeekCollector:
 
     # Integrity Tests with feedback
     def is_valid(self) -> bool:
+        # Malformed values would fail the duration tests below
+        if not self.is_well_formed():
+            logging.error("Positions or output names are invalid")
+            return False
+
         is_valid = True
 
         if not self.is_within_source_duration():
@@ -136,9 +187,8 @@ class SeekCollector:
             is_valid = False
             logging.error("Start Position is not before End Position")
 
-        if not is_valid:
-            SeekCollector.all_output_names.clear()
-            SeekCollector.start_positions_len = 0
+        if is_valid:
+            self.all_output_names.update(self.output_names)
 
         return is_valid
 
@@ -147,7 +197,7 @@ class SeekCollector:
         seek_list = []
 
         for start_position, end_position, output_name, new_audio_filter in zip(
-            self.start_positions_len,
+            self.start_positions,
             self.end_positions,
             self.output_names,
             self.new_audio_filters,
@@ -0,0 +1,339 @@
+from ._bounded_cache import BoundedCache
+from ._encoding_config import EncodingConfig
+from ._metrics import metrics
+from ._process_runner import process_runner
+from ._tracer import tracer
+from ._utils import seconds_to_string
+from ._utils import string_to_seconds
+
+import hashlib
+import logging
+import os
+
+# NumPy is an optional dependency of the locator: pip install animethemes-batch-encoder[locator]
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Locate the seeks of a reference source file in other source files, such as the OP of every episode of a season
+# The audio of each source is decoded to low-rate mono and reduced to the log energies of a few spectral bands per frame,
+# and the frames of the reference seek are cross-correlated with the frames of the other sources
+# Confidence is the mean cosine similarity of the frames at the best offset, 1 for identical audio
+class SeekLocator:
+    # Fingerprints by source file and audio stream
+    fingerprint_cache = BoundedCache(64)
+
+    sample_rate = 8000
+
+    # Frames of 128 ms every 100 ms, the resolution of the proposed seeks
+    frame_size = 1024
+    hop_size = 800
+
+    # Log-spaced bands over the range that survives lossy audio codecs
+    band_count = 16
+    min_frequency = 150
+    max_frequency = 3800
+
+    # Frames more than 60 dB below the loudest frame of the source are silence and never match
+    silence_threshold = 6
+
+    # Frames per FFT, to bound the memory of long sources
+    chunk_frames = 4096
+
+    def __init__(
+        self,
+        cache_directory=None,
+        min_confidence=EncodingConfig.default_locator_min_confidence,
+    ):
+        self.cache_directory = cache_directory
+        self.min_confidence = min_confidence
+
+    @classmethod
+    def from_config(cls, encoding_config, cache_directory=None):
+        return cls(
+            cache_directory=cache_directory,
+            min_confidence=encoding_config.locator_min_confidence,
+        )
+
+    @staticmethod
+    def is_available() -> bool:
+        return numpy is not None
+
+    @staticmethod
+    def get_decode_args(source_file) -> list[str]:
+        return [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-i",
+            source_file.file,
+            "-map",
+            f"0:a:{source_file.selected_audio_stream}",
+            "-vn",
+            "-sn",
+            "-dn",
+            "-ac",
+            "1",
+            "-ar",
+            str(SeekLocator.sample_rate),
+            "-f",
+            "s16le",
+            "-",
+        ]
+
+    # FFT bins of the edges of our bands
+    @staticmethod
+    def get_band_edges():
+        frequencies = numpy.geomspace(
+            SeekLocator.min_frequency,
+            SeekLocator.max_frequency,
+            SeekLocator.band_count + 1,
+        )
+        return numpy.round(
+            frequencies * SeekLocator.frame_size / SeekLocator.sample_rate
+        ).astype(int)
+
+    # Log energies of our bands for each frame of the samples
+    @staticmethod
+    def get_fingerprint(samples):
+        if len(samples) < SeekLocator.frame_size:
+            return numpy.zeros((0, SeekLocator.band_count), dtype=numpy.float32)
+
+        frames = numpy.lib.stride_tricks.sliding_window_view(
+            samples, SeekLocator.frame_size
+        )[:: SeekLocator.hop_size]
+        window = numpy.hanning(SeekLocator.frame_size).astype(numpy.float32)
+        band_edges = SeekLocator.get_band_edges()
+
+        fingerprint = numpy.empty(
+            (len(frames), SeekLocator.band_count), dtype=numpy.float32
+        )
+        for start in range(0, len(frames), SeekLocator.chunk_frames):
+            chunk = frames[start : start + SeekLocator.chunk_frames] * window
+            power = numpy.abs(numpy.fft.rfft(chunk, axis=1)) ** 2
+            cumulative_power = numpy.cumsum(power, axis=1)
+            energies = (
+                cumulative_power[:, band_edges[1:] - 1]
+                - cumulative_power[:, band_edges[:-1] - 1]
+            )
+            fingerprint[start : start + len(chunk)] = numpy.log10(energies + 1e-6)
+
+        return fingerprint
+
+    # Frames as unit vectors of their spectral shape, without the spectral tilt of the source and its loudness
+    @staticmethod
+    def normalize(fingerprint):
+        loudness = numpy.log10(numpy.sum(10.0**fingerprint, axis=1) + 1e-6)
+        fingerprint = fingerprint - fingerprint.mean(axis=0)
+        fingerprint = fingerprint - fingerprint.mean(axis=1, keepdims=True)
+        norms = numpy.linalg.norm(fingerprint, axis=1, keepdims=True)
+        fingerprint = fingerprint / numpy.maximum(norms, 1e-6)
+
+        if len(loudness) > 0:
+            fingerprint[loudness < loudness.max() - SeekLocator.silence_threshold] = 0
+
+        return fingerprint
+
+    # Mean cosine similarity of the reference frames with the target frames at each offset of the target
+    @staticmethod
+    def correlate(reference, target):
+        size = 1 << (len(reference) + len(target) - 1).bit_length()
+        spectrum = numpy.fft.rfft(target, size, axis=0) * numpy.conj(
+            numpy.fft.rfft(reference, size, axis=0)
+        )
+        correlation = numpy.fft.irfft(spectrum.sum(axis=1), size)
+
+        reference_frames = max(1, numpy.count_nonzero(numpy.any(reference, axis=1)))
+        return correlation[: len(target) - len(reference) + 1] / reference_frames
+
+    # Fingerprints are cached by path, modification time, size and audio stream of the source file
+    @staticmethod
+    def get_key(source_file) -> tuple:
+        file_stat = os.stat(source_file.file)
+        return (
+            os.path.abspath(source_file.file),
+            file_stat.st_mtime_ns,
+            file_stat.st_size,
+            source_file.selected_audio_stream,
+        )
+
+    def get_cache_file(self, key) -> str | None:
+        if self.cache_directory is None:
+            return None
+
+        return os.path.join(
+            self.cache_directory,
+            hashlib.sha1(":".join(map(str, key)).encode("utf-8")).hexdigest()[:16]
+            + ".npy",
+        )
+
+    # The fingerprint of the source file from the memory or disk cache, None if it was never decoded
+    def get_cached_fingerprint(self, source_file):
+        key = SeekLocator.get_key(source_file)
+        fingerprint = SeekLocator.fingerprint_cache.get(key)
+        if fingerprint is not None:
+            metrics.inc(
+                "batch_encoder_cache_requests_total", cache="fingerprint", result="hit"
+            )
+            logging.debug(
+                f"[SeekLocator.get_cached_fingerprint] cache hit: '{source_file.file}'"
+            )
+            return fingerprint
+
+        cache_file = self.get_cache_file(key)
+        if cache_file is not None and os.path.isfile(cache_file):
+            metrics.inc(
+                "batch_encoder_cache_requests_total", cache="fingerprint", result="hit"
+            )
+            logging.debug(
+                f"[SeekLocator.get_cached_fingerprint] cache file: '{cache_file}'"
+            )
+            fingerprint = numpy.load(cache_file)
+            SeekLocator.fingerprint_cache[key] = fingerprint
+            return fingerprint
+
+        metrics.inc(
+            "batch_encoder_cache_requests_total", cache="fingerprint", result="miss"
+        )
+        return None
+
+    # Decode the audio of each source file once, later calls read the memory or disk cache
+    # Sources missing from the caches are decoded concurrently, decoded audio is held until it is fingerprinted,
+    # so at most as many sources as our process limit are decoded at a time
+    @tracer.traced
+    def get_source_fingerprints(self, source_files) -> list:
+        fingerprints = [
+            self.get_cached_fingerprint(source_file) for source_file in source_files
+        ]
+        missing = [
+            i for i, fingerprint in enumerate(fingerprints) if fingerprint is None
+        ]
+
+        batch_size = process_runner.max_processes
+        for batch_start in range(0, len(missing), batch_size):
+            batch = missing[batch_start : batch_start + batch_size]
+            for i in batch:
+                logging.info(f"Fingerprinting audio of '{source_files[i].file}'...")
+
+            results = process_runner.run_all(
+                [SeekLocator.get_decode_args(source_files[i]) for i in batch],
+                capture_stdout=True,
+            )
+            for i, result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    raise result
+                fingerprints[i] = self.add_fingerprint(source_files[i], result.stdout)
+
+        return fingerprints
+
+    # Fingerprint the decoded audio of the source file into the memory and disk cache
+    def add_fingerprint(self, source_file, audio):
+        key = SeekLocator.get_key(source_file)
+        cache_file = self.get_cache_file(key)
+        samples = numpy.frombuffer(audio, dtype="<i2").astype(numpy.float32) / 32768
+        fingerprint = SeekLocator.get_fingerprint(samples)
+
+        logging.debug(
+            f"[SeekLocator.add_fingerprint] file: '{source_file.file}', "
+            f"frames: '{len(fingerprint)}'"
+        )
+
+        if cache_file is not None:
+            os.makedirs(self.cache_directory, exist_ok=True)
+            cache_file_tmp = cache_file + ".tmp"
+            with open(cache_file_tmp, mode="wb") as f:
+                numpy.save(f, fingerprint)
+            os.replace(cache_file_tmp, cache_file)
+
+        SeekLocator.fingerprint_cache[key] = fingerprint
+        return fingerprint
+
+    # Best match of the reference frames in the normalized fingerprint of the source file as (ss, to, confidence), None below the minimum confidence
+    def locate_seek(self, reference, duration, source_file, fingerprint):
+        if len(reference) == 0 or len(fingerprint) < len(reference):
+            return None
+
+        correlation = SeekLocator.correlate(reference, fingerprint)
+        offset = int(numpy.argmax(correlation))
+        confidence = float(correlation[offset])
+
+        start_time = offset * SeekLocator.hop_size / SeekLocator.sample_rate
+        end_time = min(
+            start_time + duration,
+            source_file.metadata.duration,
+        )
+
+        logging.debug(
+            f"[SeekLocator.locate_seek] file: '{source_file.file}', "
+            f"start_time: '{start_time}', "
+            f"end_time: '{end_time}', "
+            f"confidence: '{confidence}'"
+        )
+
+        if confidence < self.min_confidence:
+            return None
+
+        return (
+            seconds_to_string(start_time),
+            seconds_to_string(end_time),
+            round(confidence, 3),
+        )
+
+    # Proposed seeks of each source file, in the order of the reference seeks of a single source file
+    # Source files are a mapping of our keys to SourceFile objects, such as the paths given by the user,
+    # or a list of SourceFile objects keyed by their path
+    # Sources are decoded concurrently
+    @tracer.traced
+    def locate(self, seeks, source_files) -> dict:
+        if not hasattr(source_files, "items"):
+            source_files = {
+                source_file.file: source_file for source_file in source_files
+            }
+
+        reference_file = seeks[0].source_file
+        keys = [
+            key
+            for key, source_file in source_files.items()
+            if source_file.file != reference_file.file
+        ]
+        all_source_files = [reference_file] + [source_files[key] for key in keys]
+
+        fingerprints = self.get_source_fingerprints(all_source_files)
+
+        reference_fingerprint = SeekLocator.normalize(fingerprints[0])
+        references = []
+        for seek in seeks:
+            start_time = string_to_seconds(seek.ss) if seek.ss else 0
+            start_frame = round(
+                start_time * SeekLocator.sample_rate / SeekLocator.hop_size
+            )
+            end_frame = start_frame + round(
+                seek.get_duration() * SeekLocator.sample_rate / SeekLocator.hop_size
+            )
+            references.append(
+                (reference_fingerprint[start_frame:end_frame], seek.get_duration())
+            )
+
+        proposals = {}
+        for key, source_file, fingerprint in zip(
+            keys, all_source_files[1:], fingerprints[1:]
+        ):
+            fingerprint = SeekLocator.normalize(fingerprint)
+            proposals[key] = [
+                self.locate_seek(reference, duration, source_file, fingerprint)
+                for reference, duration in references
+            ]
+
+            for seek, proposal in zip(seeks, proposals[key]):
+                if proposal is None:
+                    logging.info(f"No match for seek '{seek.output_name}' in '{key}'")
+                else:
+                    logging.info(
+                        f"Proposed seek ss: '{proposal[0]}', to: '{proposal[1]}' "
+                        f"for '{seek.output_name}' in '{key}' "
+                        f"with confidence '{proposal[2]}'"
+                    )
+
+        return proposals
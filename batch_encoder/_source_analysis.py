@@ -0,0 +1,307 @@
+from ._bounded_cache import BoundedCache
+from ._job_type import JobType
+from ._loudnorm_filter import LoudnormFilter
+from ._metrics import metrics
+from ._process_runner import process_runner
+from ._source_file import SourceFile
+from ._tracer import tracer
+from ._utils import string_to_seconds
+from appdirs import AppDirs
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shlex
+import subprocess
+
+
+# Analysis of a seek in a single decode of the source file
+# Silence, black frames, scene cuts, crop bars and interlacing are detected alongside the loudness measurement,
+# and the report picks the loudness normalization, suggests video filters and checks the boundaries of the seek
+class SourceAnalysis:
+    # Analysis reports by command and the paths, modification times and sizes of its inputs
+    analysis_cache = BoundedCache(4096)
+
+    # Lines of the detection filters, times are relative to the start of the seek
+    silence_start_pattern = re.compile(r"silence_start: (-?[\d.]+)")
+    silence_end_pattern = re.compile(r"silence_end: (-?[\d.]+)")
+    black_pattern = re.compile(r"black_start:\s*([\d.]+) black_end:\s*([\d.]+)")
+    scene_pattern = re.compile(r"lavfi\.scd\.time: ([\d.]+)")
+    crop_pattern = re.compile(r"crop=(\d+):(\d+):(\d+):(\d+)")
+    idet_pattern = re.compile(
+        r"Multi frame detection: TFF:\s*(\d+) BFF:\s*(\d+) Progressive:\s*(\d+)"
+    )
+
+    silence_filter = "silencedetect=noise=-50dB:duration=0.5"
+
+    # Cropdetect with reset=0 widens its crop over every frame, so its last crop covers the whole seek
+    video_analysis_filters = "blackdetect=d=0.1:pix_th=0.10,cropdetect=limit=24:round=2:reset=0,idet,scdet=threshold=10"
+
+    # Share of frames that must be interlaced to suggest deinterlacing
+    interlaced_ratio = 0.5
+
+    # Distance in seconds from the boundaries of the seek within which events are reported
+    boundary_tolerance = 0.5
+
+    def __init__(
+        self,
+        loudnorm_filter,
+        silences,
+        black_frames,
+        scene_cuts,
+        crop,
+        interlaced_frames,
+        progressive_frames,
+    ):
+        self.loudnorm_filter = loudnorm_filter
+        self.silences = silences
+        self.black_frames = black_frames
+        self.scene_cuts = scene_cuts
+        self.crop = crop
+        self.interlaced_frames = interlaced_frames
+        self.progressive_frames = progressive_frames
+
+    @classmethod
+    @tracer.traced
+    def from_seek(cls, seek):
+        return cls.from_command(SourceAnalysis.get_command(seek))
+
+    # Run the analysis command and parse the report from its output line by line
+    # Reports are cached in memory and in the user cache directory until a source file is replaced,
+    # so that the analysis job of a plan reuses the report of the video filter prompt
+    # Jobs of our plan analyze through the resource governor of the scheduler if there is one
+    @classmethod
+    @tracer.traced
+    def from_command(cls, analysis_cmd, cwd=None, governor=None, job=None):
+        analysis_args = shlex.split(analysis_cmd)
+        key = (analysis_cmd, SourceFile.get_input_keys(analysis_args, cwd))
+        source_analysis = SourceAnalysis.analysis_cache.get(key)
+        if source_analysis is not None:
+            metrics.inc(
+                "batch_encoder_cache_requests_total", cache="analysis", result="hit"
+            )
+            logging.debug(f"[SourceAnalysis.from_command] cache hit: '{analysis_cmd}'")
+            return source_analysis
+
+        cache_file = SourceAnalysis.get_cache_file(key)
+        if os.path.isfile(cache_file):
+            metrics.inc(
+                "batch_encoder_cache_requests_total", cache="analysis", result="hit"
+            )
+            logging.debug(f"[SourceAnalysis.from_command] cache file: '{cache_file}'")
+            with open(cache_file, mode="r", encoding="utf8") as f:
+                source_analysis = cls.from_report(json.load(f))
+            SourceAnalysis.analysis_cache[key] = source_analysis
+            return source_analysis
+
+        metrics.inc(
+            "batch_encoder_cache_requests_total", cache="analysis", result="miss"
+        )
+        logging.info("Retrieving analysis data...")
+
+        silences, black_frames, scene_cuts = [], [], []
+        state = {"silence_start": None, "crop": None, "idet": None}
+        loudnorm_lines = []
+
+        def parse_line(line):
+            # The loudness data is a JSON object printed over several lines at the end of the decode
+            if line == "{" or (
+                loudnorm_lines and not loudnorm_lines[-1].startswith("}")
+            ):
+                loudnorm_lines.append(line)
+            elif match := SourceAnalysis.silence_start_pattern.search(line):
+                state["silence_start"] = max(0.0, float(match.group(1)))
+            elif (match := SourceAnalysis.silence_end_pattern.search(line)) and state[
+                "silence_start"
+            ] is not None:
+                silences.append((state["silence_start"], float(match.group(1))))
+                state["silence_start"] = None
+            elif match := SourceAnalysis.black_pattern.search(line):
+                black_frames.append((float(match.group(1)), float(match.group(2))))
+            elif match := SourceAnalysis.scene_pattern.search(line):
+                scene_cuts.append(float(match.group(1)))
+            elif match := SourceAnalysis.crop_pattern.search(line):
+                state["crop"] = tuple(int(value) for value in match.groups())
+            elif match := SourceAnalysis.idet_pattern.search(line):
+                state["idet"] = tuple(int(value) for value in match.groups())
+
+        if governor is not None:
+            returncode = governor.call(
+                analysis_cmd,
+                JobType.ANALYSIS,
+                cwd=cwd,
+                job=job,
+                stderr_callback=parse_line,
+            )
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, analysis_cmd)
+        else:
+            process_runner.run(analysis_args, cwd=cwd, stderr_callback=parse_line)
+        if not loudnorm_lines:
+            raise ValueError(f"Loudness data missing from output of '{analysis_cmd}'")
+
+        silence_start, crop, idet = state["silence_start"], state["crop"], state["idet"]
+
+        # Silence that lasts until the end of the seek has no end line
+        if silence_start is not None:
+            silences.append((silence_start, None))
+
+        source_analysis = cls(
+            LoudnormFilter.from_stats(json.loads("\n".join(loudnorm_lines))),
+            silences,
+            black_frames,
+            scene_cuts,
+            crop,
+            idet[0] + idet[1] if idet is not None else 0,
+            idet[2] if idet is not None else 0,
+        )
+
+        logging.debug(
+            f"[SourceAnalysis.from_command] silences: '{silences}', "
+            f"black_frames: '{black_frames}', "
+            f"scene_cuts: '{len(scene_cuts)}', "
+            f"crop: '{crop}', "
+            f"idet: '{idet}'"
+        )
+
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        cache_file_tmp = cache_file + ".tmp"
+        with open(cache_file_tmp, mode="w", encoding="utf8") as f:
+            json.dump(source_analysis.get_report(), f)
+        os.replace(cache_file_tmp, cache_file)
+
+        SourceAnalysis.analysis_cache[key] = source_analysis
+
+        return source_analysis
+
+    @staticmethod
+    def get_cache_file(key) -> str:
+        dirs = AppDirs("batch_encoder", "AnimeThemes")
+        return os.path.join(
+            dirs.user_cache_dir,
+            "analysis",
+            hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16] + ".json",
+        )
+
+    # The report as written to the cache directory
+    def get_report(self) -> dict:
+        return {
+            "loudnorm": vars(self.loudnorm_filter),
+            "silences": self.silences,
+            "black_frames": self.black_frames,
+            "scene_cuts": self.scene_cuts,
+            "crop": self.crop,
+            "interlaced_frames": self.interlaced_frames,
+            "progressive_frames": self.progressive_frames,
+        }
+
+    @classmethod
+    def from_report(cls, report):
+        return cls(
+            LoudnormFilter.from_stats(report["loudnorm"]),
+            [tuple(silence) for silence in report["silences"]],
+            [tuple(black_frame) for black_frame in report["black_frames"]],
+            report["scene_cuts"],
+            tuple(report["crop"]) if report["crop"] is not None else None,
+            report["interlaced_frames"],
+            report["progressive_frames"],
+        )
+
+    # Analyze the seek in a job of our plan, log the events at its boundaries
+    # and write the audio filtergraph for the encodes that depend on it
+    @classmethod
+    def from_job(cls, job, governor=None):
+        source_analysis = cls.from_command(
+            job.command, cwd=job.cwd, governor=governor, job=job
+        )
+
+        for hint in source_analysis.get_boundary_hints(job.options["duration"]):
+            logging.info(f"{job.options['output_name']}: {hint}")
+
+        audio_filters = (
+            job.options["pre_filters"]
+            + [source_analysis.loudnorm_filter.get_normalization_filter()]
+            + job.options["post_filters"]
+        )
+        filter_script = job.get_path(job.options["filter_script"])
+        with open(filter_script, mode="w", encoding="utf8") as f:
+            f.write(",".join(audio_filters))
+
+        return source_analysis
+
+    # The analysis command for the seek, with the audio filters of the loudness measurement
+    # Sources with slow seek are trimmed by the filters, so that only the seek is analyzed
+    # and the detection filters report times relative to its start
+    @staticmethod
+    def get_command(seek) -> str:
+        seek_string = seek.get_seek_string()
+        video_filters = [SourceAnalysis.video_analysis_filters]
+        audio_filters = [
+            SourceAnalysis.silence_filter,
+            LoudnormFilter.get_first_pass_filters(seek),
+        ]
+        if seek.source_file.file.endswith(".m2ts") and len(seek.ss) > 0:
+            seek_string = f'-i "{seek.source_file.file}"'
+            trim = f"start={string_to_seconds(seek.ss)}" + (
+                f":end={string_to_seconds(seek.to)}" if len(seek.to) > 0 else ""
+            )
+            video_filters.insert(0, f"trim={trim},setpts=PTS-STARTPTS")
+            audio_filters.insert(0, f"atrim={trim},asetpts=PTS-STARTPTS")
+
+        return (
+            f"ffmpeg -nostats {seek_string} "
+            f"-map 0:v:{seek.source_file.selected_video_stream} "
+            f"-map 0:a:{seek.source_file.selected_audio_stream} "
+            f"-vf {','.join(video_filters)} "
+            f"-af {','.join(audio_filters)} "
+            f"-sn -dn -f null -"
+        )
+
+    def is_interlaced(self) -> bool:
+        frames = self.interlaced_frames + self.progressive_frames
+        return (
+            frames > 0
+            and self.interlaced_frames / frames >= SourceAnalysis.interlaced_ratio
+        )
+
+    # Video filter for the crop bars and interlacing of the seek, None if the picture is clean
+    def get_video_filter(self, source_file) -> str | None:
+        video_filters = []
+        if self.is_interlaced():
+            video_filters.append("bwdif=mode=send_frame")
+
+        if self.crop is not None and (
+            self.crop[0] < source_file.metadata.width
+            or self.crop[1] < source_file.metadata.height
+        ):
+            video_filters.append("crop={}:{}:{}:{}".format(*self.crop))
+
+        return ",".join(video_filters) or None
+
+    # Black frames, silence and scene cuts at the boundaries of a seek of the duration
+    def get_boundary_hints(self, duration) -> list[str]:
+        tolerance = SourceAnalysis.boundary_tolerance
+        hints = []
+
+        for kind, ranges in [
+            ("black frames", self.black_frames),
+            ("silence", self.silences),
+        ]:
+            for start, end in ranges:
+                end = end if end is not None else duration
+                if start <= tolerance:
+                    hints.append(f"Seek starts with {end:.2f}s of {kind}")
+                if end >= duration - tolerance:
+                    hints.append(f"Seek ends with {duration - start:.2f}s of {kind}")
+
+        for scene_cut in self.scene_cuts:
+            if 0 < scene_cut <= tolerance:
+                hints.append(f"Scene cut {scene_cut:.2f}s after the start of the seek")
+            if duration - tolerance <= scene_cut < duration:
+                hints.append(
+                    f"Scene cut {duration - scene_cut:.2f}s before the end of the seek"
+                )
+
+        return hints
@@ -0,0 +1,174 @@
+from ._metrics import metrics
+from ._tracer import tracer
+
+import hashlib
+import json
+import logging
+import os
+import shlex
+import shutil
+import tempfile
+import threading
+import time
+
+
+# Local copies of source files on slow network mounts
+# A source file is copied once into '[Key]/[File Name]' of the cache directory, and probes and commands read the copy
+# The least recently used copies are evicted to keep the cache under its budget
+# Copies are pinned by the plans that read them until their batch has finished
+class SourceCache:
+    # Index of the cache directories shared by the generators of this process
+    source_cache_lock = threading.Lock()
+
+    index_file = "index.json"
+
+    # Pins older than this are ignored, such as those of plans that were never executed
+    pin_expiry = 7 * 24 * 3600
+
+    def __init__(self, directory, budget):
+        self.directory = directory
+        self.budget = budget
+
+    # Budget is configured in MiB
+    @classmethod
+    def from_config(cls, encoding_config):
+        return cls(
+            encoding_config.source_cache_directory,
+            encoding_config.source_cache_size * 2**20,
+        )
+
+    # Copies are keyed by path, modification time and size of the source file
+    @staticmethod
+    def get_key(file) -> str:
+        file_stat = os.stat(file)
+        return hashlib.sha1(
+            f"{os.path.abspath(file)}:{file_stat.st_mtime_ns}:{file_stat.st_size}".encode(
+                "utf-8"
+            )
+        ).hexdigest()[:16]
+
+    def load(self) -> dict:
+        index_file = os.path.join(self.directory, SourceCache.index_file)
+        if not os.path.isfile(index_file):
+            return {}
+
+        with open(index_file, mode="r", encoding="utf8") as f:
+            return json.load(f)
+
+    def save(self, index) -> None:
+        index_file = os.path.join(self.directory, SourceCache.index_file)
+        index_file_tmp = index_file + ".tmp"
+        with open(index_file_tmp, mode="w", encoding="utf8") as f:
+            json.dump(index, f)
+        os.replace(index_file_tmp, index_file)
+
+    # Whether queued jobs may still read the copy
+    @staticmethod
+    def is_pinned(entry) -> bool:
+        return (
+            entry.get("pins", 0) > 0
+            and time.time() - entry["last_used"] < SourceCache.pin_expiry
+        )
+
+    # Remove the least recently used copies until the cache fits in the budget
+    # Pinned copies are kept
+    def evict(self, index) -> None:
+        cache_size = sum(entry["size"] for entry in index.values())
+        for key in sorted(index, key=lambda key: index[key]["last_used"]):
+            if cache_size <= self.budget:
+                break
+
+            if SourceCache.is_pinned(index[key]):
+                continue
+
+            logging.info(f"Evicting staged copy of '{index[key]['file']}'")
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+            cache_size -= index.pop(key)["size"]
+
+    # Path of the local copy of the source file, copied on first use
+    # Source files beyond the budget are read from their original path
+    @tracer.traced
+    def stage(self, file) -> str:
+        key = SourceCache.get_key(file)
+        staged_file = os.path.join(self.directory, key, os.path.basename(file))
+
+        with SourceCache.source_cache_lock:
+            index = self.load()
+            if key in index and os.path.isfile(staged_file):
+                metrics.inc(
+                    "batch_encoder_cache_requests_total", cache="source", result="hit"
+                )
+                logging.debug(f"[SourceCache.stage] cache hit: '{file}'")
+                index[key]["last_used"] = time.time()
+                index[key]["pins"] = index[key].get("pins", 0) + 1
+                self.save(index)
+                return staged_file
+
+        metrics.inc("batch_encoder_cache_requests_total", cache="source", result="miss")
+
+        file_size = os.path.getsize(file)
+        if file_size > self.budget:
+            logging.info(f"Reading '{file}' in place, it exceeds the source cache size")
+            return file
+
+        logging.info(f"Staging '{file}' to '{staged_file}'...")
+        os.makedirs(os.path.dirname(staged_file), exist_ok=True)
+
+        # Concurrent stages of the same source file copy to their own temporary file, the last one replaces the others
+        fd, staged_file_tmp = tempfile.mkstemp(
+            suffix=".part", dir=os.path.dirname(staged_file)
+        )
+        os.close(fd)
+        try:
+            shutil.copyfile(file, staged_file_tmp)
+            os.replace(staged_file_tmp, staged_file)
+        except BaseException:
+            if os.path.isfile(staged_file_tmp):
+                os.remove(staged_file_tmp)
+            raise
+
+        with SourceCache.source_cache_lock:
+            index = self.load()
+            index[key] = {
+                "file": os.path.abspath(file),
+                "size": file_size,
+                "last_used": time.time(),
+                "pins": index.get(key, {}).get("pins", 0) + 1,
+            }
+            self.evict(index)
+            self.save(index)
+
+        return staged_file
+
+    # Keys of the copies read by the commands of the jobs
+    def get_keys(self, jobs) -> set[str]:
+        keys = set()
+        for job in jobs:
+            try:
+                args = shlex.split(job.command or "")
+            except ValueError:
+                continue
+
+            for i, arg in enumerate(args[:-1]):
+                staged_dir = os.path.dirname(os.path.abspath(args[i + 1]))
+                if arg == "-i" and os.path.dirname(staged_dir) == os.path.abspath(
+                    self.directory
+                ):
+                    keys.add(os.path.basename(staged_dir))
+
+        return keys
+
+    # Unpin the copies read by the jobs of a finished batch
+    def release(self, jobs) -> None:
+        keys = self.get_keys(jobs)
+        if not keys:
+            return
+
+        with SourceCache.source_cache_lock:
+            index = self.load()
+            for key in keys:
+                if key in index:
+                    index[key]["pins"] = max(0, index[key].get("pins", 0) - 1)
+            self.save(index)
+
+        logging.debug(f"[SourceCache.release] keys: '{keys}'")
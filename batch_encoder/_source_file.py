@@ -1,67 +1,110 @@
+from ._bounded_cache import BoundedCache
+from ._metrics import metrics
+from ._process_runner import process_runner
+from ._source_cache import SourceCache
+from ._source_metadata import SourceMetadata
+from ._tracer import tracer
+
 import json
 import logging
 import os
-import subprocess
+import shutil
+import tempfile
 
 
 # Abstraction of the source file from which we are producing our encodes
 # We are prefetching properties of the source file audio/video streams to help determine encoding argument values
 class SourceFile:
-    format_args = [
-        "ffprobe",
-        "-v",
-        "quiet",
-        "-print_format",
-        "json",
-        "-show_streams",
-        "-show_format",
-        "-show_chapters",
-    ]
+    # Probe results by source file and kind of probe
+    probe_cache = BoundedCache(512)
 
     def __init__(
         self,
         file,
-        file_format,
+        metadata,
         selected_video_stream,
         selected_audio_stream,
-        video_format,
-        audio_format,
     ):
         self.file = file
-        self.file_format = file_format
+        self.metadata = metadata
         self.selected_video_stream = selected_video_stream
         self.selected_audio_stream = selected_audio_stream
-        self.video_format = video_format
-        self.audio_format = audio_format
 
+    # Streams are chosen by argument, then by the config defaults, then by prompt unless interactive is disabled
     @classmethod
-    def from_file(cls, file, encoding_config):
-        video_file = None
-        audio_file = None
+    @tracer.traced
+    def from_file(
+        cls,
+        file,
+        encoding_config,
+        video_stream=None,
+        audio_stream=None,
+        interactive=True,
+    ):
+        # Probes and commands read the local copy of source files on network mounts
+        if encoding_config.source_cache_directory:
+            file = SourceCache.from_config(encoding_config).stage(file)
+
+        temp_dir = None
         try:
-            file_format = SourceFile.get_file_format(file)
+            metadata = SourceFile.get_metadata(file)
 
-            selected_video_stream = SourceFile.get_default_stream(
-                file_format, "video", encoding_config
+            selected_video_stream = (
+                video_stream
+                if video_stream is not None
+                else SourceFile.get_default_stream(metadata, "video", encoding_config)
             )
             if selected_video_stream is None:
                 selected_video_stream = SourceFile.get_selected_stream(
-                    file_format, "video"
+                    metadata, "video", interactive
                 )
 
-            selected_audio_stream = SourceFile.get_default_stream(
-                file_format, "audio", encoding_config
+            selected_audio_stream = (
+                audio_stream
+                if audio_stream is not None
+                else SourceFile.get_default_stream(metadata, "audio", encoding_config)
             )
             if selected_audio_stream is None:
                 selected_audio_stream = SourceFile.get_selected_stream(
-                    file_format, "audio"
+                    metadata, "audio", interactive
                 )
 
+            # Warm probes skip the demux of the selected streams
+            stream_key = SourceFile.get_probe_key(
+                file, f"{selected_video_stream}:{selected_audio_stream}"
+            )
+            stream_metadata = SourceFile.probe_cache.get(stream_key)
+            if stream_metadata is not None:
+                metrics.inc(
+                    "batch_encoder_cache_requests_total", cache="probe", result="hit"
+                )
+                logging.debug(f"[SourceFile.from_file] cache hit: '{file}'")
+                return cls(
+                    file,
+                    stream_metadata,
+                    selected_video_stream,
+                    selected_audio_stream,
+                )
+
+            metrics.inc(
+                "batch_encoder_cache_requests_total", cache="probe", result="miss"
+            )
             logging.info("Retrieving extracted audio/video stream/format data...")
 
-            video_file = "[Video]" + file
-            logging.debug(f"[SourceFile.from_file] video_file: '{video_file}'")
-            audio_file = "[Audio]" + file
+            # The video stream is probed in place, only the audio stream is demuxed for its bitrate
+            video_probe = json.loads(
+                process_runner.probe(
+                    SourceFile.get_probe_args(
+                        file, SourceMetadata.video_entries, f"v:{selected_video_stream}"
+                    )
+                )
+            )
+
+            # Demuxed streams go to a private directory so concurrent probes never collide
+            temp_dir = tempfile.mkdtemp(
+                prefix="batch_encoder-", dir=encoding_config.scratch_directory or None
+            )
+            audio_file = os.path.join(temp_dir, "[Audio]" + os.path.basename(file))
             logging.debug(f"[SourceFile.from_file] audio_file: '{audio_file}'")
 
             demux_args = [
@@ -71,92 +114,102 @@ class SourceFile:
                 "-v",
                 "quiet",
                 "-y",
+                "-vn",
                 "-sn",
                 "-dn",
                 "-map",
-                f"0:v:{selected_video_stream}",
-                "-vcodec",
-                "copy",
-                video_file,
-                "-map",
                 f"0:a:{selected_audio_stream}",
                 "-acodec",
                 "copy",
                 audio_file,
             ]
-            subprocess.call(demux_args)
+            process_runner.run(demux_args, check=False, temp_paths=[audio_file])
 
-            video_args = SourceFile.format_args + [video_file]
-            video_format = subprocess.check_output(video_args).decode("utf-8")
-            video_format = json.loads(video_format)
-
-            os.remove(video_file)
-            logging.debug(
-                f"[SourceFile.from_file] video_file deleted: {not os.path.isfile(video_file)}"
+            audio_probe = json.loads(
+                process_runner.probe(
+                    SourceFile.get_probe_args(audio_file, SourceMetadata.audio_entries)
+                )
             )
 
-            audio_args = SourceFile.format_args + [audio_file]
-            audio_format = subprocess.check_output(audio_args).decode("utf-8")
-            audio_format = json.loads(audio_format)
-
             os.remove(audio_file)
             logging.debug(
                 f"[SourceFile.from_file] audio_file deleted: {not os.path.isfile(audio_file)}"
             )
 
+            os.rmdir(temp_dir)
+
+            metadata = metadata.with_streams(video_probe, audio_probe)
+            SourceFile.probe_cache[stream_key] = metadata
+
             return cls(
                 file,
-                file_format,
+                metadata,
                 selected_video_stream,
                 selected_audio_stream,
-                video_format,
-                audio_format,
             )
-        except KeyboardInterrupt:
-            logging.info("Attempting to delete temp files after keyboard interrupt")
+        finally:
+            # Temp files are left behind by failed probes and keyboard interrupts
+            if temp_dir is not None and os.path.isdir(temp_dir):
+                logging.info("Deleting temp files after interrupted probe")
+                shutil.rmtree(temp_dir)
 
-            if os.path.isfile(video_file):
-                os.remove(video_file)
-
-            if os.path.isfile(audio_file):
-                os.remove(audio_file)
+    # FFprobe arguments for the entries of the file, of the selected stream if any
+    @staticmethod
+    def get_probe_args(file, entries, select_streams=None) -> list[str]:
+        args = ["ffprobe", "-v", "quiet", "-print_format", "json"]
+        if select_streams is not None:
+            args += ["-select_streams", select_streams]
 
-            raise
+        return args + ["-show_entries", entries, file]
 
-    # Source file streams/formats
+    # Source file duration and stream counts
     @staticmethod
-    def get_file_format(file):
-        logging.info("Retrieving source file stream/format data...")
-        format_args = SourceFile.format_args + [file]
+    @tracer.traced
+    def get_metadata(file):
+        format_key = SourceFile.get_probe_key(file, "format")
+        metadata = SourceFile.probe_cache.get(format_key)
+        if metadata is not None:
+            metrics.inc(
+                "batch_encoder_cache_requests_total", cache="format", result="hit"
+            )
+            logging.debug(f"[SourceFile.get_metadata] cache hit: '{file}'")
+            return metadata
 
-        file_format = subprocess.check_output(format_args).decode("utf-8")
+        metrics.inc("batch_encoder_cache_requests_total", cache="format", result="miss")
 
-        return json.loads(file_format)
+        logging.info("Retrieving source file stream/format data...")
+        format_probe = process_runner.probe(
+            SourceFile.get_probe_args(file, SourceMetadata.format_entries)
+        )
+        metadata = SourceMetadata.from_format_probe(json.loads(format_probe))
+        SourceFile.probe_cache[format_key] = metadata
 
-    # Get the number of streams of the codec type (audio/video)
-    @staticmethod
-    def get_stream_count(file_format, target_codec_type) -> int:
-        count = 0
+        return metadata
 
-        for stream in file_format["streams"]:
-            if stream["codec_type"] == target_codec_type:
-                count += 1
+    # Probes are cached until the source file is modified
+    @staticmethod
+    def get_probe_key(file, kind) -> tuple:
+        file_stat = os.stat(file)
+        return (os.path.abspath(file), file_stat.st_mtime_ns, file_stat.st_size, kind)
 
-        logging.debug(
-            f"[SourceFile.get_stream_count] target_codec_type: '{target_codec_type}', count: '{count}'"
+    # Keys of the input files of a command, so that results cached by command expire with their sources
+    @staticmethod
+    def get_input_keys(args, cwd=None) -> tuple:
+        return tuple(
+            SourceFile.get_probe_key(os.path.join(cwd or ".", args[i + 1]), "input")
+            for i, arg in enumerate(args[:-1])
+            if arg == "-i"
         )
 
-        return count
-
     # Validate default stream selection before prompting the user to specify which stream to use
     @staticmethod
-    def get_default_stream(file_format, stream_type, encoding_config) -> int | None:
+    def get_default_stream(metadata, stream_type, encoding_config) -> int | None:
         # Exit early if default stream is not set
         default_stream = encoding_config.get_default_stream(stream_type)
         if not default_stream:
             return None
 
-        stream_count = SourceFile.get_stream_count(file_format, stream_type)
+        stream_count = metadata.get_stream_count(stream_type)
         try:
             default_stream = int(default_stream)
             if default_stream in range(stream_count):
@@ -172,11 +225,16 @@ class SourceFile:
     # If there exists more than one stream for a codec type (audio/video),
     # we want the user to specify which stream to use
     @staticmethod
-    def get_selected_stream(file_format, stream_type) -> int:
-        stream_count = SourceFile.get_stream_count(file_format, stream_type)
+    def get_selected_stream(metadata, stream_type, interactive=True) -> int:
+        stream_count = metadata.get_stream_count(stream_type)
         if stream_count <= 1:
             return 0
 
+        if not interactive:
+            raise ValueError(
+                f"Source file has {stream_count} {stream_type} streams, a stream must be selected"
+            )
+
         streams = range(stream_count)
         prompt_text = f"Select {stream_type} stream [0-{stream_count - 1}]: "
         while True:
@@ -190,7 +248,5 @@ class SourceFile:
 
     # If our source file audio stream is not a 2-channel stereo layout, we need to resample it before normalization
     def apply_audio_resampling(self, audio_filters) -> None:
-        channels = int(self.audio_format["streams"][0].get("channels", 2))
-        channel_layout = self.audio_format["streams"][0].get("channel_layout", "stereo")
-        if channels != 2 or channel_layout != "stereo":
+        if self.metadata.channels != 2 or self.metadata.channel_layout != "stereo":
             audio_filters.append("aresample=ochl=stereo")
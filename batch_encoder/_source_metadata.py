@@ -0,0 +1,113 @@
+import logging
+
+
+# The properties of the source file that determine our encoding arguments
+# Probes are limited to these entries, and the record keeps no other probe data, so that sources are cheap to hold
+class SourceMetadata:
+    # Entries of the probe of the source file, for the selection of streams and the duration of seeks
+    format_entries = "format=duration:stream=codec_type"
+
+    # Entries of the probe of the selected video stream
+    video_entries = (
+        "stream=width,height,avg_frame_rate,color_space,color_primaries,color_transfer"
+    )
+
+    # Entries of the probe of the demuxed audio stream, its container bitrate is the bitrate of the stream
+    audio_entries = "format=bit_rate:stream=channels,channel_layout"
+
+    __slots__ = (
+        "duration",
+        "video_stream_count",
+        "audio_stream_count",
+        "width",
+        "height",
+        "avg_frame_rate",
+        "color_space",
+        "color_primaries",
+        "color_transfer",
+        "audio_bit_rate",
+        "channels",
+        "channel_layout",
+    )
+
+    def __init__(
+        self,
+        duration,
+        video_stream_count,
+        audio_stream_count,
+        width=0,
+        height=0,
+        avg_frame_rate="24000/1001",
+        color_space="",
+        color_primaries="",
+        color_transfer="",
+        audio_bit_rate=0,
+        channels=2,
+        channel_layout="stereo",
+    ):
+        self.duration = duration
+        self.video_stream_count = video_stream_count
+        self.audio_stream_count = audio_stream_count
+        self.width = width
+        self.height = height
+        self.avg_frame_rate = avg_frame_rate
+        self.color_space = color_space
+        self.color_primaries = color_primaries
+        self.color_transfer = color_transfer
+        self.audio_bit_rate = audio_bit_rate
+        self.channels = channels
+        self.channel_layout = channel_layout
+
+    # Duration and stream counts from the probe of the source file
+    @classmethod
+    def from_format_probe(cls, probe):
+        streams = probe.get("streams", [])
+        return cls(
+            float(probe["format"]["duration"]),
+            sum(1 for stream in streams if stream.get("codec_type") == "video"),
+            sum(1 for stream in streams if stream.get("codec_type") == "audio"),
+        )
+
+    # Our record with the properties of the selected streams from their probes
+    def with_streams(self, video_probe, audio_probe):
+        video_stream = (video_probe.get("streams") or [{}])[0]
+        audio_stream = (audio_probe.get("streams") or [{}])[0]
+        audio_bit_rate = audio_probe.get("format", {}).get("bit_rate", "0")
+
+        metadata = SourceMetadata(
+            self.duration,
+            self.video_stream_count,
+            self.audio_stream_count,
+            int(video_stream.get("width", 0)),
+            int(video_stream.get("height", 0)),
+            video_stream.get("avg_frame_rate", "24000/1001"),
+            video_stream.get("color_space", ""),
+            video_stream.get("color_primaries", ""),
+            video_stream.get("color_transfer", ""),
+            int(audio_bit_rate) if audio_bit_rate.isdigit() else 0,
+            int(audio_stream.get("channels", 2)),
+            audio_stream.get("channel_layout", "stereo"),
+        )
+
+        logging.debug(f"[SourceMetadata.with_streams] metadata: '{metadata}'")
+
+        return metadata
+
+    # Get the number of streams of the codec type (audio/video)
+    def get_stream_count(self, codec_type) -> int:
+        count = (
+            self.video_stream_count
+            if codec_type == "video"
+            else self.audio_stream_count
+        )
+
+        logging.debug(
+            f"[SourceMetadata.get_stream_count] codec_type: '{codec_type}', count: '{count}'"
+        )
+
+        return count
+
+    def __repr__(self):
+        return "SourceMetadata({})".format(
+            ", ".join(f"{slot}={getattr(self, slot)!r}" for slot in self.__slots__)
+        )
@@ -0,0 +1,78 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+
+# Nested spans of the stages of plan generation and execution in the Chrome trace event format
+# Attributes of a span such as source, seek and variant are inherited by the spans nested in it
+# Spans are only recorded once the tracer is enabled with a trace file
+class Tracer:
+    def __init__(self):
+        self.file = None
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.start_time = time.perf_counter()
+
+    def enable(self, file) -> None:
+        self.file = file
+
+    def get_attributes(self) -> dict:
+        return getattr(self.local, "attributes", {})
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        if self.file is None:
+            yield
+            return
+
+        parent_attributes = self.get_attributes()
+        self.local.attributes = dict(parent_attributes, **attributes)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            end_time = time.perf_counter()
+            event = {
+                "name": name,
+                "cat": "batch_encoder",
+                "ph": "X",
+                "ts": round((start_time - self.start_time) * 1e6),
+                "dur": round((end_time - start_time) * 1e6),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": self.local.attributes,
+            }
+            self.local.attributes = parent_attributes
+
+            with self.lock:
+                self.events.append(event)
+
+    # Record a span named after the qualified name of the function for each call
+    def traced(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.span(function.__qualname__):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    # Write the recorded spans to the trace file, replacing the file atomically
+    def write(self) -> None:
+        if self.file is None:
+            return
+
+        with self.lock:
+            events = list(self.events)
+
+        file_tmp = self.file + ".tmp"
+        with open(file_tmp, mode="w", encoding="utf8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        os.replace(file_tmp, self.file)
+
+
+# Tracer of this process, shared by the generation stages and the executor
+tracer = Tracer()
@@ -0,0 +1,284 @@
+from ._process_runner import ProcessRunner
+from ._process_runner import process_runner
+
+import asyncio
+import logging
+import os
+import re
+
+
+# Predict the full-seek size and quality of our ladder from short trial encodes
+# Trials encode a few evenly spaced samples of the seek, only rungs predicted to fit the size limit
+# and to meet the quality floor are kept for full encodes
+# Single-pass "-cpu-used 4" trials are not the size of our two-pass "-cpu-used 0" encodes, so their sizes
+# are corrected by the ratio of the two measured on one sample window of the seek
+class TrialPredictor:
+    sample_count = 4
+    sample_length = 2
+
+    # Summary line of the ssim filter
+    ssim_pattern = re.compile(r"SSIM .*All:([\d.]+)")
+
+    def __init__(self, encode_webm, encoding_config):
+        self.encode_webm = encode_webm
+        self.seek = encode_webm.seek
+        self.encoding_config = encoding_config
+        self.quality_floor = (
+            float(encoding_config.trial_quality_floor)
+            if encoding_config.trial_quality_floor
+            else None
+        )
+        self.windows = self.seek.get_sample_windows(
+            TrialPredictor.sample_count, TrialPredictor.sample_length
+        )
+        self.correction = 1.0
+
+    # Build filename for the trial encode of a sample window
+    def get_trial_filename(self, crf, filter_name, window) -> str:
+        return f"{self.seek.output_name}-trial-{crf}-{filter_name or 'unfiltered'}-{window}"
+
+    # Single-pass trial encode of a sample window
+    def get_trial(
+        self, encoding_mode, crf, video_filters, start, length, trial_filename
+    ):
+        return (
+            f"ffmpeg -v error {self.encode_webm.colorspace.get_args()} "
+            f"{self.seek.get_sample_seek_string(start, length)} "
+            f"-map 0:v:{self.seek.source_file.selected_video_stream} "
+            f"-c:v libvpx-vp9 "
+            f"{encoding_mode.second_pass_rate_control(self.encode_webm.cbr_bitrate, None, crf)} "
+            f"-cpu-used 4 -g {self.encode_webm.g} -threads 2{video_filters} -tile-columns {self.encode_webm.tile_columns} "
+            f"-frame-parallel 0 -auto-alt-ref 1 -lag-in-frames 25 -row-mt 1 -pix_fmt yuv420p "
+            f"-an -sn -dn -f webm -y {trial_filename}.webm"
+        )
+
+    # Two-pass encode of a sample window with the settings of our second passes
+    def get_calibration_passes(
+        self, encoding_mode, crf, video_filters, start, length, trial_filename
+    ) -> list[str]:
+        input_args = (
+            f"ffmpeg -v error {self.encode_webm.colorspace.get_args()} "
+            f"{self.seek.get_sample_seek_string(start, length)} "
+            f"-passlogfile {trial_filename} "
+            f"-map 0:v:{self.seek.source_file.selected_video_stream} "
+            f"-c:v libvpx-vp9"
+        )
+        encoder_args = (
+            f"-g {self.encode_webm.g} -threads 2 -tile-columns {self.encode_webm.tile_columns} "
+            f"-frame-parallel 0 -auto-alt-ref 1 -lag-in-frames 25 -row-mt {self.encode_webm.row_mt} "
+            f"-pix_fmt yuv420p -an -sn -dn"
+        )
+        return [
+            f"{input_args} -pass 1 "
+            f"{encoding_mode.first_pass_rate_control(self.encode_webm.cbr_bitrate, None, crf)} "
+            f"-cpu-used 4 {encoder_args} -f null -",
+            f"{input_args} -pass 2 "
+            f"{encoding_mode.second_pass_rate_control(self.encode_webm.cbr_bitrate, None, crf)} "
+            f"-cpu-used 0{video_filters} {encoder_args} -f webm -y {trial_filename}.webm",
+        ]
+
+    # Ratio of the size of a two-pass encode to the size of the trial encode of the middle sample window
+    # None if either encode failed
+    def get_correction(self, encoding_mode, crf, filter_value) -> float | None:
+        video_filters = self.encode_webm.get_video_filters(config_filter=filter_value)
+        start, length = self.windows[len(self.windows) // 2]
+        trial_filename = self.get_trial_filename(crf, "calibration", "trial")
+        calibration_filename = self.get_trial_filename(crf, "calibration", "two-pass")
+        temp_paths = [
+            f"{trial_filename}.webm",
+            f"{calibration_filename}.webm",
+            f"{calibration_filename}-0.log",
+        ]
+
+        process_runner.run(
+            self.get_trial(
+                encoding_mode, crf, video_filters, start, length, trial_filename
+            ),
+            check=False,
+            temp_paths=temp_paths,
+        )
+        for command in self.get_calibration_passes(
+            encoding_mode, crf, video_filters, start, length, calibration_filename
+        ):
+            process_runner.run(command, check=False, temp_paths=temp_paths)
+
+        correction = None
+        if os.path.isfile(f"{trial_filename}.webm") and os.path.isfile(
+            f"{calibration_filename}.webm"
+        ):
+            trial_size = os.path.getsize(f"{trial_filename}.webm")
+            if trial_size > 0:
+                correction = (
+                    os.path.getsize(f"{calibration_filename}.webm") / trial_size
+                )
+        ProcessRunner.remove_temp_paths(temp_paths)
+
+        logging.debug(
+            f"[TrialPredictor.get_correction] crf: '{crf}', correction: '{correction}'"
+        )
+
+        return correction
+
+    # SSIM of the trial encode against the source, scaled to the trial resolution
+    async def get_ssim(self, start, length, trial_filename) -> float | None:
+        ssim_args = (
+            ["ffmpeg", "-nostats", "-i", f"{trial_filename}.webm"]
+            + ["-ss", str(start), "-t", str(length), "-i", self.seek.source_file.file]
+            + [
+                "-lavfi",
+                f"[1:v:{self.seek.source_file.selected_video_stream}][0:v]scale2ref[ref][dist];"
+                f"[dist][ref]ssim",
+            ]
+            + ["-f", "null", "-"]
+        )
+        ssims = []
+
+        def parse_line(line):
+            if match := TrialPredictor.ssim_pattern.search(line):
+                ssims.append(float(match.group(1)))
+
+        await process_runner.run_async(
+            ssim_args, check=False, stderr_callback=parse_line
+        )
+
+        return ssims[-1] if ssims else None
+
+    # Encode the trials of a rung and extrapolate its full-seek size and quality
+    async def predict(self, encoding_mode, crf, filter_name, filter_value) -> dict:
+        video_filters = self.encode_webm.get_video_filters(config_filter=filter_value)
+        size, sampled_duration, ssims = 0, 0.0, []
+
+        for window, (start, length) in enumerate(self.windows):
+            trial_filename = self.get_trial_filename(crf, filter_name, window)
+            await process_runner.run_async(
+                self.get_trial(
+                    encoding_mode, crf, video_filters, start, length, trial_filename
+                ),
+                check=False,
+                temp_paths=[f"{trial_filename}.webm"],
+            )
+
+            if not os.path.isfile(f"{trial_filename}.webm"):
+                logging.error(f"Trial encode '{trial_filename}' failed")
+                continue
+
+            size += os.path.getsize(f"{trial_filename}.webm")
+            sampled_duration += length
+            if self.quality_floor is not None:
+                ssim = await self.get_ssim(start, length, trial_filename)
+                if ssim is not None:
+                    ssims.append(ssim)
+
+            os.remove(f"{trial_filename}.webm")
+
+        prediction = {
+            "size": (
+                round(
+                    size * self.correction * self.seek.get_duration() / sampled_duration
+                )
+                + self.encode_webm.get_audio_size()
+                if sampled_duration
+                else None
+            ),
+            "ssim": sum(ssims) / len(ssims) if ssims else None,
+            "limit_size": int(
+                self.encode_webm.get_limit_file_size(video_filters=video_filters)
+            ),
+        }
+
+        logging.debug(
+            f"[TrialPredictor.predict] crf: '{crf}', "
+            f"filter_name: '{filter_name}', "
+            f"size: '{prediction['size']}', "
+            f"ssim: '{prediction['ssim']}', "
+            f"limit_size: '{prediction['limit_size']}'"
+        )
+
+        return prediction
+
+    # Whether a rung is predicted to fit the size limit and meet the quality floor
+    def is_selected(self, prediction) -> bool:
+        if prediction["size"] is None or prediction["size"] > prediction["limit_size"]:
+            return False
+
+        if self.quality_floor is not None and prediction["ssim"] is not None:
+            return prediction["ssim"] >= self.quality_floor
+
+        return True
+
+    # CRF rungs with the video filters to encode in full
+    # A filter with no selected rung keeps the lowest CRF predicted to fit, or else the highest CRF
+    def get_rungs(self, encoding_mode, crfs, video_filters) -> list[tuple]:
+        # Trials cost more than they save on seeks that are not much longer than the samples
+        if self.seek.get_duration() < 2 * len(self.windows) * self.sample_length:
+            return [(crf, video_filters) for crf in crfs]
+
+        rungs = [
+            (crf, filter_name, filter_value)
+            for crf in crfs
+            for filter_name, filter_value in video_filters
+        ]
+
+        correction = self.get_correction(
+            encoding_mode, crfs[len(crfs) // 2], video_filters[0][1]
+        )
+        if correction is None:
+            logging.warning(
+                "Trial sizes are uncorrected, single-pass trials usually differ in size from two-pass encodes"
+            )
+        else:
+            self.correction = correction
+            logging.info(
+                f"Trial sizes are corrected by a factor of {self.correction:.2f} measured against a two-pass encode"
+            )
+
+        logging.info(f"Encoding {len(rungs) * len(self.windows)} trial samples...")
+
+        # Trials encode with two threads, so rungs are predicted by half as many as our CPUs at a time
+        async def predict_all():
+            semaphore = asyncio.Semaphore(max(1, (os.cpu_count() or 2) // 2))
+
+            async def predict(rung):
+                async with semaphore:
+                    return await self.predict(encoding_mode, *rung)
+
+            return await asyncio.gather(*(predict(rung) for rung in rungs))
+
+        predictions = process_runner.run_coroutine(predict_all())
+
+        selected = {
+            (crf, filter_name)
+            for (crf, filter_name, _), prediction in zip(rungs, predictions)
+            if self.is_selected(prediction)
+        }
+
+        for filter_name, _ in video_filters:
+            if any(name == filter_name for _, name in selected):
+                continue
+
+            fitting_crfs = [
+                crf
+                for (crf, name, _), prediction in zip(rungs, predictions)
+                if name == filter_name
+                and prediction["size"] is not None
+                and prediction["size"] <= prediction["limit_size"]
+            ]
+            fallback_crf = (
+                min(fitting_crfs, key=int) if fitting_crfs else max(crfs, key=int)
+            )
+            selected.add((fallback_crf, filter_name))
+
+        logging.info(f"Trial encodes selected {len(selected)} of {len(rungs)} rungs")
+
+        return [
+            (
+                crf,
+                [
+                    (filter_name, filter_value)
+                    for filter_name, filter_value in video_filters
+                    if (crf, filter_name) in selected
+                ],
+            )
+            for crf in crfs
+            if any((crf, filter_name) in selected for filter_name, _ in video_filters)
+        ]
@@ -8,6 +8,17 @@ class Args(NamedTuple):
     file: str
     configfile: str
     inputfile: str
+    daemon: bool
+    submit: bool
+    status: bool
+    watch: list[str]
+    priority: list[str]
+    workers: int
+    locate: bool
+    export: str
+    job: str
+    calibrate: bool
+    trace: str
     loglevel: str
 
 
@@ -22,6 +33,41 @@ class EncodingConfigType(NamedTuple):
     alternate_source_files: bool
     create_preview: bool
     include_unfiltered: bool
+    shared_audio_enable: bool
+    complexity_probe_enable: bool
+    target_file_size: str
+    crf_search_tolerance: float
+    proxy_preview_enable: bool
+    trial_encode_enable: bool
+    trial_quality_floor: str
+    deferred_loudnorm_enable: bool
+    workers: int
+    daemon_port: int
+    watch_interval: int
+    watch_settle_time: int
+    process_priority_enable: bool
+    max_load_average: str
+    min_available_memory: str
+    max_io_pressure: str
+    memory_budget: str
+    multi_output_enable: bool
+    metrics_file: str
+    verify_enable: bool
+    verify_retries: int
+    job_retries: int
+    retry_backoff: int
+    stall_timeout: int
+    scratch_directory: str
+    passlog_directory: str
+    min_free_space: int
+    source_cache_directory: str
+    source_cache_size: int
+    locator_min_confidence: float
+    source_analysis_enable: bool
+    host_profile_enable: bool
+    max_processes: int
+    probe_timeout: int
+    intermediate_directory: str
     video_filters: Dict[str, str]
     default_video_stream: str
     default_audio_stream: str
@@ -39,3 +39,12 @@ def configfile_arg_type(arg_value):
             f"Config File '{arg_value}' must use '.ini' file extension"
         )
     return arg_value
+
+
+# Convert seconds to a position, the inverse of string_to_seconds
+def seconds_to_string(seconds):
+    minutes, seconds = divmod(round(seconds, 3), 60)
+    hours, minutes = divmod(int(minutes), 60)
+    if hours > 0:
+        return f"{hours}:{minutes:02d}:{seconds:06.3f}"
+    return f"{minutes}:{seconds:06.3f}"
@@ -0,0 +1,188 @@
+from ._daemon import Daemon
+from ._plan import Plan
+from ._plan_generator import PlanGenerator
+
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+
+
+# Watch drop directories for source files and enqueue their plans once they have finished copying
+# A source file is ingested with the seeks of its sidecar manifest '[File Name].json',
+# and its plan is written to '[File Name]-commands.txt' so that it is only ingested once
+class Watcher:
+    def __init__(
+        self, directories, encoding_config, scheduler=None, port=None, token_file=None
+    ):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.encoding_config = encoding_config
+        self.scheduler = scheduler
+        self.port = port
+        self.token_file = token_file
+        self.candidates = {}
+        self.failed = {}
+        self.generators = {}
+        self.stopped = threading.Event()
+
+    @staticmethod
+    def get_manifest_file(file) -> str:
+        return os.path.splitext(file)[0] + ".json"
+
+    @staticmethod
+    def get_plan_file(file) -> str:
+        return os.path.splitext(file)[0] + "-commands.txt"
+
+    # Size and modification time of the source file and its manifest
+    @staticmethod
+    def get_signature(file) -> tuple:
+        file_stat = os.stat(file)
+        manifest_file = Watcher.get_manifest_file(file)
+        manifest_stat = (
+            os.stat(manifest_file).st_mtime_ns
+            if os.path.isfile(manifest_file)
+            else None
+        )
+
+        return (file_stat.st_size, file_stat.st_mtime_ns, manifest_stat)
+
+    # Source files that have not changed for the settle time and are not ingested yet
+    def poll(self) -> list[str]:
+        stable_files = []
+        now = time.monotonic()
+
+        for directory in self.directories:
+            # Unmounted or deleted directories are skipped until they are back
+            try:
+                names = sorted(os.listdir(directory))
+            except OSError as e:
+                logging.error(f"Could not watch '{directory}': {e}")
+                continue
+
+            for name in names:
+                file = os.path.join(directory, name)
+                if not name.endswith(tuple(self.encoding_config.allowed_filetypes)):
+                    continue
+
+                if os.path.isfile(Watcher.get_plan_file(file)):
+                    continue
+
+                try:
+                    signature = Watcher.get_signature(file)
+                except OSError:
+                    continue
+
+                # Files still being copied keep changing size or modification time
+                previous = self.candidates.get(file)
+                if previous is None or previous[0] != signature:
+                    self.candidates[file] = (signature, now)
+                    continue
+
+                if now - previous[1] < self.encoding_config.watch_settle_time:
+                    continue
+
+                if self.failed.get(file) == signature:
+                    continue
+
+                if signature[2] is None:
+                    logging.info(f"Waiting for manifest of '{file}'")
+                    self.failed[file] = signature
+                    continue
+
+                stable_files.append(file)
+
+        return stable_files
+
+    # Source files of a directory share a generator, so that output names are unique within the directory
+    # The output names of the manifests of files ingested by earlier runs are taken as well
+    def get_generator(self, directory) -> PlanGenerator:
+        if directory in self.generators:
+            return self.generators[directory]
+
+        generator = PlanGenerator(self.encoding_config)
+        for name in os.listdir(directory):
+            file = os.path.join(directory, name)
+            if not name.endswith(
+                tuple(self.encoding_config.allowed_filetypes)
+            ) or not os.path.isfile(Watcher.get_plan_file(file)):
+                continue
+
+            try:
+                with open(Watcher.get_manifest_file(file), encoding="utf8") as f:
+                    manifest = json.load(f)
+                generator.all_output_names.update(
+                    seek["output_name"].strip() for seek in manifest["seeks"]
+                )
+            except (KeyError, ValueError, OSError):
+                continue
+
+        self.generators[directory] = generator
+        return generator
+
+    # Generate the plan of a source file from its manifest and enqueue it
+    def ingest(self, file) -> bool:
+        directory = os.path.dirname(file)
+        plan_file = Watcher.get_plan_file(file)
+        taken_output_names = None
+        try:
+            with open(Watcher.get_manifest_file(file), encoding="utf8") as f:
+                manifest = json.load(f)
+
+            generator = self.get_generator(directory)
+            taken_output_names = set(generator.all_output_names)
+            source_file = generator.get_source_file(
+                file,
+                video_stream=manifest.get("video_stream"),
+                audio_stream=manifest.get("audio_stream"),
+            )
+            jobs = generator.get_jobs(source_file, manifest["seeks"])
+            Plan.write(plan_file, jobs)
+
+            priority = int(manifest.get("priority", 0))
+            if self.scheduler is not None:
+                self.scheduler.submit(jobs, priority=priority, cwd=directory)
+            else:
+                response = Daemon.request(
+                    self.port,
+                    self.token_file,
+                    "/plans",
+                    {"file": plan_file, "cwd": directory, "priority": priority},
+                )
+                if "error" in response:
+                    raise ValueError(response["error"])
+        except (
+            KeyError,
+            ValueError,
+            OSError,
+            subprocess.CalledProcessError,
+        ) as e:
+            logging.error(f"Could not ingest '{file}': {e}")
+            self.failed[file] = self.candidates[file][0]
+
+            # The output names of a failed ingest are free for its next attempt
+            if taken_output_names is not None:
+                generator.all_output_names.intersection_update(taken_output_names)
+
+            # Without its plan file the source file is ingested again once its manifest changes
+            if os.path.isfile(plan_file):
+                os.remove(plan_file)
+
+            return False
+
+        logging.info(f"Ingested '{file}' with {len(jobs)} jobs")
+
+        return True
+
+    def run(self) -> None:
+        logging.info(f"Watching {', '.join(self.directories)}")
+
+        while not self.stopped.is_set():
+            for file in self.poll():
+                self.ingest(file)
+
+            self.stopped.wait(self.encoding_config.watch_interval)
+
+    def stop(self) -> None:
+        self.stopped.set()
@@ -0,0 +1,141 @@
+from ._job import Job
+from ._job_type import JobType
+
+import logging
+import os
+import re
+import shutil
+import tempfile
+
+
+# Scratch directories of the batches of our scheduler and disk space admission of their jobs
+# Passlogs of a batch are placed in a private directory under the passlog directory (such as a tmpfs),
+# and the shared audio and video-only encodes in a private directory under the intermediate directory (such as an SSD),
+# which are removed once the batch has finished or the scheduler stops
+class Workspace:
+    # Space reserved for the passlog of a first pass, in bytes
+    passlog_size = 16 * 2**20
+
+    # Size limits of the outputs of encodes
+    file_size_pattern = re.compile(r"-fs (\d+)")
+
+    def __init__(
+        self, passlog_directory=None, min_free_space=0, intermediate_directory=None
+    ):
+        self.passlog_directory = passlog_directory
+        self.min_free_space = min_free_space
+        self.intermediate_directory = intermediate_directory
+        self.batch_dirs = {}
+
+    # Blank directories are disabled, free space is configured in MiB
+    @classmethod
+    def from_config(cls, encoding_config):
+        return cls(
+            encoding_config.passlog_directory or None,
+            encoding_config.min_free_space * 2**20,
+            encoding_config.intermediate_directory or None,
+        )
+
+    # Passlog and intermediate directories of the batch, None for disabled directories
+    def create(self, batch) -> tuple[str | None, str | None]:
+        batch_dirs = []
+        for directory in [self.passlog_directory, self.intermediate_directory]:
+            if directory is None:
+                batch_dirs.append(None)
+                continue
+
+            os.makedirs(directory, exist_ok=True)
+            batch_dirs.append(
+                tempfile.mkdtemp(prefix=f"batch_encoder-{batch}-", dir=directory)
+            )
+        self.batch_dirs[batch] = batch_dirs
+
+        logging.debug(
+            f"[Workspace.create] batch: '{batch}', batch_dirs: '{batch_dirs}'"
+        )
+
+        return batch_dirs[0], batch_dirs[1]
+
+    def remove(self, batch) -> None:
+        for batch_dir in self.batch_dirs.pop(batch, []):
+            if batch_dir is not None:
+                shutil.rmtree(batch_dir, ignore_errors=True)
+
+    def remove_all(self) -> None:
+        for batch in list(self.batch_dirs):
+            self.remove(batch)
+
+    # Bytes written by the job to its working directory, its passlog directory and its intermediate directory
+    # Verifications with retries write the outputs of their second passes
+    @staticmethod
+    def get_sizes(job) -> tuple[int, int, int]:
+        output_size = sum(
+            int(file_size)
+            for command in [job.command] + job.options.get("retry_commands", [])
+            for file_size in Workspace.file_size_pattern.findall(command or "")
+        )
+
+        # Video-only encodes of the shared audio are written to the intermediate directory
+        intermediate_size = 0
+        if job.intermediate_dir is not None:
+            if job.job_type == JobType.SECOND_PASS and Job.intermediate_pattern.search(
+                job.command
+            ):
+                intermediate_size, output_size = output_size, 0
+            if job.job_type == JobType.CRF_SEARCH and Job.intermediate_pattern.search(
+                job.options["output"]
+            ):
+                intermediate_size = (
+                    job.options["limit_size"] or job.options["target_size"]
+                )
+
+        if job.job_type == JobType.CRF_SEARCH:
+            output_size = job.options["limit_size"] or job.options["target_size"]
+
+        scratch_size = 0
+        if job.job_type == JobType.FIRST_PASS:
+            scratch_size = Workspace.passlog_size * job.options.get("outputs", 1)
+
+        return output_size, scratch_size, intermediate_size
+
+    @staticmethod
+    def get_free_space(path) -> int | None:
+        try:
+            return shutil.disk_usage(path).free
+        except OSError:
+            return None
+
+    # Whether the job fits in the free space of its directories next to the space reserved by running jobs
+    def fits(self, job, running) -> bool:
+        output_size, scratch_size, intermediate_size = Workspace.get_sizes(job)
+        reserved_output_size = sum(Workspace.get_sizes(other)[0] for other in running)
+        reserved_scratch_size = sum(Workspace.get_sizes(other)[1] for other in running)
+        reserved_intermediate_size = sum(
+            Workspace.get_sizes(other)[2] for other in running
+        )
+
+        free_space = Workspace.get_free_space(job.cwd or ".")
+        if (
+            free_space is not None
+            and free_space - reserved_output_size - output_size < self.min_free_space
+        ):
+            return False
+
+        if job.passlog_dir is not None and scratch_size > 0:
+            free_space = Workspace.get_free_space(job.passlog_dir)
+            if (
+                free_space is not None
+                and free_space - reserved_scratch_size < scratch_size
+            ):
+                return False
+
+        if job.intermediate_dir is not None and intermediate_size > 0:
+            free_space = Workspace.get_free_space(job.intermediate_dir)
+            if (
+                free_space is not None
+                and free_space - reserved_intermediate_size - intermediate_size
+                < self.min_free_space
+            ):
+                return False
+
+        return True
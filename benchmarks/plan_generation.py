@@ -0,0 +1,92 @@
+# Time and peak memory of plan generation from 10 to 10,000 seeks
+# Plans are generated from synthetic source files, so FFmpeg is not needed
+# Usage: python benchmarks/plan_generation.py [--seeks 10 100 1000 10000] [--seeks-per-source 10]
+
+from batch_encoder import PlanGenerator, SourceFile, SourceMetadata
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+
+# Metadata of a 24-minute 1080p episode with a stereo audio stream
+def get_source_file(index) -> SourceFile:
+    return SourceFile(
+        f"episode-{index}.mkv",
+        SourceMetadata(
+            1440.0,
+            1,
+            1,
+            width=1920,
+            height=1080,
+            color_space="bt709",
+            audio_bit_rate=320000,
+        ),
+        0,
+        0,
+    )
+
+
+# Source files and their seeks, created as the generator consumes them
+def get_sources(seek_count, seeks_per_source):
+    for index in range(0, seek_count, seeks_per_source):
+        yield (
+            get_source_file(index),
+            [
+                {
+                    "ss": f"{i * 2}:00",
+                    "to": f"{i * 2 + 1}:30",
+                    "output_name": f"Episode{index}-OP{i}",
+                }
+                for i in range(min(seeks_per_source, seek_count - index))
+            ],
+        )
+
+
+def measure(seek_count, seeks_per_source, plan_file, stream) -> tuple:
+    generator = PlanGenerator()
+
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    if stream:
+        job_count = generator.write(
+            plan_file, get_sources(seek_count, seeks_per_source)
+        )
+    else:
+        job_count = len(
+            generator.generate(dict(get_sources(seek_count, seeks_per_source)))
+        )
+    elapsed_time = time.perf_counter() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return job_count, elapsed_time, peak_memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seeks", nargs="+", type=int, default=[10, 100, 1000, 10000])
+    parser.add_argument("--seeks-per-source", type=int, default=10)
+    args = parser.parse_args()
+
+    print(
+        f"{'seeks':>8} {'mode':>8} {'jobs':>8} {'time (s)':>10} {'ms/seek':>8} {'peak (MiB)':>11}"
+    )
+    with tempfile.TemporaryDirectory() as temp_dir:
+        plan_file = os.path.join(temp_dir, "commands.txt")
+        for seek_count in args.seeks:
+            for stream in [True, False]:
+                job_count, elapsed_time, peak_memory = measure(
+                    seek_count, args.seeks_per_source, plan_file, stream
+                )
+                print(
+                    f"{seek_count:>8} {'stream' if stream else 'list':>8} {job_count:>8} "
+                    f"{elapsed_time:>10.2f} {elapsed_time * 1000 / seek_count:>8.2f} "
+                    f"{peak_memory / 2**20:>11.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
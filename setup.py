@@ -25,4 +25,5 @@ setup(
     ],
     python_requires=">=3.14",
     install_requires=["appdirs", "inquirer"],
+    extras_require={"locator": ["numpy"]},
 )